@@ -1,13 +1,23 @@
 import streamlit as st
-import requests
-import concurrent.futures
-import time
+import asyncio
+import itertools
+import os
 import re
+import tempfile
+import uuid
+from contextlib import ExitStack, nullcontext
 import pandas as pd
-import random
-import io
-import json
 from datetime import datetime
+from netrunner import CONNECT_TIMEOUT, DEFAULT_CONCURRENCY, DEFAULT_TARGETS, JUDGE_URL, TARGET_TIMEOUT, HealthStore, JudgePool, MatrixTable, ProgressReporter, ResultTable, default_resolver, format_eta, get_real_ip, iter_lines, iter_proxies, merge_sources, run_pipeline
+from netrunner.checkpoint import CHECKPOINT_DIR, ScanLog, queue_line
+from netrunner.dedup import AddressSet, address_key
+from netrunner.export import EXPORT_FORMATS, mime_type, write_export
+from netrunner.gateway import GATEWAY_PORT, Gateway, GatewayThread
+from netrunner.metrics import ScanMetrics, profile_report, profiled
+from netrunner.rank import ProxyRanking
+from netrunner.shard import run_sharded
+from netrunner.throttle import SUBNET_RATE, TARGET_RATE, RateControl
+from netrunner.views import ALL_ISPS, iter_records, views_for
 
 # --- FAILSAFE IMPORT ---
 try:
@@ -16,6 +26,13 @@ try:
 except ImportError:
     PLOTLY_AVAILABLE = False
 
+# --- FAILSAFE IMPORT ---
+try:
+    from streamlit.runtime.scriptrunner import RerunException, StopException
+    SCRIPT_INTERRUPTS = (RerunException, StopException)
+except ImportError:
+    SCRIPT_INTERRUPTS = ()
+
 # --- CONFIGURATION ---
 st.set_page_config(
     page_title="NETRUNNER_V5.1 | RAKIB",
@@ -166,108 +183,105 @@ st.markdown("""
 
 # --- SESSION STATE ---
 if 'proxy_text' not in st.session_state: st.session_state.proxy_text = ""
-if 'results' not in st.session_state: st.session_state.results = []
+if 'results' not in st.session_state: st.session_state.results = ResultTable()
 if 'check_done' not in st.session_state: st.session_state.check_done = False
-if 'ftp_results' not in st.session_state: st.session_state.ftp_results = []
+if 'ftp_results' not in st.session_state: st.session_state.ftp_results = MatrixTable()
 if 'logs' not in st.session_state: st.session_state.logs = []
 if 'stop_scan' not in st.session_state: st.session_state.stop_scan = False
-
-# --- CONSTANTS ---
-DEFAULT_TARGETS = """http://10.16.100.244/
-http://172.16.50.4/
-http://new.circleftp.net/
-http://ftp.samonline.net/"""
-
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0"
-]
+if 'scan_version' not in st.session_state: st.session_state.scan_version = 0
+if 'exports' not in st.session_state: st.session_state.exports = {}
+# Export files live here; the directory's finalizer deletes it when Streamlit drops the session
+if 'export_dir' not in st.session_state: st.session_state.export_dir = tempfile.TemporaryDirectory(prefix="netrunner_")
+if 'scan_metrics' not in st.session_state: st.session_state.scan_metrics = None
+if 'scan_profile' not in st.session_state: st.session_state.scan_profile = ""
+if 'gateway' not in st.session_state: st.session_state.gateway = None
+if 'scan_id' not in st.session_state:
+    # Each browser session checkpoints into its own dir, keyed in the URL so a reload can still RESUME
+    sid = st.query_params.get("scan", "")
+    st.session_state.scan_id = sid if re.fullmatch(r"[0-9a-f]{12}", sid) else uuid.uuid4().hex[:12]
+if st.query_params.get("scan") != st.session_state.scan_id: st.query_params["scan"] = st.session_state.scan_id
+
+PAGE_SIZE = 500
+RANK_COLUMNS = ["Full_Address", "Protocol", "Anonymity", "ISP", "Score", "P50_ms", "P90_ms", "Jitter_ms", "Loss_pct", "Latency"]
 
 # --- FUNCTIONS ---
 def log_event(message):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    st.session_state.logs.append(f"[{timestamp}] {message}")
-    if len(st.session_state.logs) > 60:
-        st.session_state.logs.pop(0)
-
-def get_real_ip():
-    try: return requests.get("https://api.ipify.org", timeout=3).text.strip()
-    except: return "Unknown"
-
-def check_proxy_basic(proxy_data, timeout, real_ip):
-    ip, port, protocol = proxy_data['ip'], proxy_data['port'], proxy_data['protocol']
-    proxy_conf = {
-        "http": f"{protocol}://{ip}:{port}",
-        "https": f"{protocol}://{ip}:{port}",
-    }
-    headers = {'User-Agent': random.choice(USER_AGENTS)}
-    result = {
-        "IP": ip, "Port": port, "Protocol": protocol.upper(),
-        "Country": "-", "ISP": "Unknown", "Latency": 99999, "Status": "Dead", 
-        "Full_Address": f"{ip}:{port}", "Anonymity": "Unknown"
-    }
-    try:
-        start = time.time()
-        resp = requests.get("http://httpbin.org/get", proxies=proxy_conf, headers=headers, timeout=timeout)
-        latency = round((time.time() - start) * 1000)
-        
-        if resp.status_code == 200:
-            result['Latency'] = latency
-            result['Status'] = "Working"
-            
-            # ANONYMITY
-            try:
-                json_data = resp.json()
-                origin = json_data.get('origin', '').split(',')[0].strip()
-                if origin != real_ip and origin != "Unknown":
-                    result['Anonymity'] = "🛡️ ELITE"
-                else:
-                    result['Anonymity'] = "⚠️ TRANSPARENT"
-            except:
-                result['Anonymity'] = "❓ UNKNOWN"
+    log_events([message])
 
-            # GEO
-            try:
-                geo = requests.get(f"http://ip-api.com/json/{ip}", timeout=2).json()
-                if geo['status'] == 'success': 
-                    result['Country'] = geo['countryCode']
-                    result['ISP'] = geo['isp']
-            except: pass
-    except: pass
-    return result
-
-def check_specific_target(proxy_data, target_urls, timeout):
-    ip = proxy_data.get('IP') or proxy_data.get('ip')
-    port = proxy_data.get('Port') or proxy_data.get('port')
-    protocol = proxy_data.get('Protocol') or proxy_data.get('protocol')
-    protocol_lower = protocol.lower()
-
-    proxy_conf = {
-        "http": f"{protocol_lower}://{ip}:{port}",
-        "https": f"{protocol_lower}://{ip}:{port}",
-    }
-    headers = {'User-Agent': random.choice(USER_AGENTS)}
-    
-    proxy_result = {
-        "Proxy": f"{ip}:{port}", 
-        "Type": protocol.upper(), 
-        "Raw_IP": f"{ip}:{port}"
-    }
-    
-    for url in target_urls:
-        url = url.strip()
-        if not url: continue
-        try:
-            resp = requests.get(url, proxies=proxy_conf, headers=headers, timeout=5) 
-            if resp.status_code == 200: proxy_result[url] = "ACCESS_GRANTED"
-            elif resp.status_code == 403: proxy_result[url] = "FORBIDDEN"
-            elif resp.status_code == 404: proxy_result[url] = "NOT_FOUND"
-            else: proxy_result[url] = f"ERR_{resp.status_code}"
-        except:
-            proxy_result[url] = "TIMEOUT"
-            
-    return proxy_result
+def log_events(messages):
+    if not messages: return
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    st.session_state.logs.extend(f"[{timestamp}] {m}" for m in messages)
+    del st.session_state.logs[:-60]
+
+def input_records(spec, store):
+    # The scan's record stream from the kept input copies (also how a resume rebuilds it)
+    with ExitStack() as stack:
+        sources = [iter_lines(stack.enter_context(open(path, "rb"))) for path in spec["files"]]
+        yield from merge_sources(sources, spec["protocol"], store.history() if spec["history"] else ())
+
+def build_charts(df_ok):
+    fig = px.scatter_geo(
+        df_ok, locations="Country", locationmode='ISO-3', hover_name="ISP",
+        size="Latency", projection="orthographic", color="Protocol",
+        color_discrete_map={"HTTP": "#00f3ff", "SOCKS4": "#bc13fe", "SOCKS5": "#0aff0a"}
+    )
+    fig.update_layout(
+        font=dict(family="Orbitron", color="#00f3ff"),
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
+        margin=dict(l=0,r=0,t=0,b=0),
+        geo=dict(bgcolor="rgba(0,0,0,0)", showland=True, landcolor="#0a0f14", oceancolor="#050505", showcountries=True, countrycolor="#333")
+    )
+    pc = df_ok['Protocol'].value_counts().reset_index()
+    pc.columns = ['Protocol', 'Count']
+    fig_p = px.pie(pc, values='Count', names='Protocol', hole=0.5, color_discrete_sequence=['#00f3ff', '#bc13fe', '#0aff0a'])
+    fig_p.update_layout(title="PROTOCOLS", title_font_family="Orbitron", paper_bgcolor="rgba(0,0,0,0)", font_color="#ccc")
+    fig_h = px.histogram(df_ok, x="Latency", nbins=20, color_discrete_sequence=['#bc13fe'])
+    fig_h.update_layout(title="LATENCY (ms)", title_font_family="Orbitron", paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0.3)", font_color="#ccc")
+    return fig, fig_p, fig_h
+
+def paginate(df, key, size=PAGE_SIZE):
+    """Server-side paging: only one page of ``df`` is ever sent to the browser."""
+    pages = max(1, -(-len(df) // size))
+    if pages == 1: return df, 0
+    # Widget key includes the page count so a narrower filter resets to page 1
+    page = st.number_input(f"PAGE (OF {pages}, {len(df)} ROWS)", 1, pages, 1, key=f"{key}_{pages}")
+    start = (page - 1) * size
+    return df.iloc[start:start + size], start
+
+def drop_exports():
+    """Delete the prepared export files (a new scan makes them stale)."""
+    for _, path in st.session_state.exports.values():
+        if os.path.exists(path): os.remove(path)
+    st.session_state.exports.clear()
+
+def export_panel(df, fields, key, variant, default="csv"):
+    """Stream ``df`` to a file in the session's export dir on request, then offer it for download."""
+    c1, c2, c3 = st.columns([1, 1, 2])
+    with c1:
+        fmt = st.selectbox("EXPORT_FORMAT", EXPORT_FORMATS, EXPORT_FORMATS.index(default), key=f"{key}_fmt", label_visibility="collapsed")
+    export_key = (st.session_state.scan_version, variant, fmt)
+    with c2:
+        if st.button("⚙ PREPARE_EXPORT", key=f"{key}_prep", use_container_width=True):
+            old = st.session_state.exports.pop(key, None)
+            if old and os.path.exists(old[1]): os.remove(old[1])
+            path = os.path.join(st.session_state.export_dir.name, f"{key}.{fmt}")
+            # A text export is a plain proxy list, whatever columns the view shows (as in the CLI)
+            with open(path, "wb") as fh:
+                write_export(iter_records(df), ["Full_Address"] if fmt.startswith("txt") else fields, fh, fmt)
+            st.session_state.exports[key] = (export_key, path)
+    done = st.session_state.exports.get(key)
+    if done and done[0] == export_key:
+        with c3, open(done[1], "rb") as fh:
+            st.download_button(f"⬇ DOWNLOAD_{fmt.upper()} ({os.path.getsize(done[1]) // 1024} KB)", fh,
+                               f"NETRUNNER_{key.upper()}_{datetime.now().strftime('%M%S')}.{fmt}", mime_type(fmt), key=f"{key}_dl")
+
+def color_m(val):
+    s = str(val)
+    if 'ACCESS' in s: return 'color:#0f0; font-weight:bold; background:rgba(0,255,0,0.1)'
+    if 'FORBID' in s: return 'color:#fa0'
+    if 'TIME' in s: return 'color:#666'
+    return ''
 
 # --- SIDEBAR ---
 with st.sidebar:
@@ -275,9 +289,20 @@ with st.sidebar:
     st.caption("Developed by <span class='rakib-brand'>RAKIB</span>", unsafe_allow_html=True)
     st.markdown("---")
     
-    threads = st.slider("THREAD_COUNT", 5, 50, 25)
+    concurrency = st.slider("CONCURRENCY", 50, 5000, DEFAULT_CONCURRENCY, step=50)
+    workers = st.number_input("WORKER_PROCESSES", 1, os.cpu_count() or 1, 1, help="Shard the list across processes; concurrency and rate limits are split between them")
+    adaptive = st.toggle("ADAPTIVE_CONCURRENCY", value=True, help="Treat CONCURRENCY as a ceiling: ramp up while timeouts/latency hold, back off when they climb")
+    target_rate = st.slider("TARGET_RATE (REQ/S PER HOST)", 0, 200, int(TARGET_RATE), step=5, help="Paces matrix requests to each target so a throttling one doesn't turn into false TIMEOUTs (0 = unlimited, the default)")
+    subnet_rate = st.slider("SUBNET_RATE (CHECKS/S PER /24)", 0, 500, int(SUBNET_RATE), step=10, help="0 = unlimited")
     timeout = st.slider("TIMEOUT_SEC", 1, 15, 6)
-    force_proto = st.selectbox("FORCE_PROTOCOL", ["AUTO", "http", "socks4", "socks5"])
+    connect_timeout = st.slider("CONNECT_TIMEOUT_SEC", 0.5, 5.0, CONNECT_TIMEOUT, step=0.5, help="Fast-fail budget for the TCP connect; SOCKS/CONNECT handshakes get twice this")
+    samples = st.slider("LATENCY_SAMPLES", 0, 10, 0, help="Time each live node this many more times over a warm connection; latency filter and ranking then use the median (0 = single cold sample)")
+    force_proto = st.selectbox("FORCE_PROTOCOL", ["AUTO", "http", "socks4", "socks5"], help="AUTO fingerprints unlabeled nodes (SOCKS5/SOCKS4/HTTP)")
+    judge_text = st.text_area("JUDGE_URLS", JUDGE_URL, height=68, help="One per line, rotated round-robin. Self-host with: python -m netrunner --serve-judge 8899")
+    geo_db = st.text_input("GEO_DB_PATH", "", placeholder="optional .mmdb / range .csv")
+    incremental = st.toggle("INCREMENTAL_SCAN", help="Skip nodes checked recently; retry dead nodes with backoff")
+    fresh_hours = st.slider("FRESH_HOURS", 1, 72, 6, disabled=not incremental)
+    profile_scan = st.toggle("PROFILE_SCAN", help="Run the scan under cProfile (roughly halves throughput) and list the hottest calls under SCAN_TELEMETRY")
     
     st.markdown("---")
     if st.button("🚨 EMERGENCY STOP", use_container_width=True):
@@ -304,11 +329,13 @@ tab_in1, tab_in2 = st.tabs(["📄 NODE_LIST", "🎯 TARGET_VECTORS"])
 
 with tab_in1:
     in_method = st.radio("INPUT_METHOD", ["MANUAL", "FILE_UPLOAD"], horizontal=True, label_visibility="collapsed")
+    up_files = []
     if in_method == "FILE_UPLOAD":
-        up_file = st.file_uploader("UPLOAD .TXT/.CSV", type=['txt', 'csv'], label_visibility="collapsed")
-        if up_file:
-            st.session_state.proxy_text = io.StringIO(up_file.getvalue().decode("utf-8")).read()
-            st.success(f"FILE_LOADED: {len(st.session_state.proxy_text.splitlines())} LINES")
+        up_files = st.file_uploader("UPLOAD .TXT/.CSV", type=['txt', 'csv'], accept_multiple_files=True, label_visibility="collapsed")
+        if up_files:
+            # Uploads are streamed straight into the parser at scan time, never decoded whole
+            line_count = sum(f.getvalue().count(b"\n") + 1 for f in up_files)
+            st.success(f"FILES_LOADED: {len(up_files)} / {line_count} LINES (MERGED + DEDUPLICATED AT SCAN TIME)")
     else:
         st.session_state.proxy_text = st.text_area("MANUAL", st.session_state.proxy_text, height=150, placeholder="Paste data (Column or Table format)", label_visibility="collapsed")
 
@@ -316,124 +343,168 @@ with tab_in1:
     with bc1:
         if st.button("🗑️ PURGE", use_container_width=True):
             st.session_state.proxy_text = ""
-            st.session_state.results = []
-            st.session_state.ftp_results = []
+            st.session_state.results = ResultTable()
+            st.session_state.ftp_results = MatrixTable()
             st.session_state.check_done = False
             st.session_state.logs = []
+            st.session_state.scan_version += 1
+            drop_exports()
             st.rerun()
     with bc2:
         if st.button("🧹 DEFRAG", use_container_width=True):
-            raw = st.session_state.proxy_text.strip().split('\n')
-            unique = sorted(list(set([l.strip() for l in raw if l.strip()])))
-            st.session_state.proxy_text = "\n".join(unique)
+            # Canonical addresses, deduplicated on their packed key and sorted numerically
+            seen = AddressSet()
+            nodes = sorted(iter_proxies(st.session_state.proxy_text.split('\n'), seen=seen), key=lambda r: address_key(r.ip, r.port))
+            st.session_state.proxy_text = "".join(queue_line(r) for r in nodes).rstrip("\n")
+            log_event(f"DEFRAG: {len(nodes)} NODES / {seen.duplicates} DUPLICATES DROPPED")
             st.rerun()
+    with bc3:
+        merge_history = st.toggle("MERGE_HISTORY", help="Also queue the nodes in the health store; anything the input already lists is skipped")
 
 with tab_in2:
     st.caption("CONNECTION_ENDPOINTS:")
     target_text = st.text_area("TARGETS", DEFAULT_TARGETS, height=150, label_visibility="collapsed")
+    must_have = st.multiselect("MUST_HAVE (EARLY EXIT)", [t.strip() for t in target_text.split('\n') if t.strip()],
+                               help="Close a node's matrix row once these targets answered; the rest are SKIPPED")
 st.markdown('</div>', unsafe_allow_html=True)
 
 # --- EXECUTION ---
+scan_log = ScanLog(os.path.join(CHECKPOINT_DIR, f"ui-{st.session_state.scan_id}"))
 col_act1, col_act2 = st.columns([1, 4])
+with col_act1:
+    resume = scan_log.exists() and st.button("⏯ RESUME", use_container_width=True, help="Continue an interrupted scan (stop, disconnect or restart) from its checkpoint log")
 with col_act2:
-    if st.button("▶ INITIATE_SCAN_SEQUENCE", type="primary", use_container_width=True):
+    launch = st.button("▶ INITIATE_SCAN_SEQUENCE", type="primary", use_container_width=True) or resume
+    if launch and not scan_log.lock():
+        st.error("CHECKPOINT BUSY: THIS SESSION'S SCAN IS ALREADY RUNNING IN ANOTHER TAB.")
+    elif launch:
         st.session_state.stop_scan = False
-        st.session_state.results = []
-        st.session_state.ftp_results = []
-        st.session_state.check_done = False
-        st.session_state.logs = []
-        
-        # --- ENHANCED PARSING LOGIC ---
-        lines = st.session_state.proxy_text.strip().split('\n')
-        proxies_to_check = []
-        seen = set()
-        
-        for line in lines:
-            line = line.strip()
-            if not line: continue
-            
-            parsed_ip, parsed_port, parsed_proto = None, None, None
-            
-            # STRATEGY 1: Tab/Space Separated (e.g., "1.1.1.1 8080 SOCKS5")
-            parts = re.split(r'\s+', line)
-            # Check if Part 0 is IP and Part 1 is Port
-            if len(parts) >= 2 and re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", parts[0]) and parts[1].isdigit():
-                parsed_ip = parts[0]
-                parsed_port = parts[1]
-                # Try to find protocol in the rest
-                if len(parts) >= 3:
-                    potential = parts[2].lower()
-                    if "socks5" in potential: parsed_proto = "socks5"
-                    elif "socks4" in potential: parsed_proto = "socks4"
-                    elif "https" in potential: parsed_proto = "https"
-                    elif "http" in potential: parsed_proto = "http"
-
-            # STRATEGY 2: Standard URI or IP:Port (Regex)
-            if not parsed_ip:
-                match = re.search(r'(?:(?P<proto>[a-z0-9]+)://)?(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(?P<port>\d+)', line, re.IGNORECASE)
-                if match:
-                    parsed_ip = match.group('ip')
-                    parsed_port = match.group('port')
-                    parsed_proto = match.group('proto')
-            
-            # FINALIZE PROTOCOL
-            if parsed_ip and parsed_port:
-                uid = f"{parsed_ip}:{parsed_port}"
-                if uid not in seen:
-                    # Determine Protocol
-                    final_proto = parsed_proto.lower() if parsed_proto else (force_proto if force_proto != "AUTO" else "http")
-                    # Fallback auto-detect from text
-                    if force_proto == "AUTO" and not parsed_proto:
-                        if "socks5" in line.lower(): final_proto = "socks5"
-                        elif "socks4" in line.lower(): final_proto = "socks4"
-                        elif "https" in line.lower(): final_proto = "https"
-                    
-                    seen.add(uid)
-                    proxies_to_check.append({"ip": parsed_ip, "port": parsed_port, "protocol": final_proto})
-
-        if not proxies_to_check:
+        store = HealthStore()
+        cached_results, cached_matrix, unstored = [], [], []
+        if resume:
+            # --- CHECKPOINT REPLAY ---
+            resumed = scan_log.resume(lambda spec: input_records(spec, store))
+            st.session_state.results = ResultTable.from_records(resumed.results)
+            st.session_state.ftp_results = MatrixTable.from_records(resumed.rows)
+            t_list = resumed.meta.get("targets", [])
+            records, line_total, unstored = resumed.remaining, max(resumed.count, 1), resumed.unstored
+            log_event(f"RESUMING: {len(resumed.results)} DONE / {resumed.count} LEFT")
+        else:
+            st.session_state.results = ResultTable()
+            st.session_state.ftp_results = MatrixTable()
+            st.session_state.check_done = False
+            st.session_state.logs = []
+            t_list = target_text.strip().split('\n')
+
+            # --- STREAMING PARSER ---
+            # Raw copies of the inputs go to the checkpoint dir (a write, no parsing), so a resume
+            # after a crash can rebuild whatever part of the list was never pulled
+            datas = [f.getvalue() for f in up_files] if up_files else [st.session_state.proxy_text.strip().encode()]
+            spec = {"files": [scan_log.keep_input(i, data) for i, data in enumerate(datas)], "protocol": force_proto,
+                    "history": merge_history}
+            line_total = sum(data.count(b'\n') + 1 for data in datas)
+            records = input_records(spec, store)
+            if incremental:
+                records, skipped = store.plan(records, fresh_hours * 3600)
+                cached_results, cached_matrix = store.cached_results(skipped)
+                log_event(f"INCREMENTAL: {len(records)} DUE / {len(skipped)} SKIPPED")
+            # The queue is teed into the checkpoint log as the pipeline pulls it
+            records, count = scan_log.start(records, t_list, spec)
+            line_total = max(count or line_total, 1)
+        first = next(records, None)
+
+        if first is None and not cached_results and not resume:
+            scan_log.finish()
+            store.close()
             st.error("NO VALID NODES DETECTED. CHECK INPUT FORMAT.")
         else:
-            # PHASE 1
-            real_ip = get_real_ip()
-            results_temp = []
+            # PHASE 1 -> PHASE 2 (PIPELINED)
+            judges = JudgePool(judge_text.split('\n') if judge_text.strip() else [JUDGE_URL])
+            real_ip = asyncio.run(get_real_ip(judges))
+            # Columnar session state: ~30 bytes per node instead of a dict, viewed by pandas without copying
+            # (a resumed scan appends to the partial results it continues). Dead nodes go straight in; live
+            # ones are held until the scan ends, since geo and the matrix score still patch them in place
+            table, matrix = st.session_state.results, st.session_state.ftp_results
+            first_new, live = len(table), []
             bar = st.progress(0)
             status = st.empty()
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-                futures = {executor.submit(check_proxy_basic, p, timeout, real_ip): p for p in proxies_to_check}
-                done = 0
-                for f in concurrent.futures.as_completed(futures):
-                    if st.session_state.stop_scan: break
-                    res = f.result()
-                    results_temp.append(res)
-                    done += 1
-                    bar.progress(done/len(proxies_to_check))
-                    status.markdown(f"**SCANNING:** {done}/{len(proxies_to_check)}")
-                    if res['Status'] == 'Working': log_event(f"ALIVE: {res['IP']} ({res['Anonymity']})")
-            
-            st.session_state.results = results_temp
-            
-            # PHASE 2
-            if not st.session_state.stop_scan and results_temp:
-                log_event("STARTING MATRIX VERIFICATION...")
-                t_list = target_text.strip().split('\n')
-                ftp_temp = []
-                bar.progress(0)
-                done = 0
-                
-                with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-                    futures = {executor.submit(check_specific_target, p, t_list, 5): p for p in results_temp}
-                    for f in concurrent.futures.as_completed(futures):
-                        if st.session_state.stop_scan: break
-                        ftp_temp.append(f.result())
-                        done += 1
-                        bar.progress(done/len(results_temp))
-                        status.markdown(f"**VERIFYING:** {done}/{len(results_temp)}")
+            log_event("PIPELINE ENGAGED: LIVE NODES ROUTED TO MATRIX VERIFICATION")
+
+            interrupted = []
+
+            def show_progress(snap):
+                if interrupted: return
+                width = control.concurrency if workers == 1 else f"{workers} PROCS"
+                # Throttled by ProgressReporter: a handful of websocket deltas per second, whatever the scan rate
+                try:
+                    bar.progress(min(snap['done'] / line_total, 1.0))
+                    status.markdown(f"**SCANNING:** {snap['done']}/~{line_total} &nbsp; **ALIVE:** {snap['alive']} ({snap['alive_rate']:.0%}) "
+                                    f"&nbsp; **VERIFIED:** {snap['verified']} &nbsp; **RATE:** {snap['rate']:.0f}/s &nbsp; **CONCURRENCY:** {width} "
+                                    f"&nbsp; **ETA:** {format_eta(snap['eta'])}")
+                except SCRIPT_INTERRUPTS as e:
+                    # A click mid-scan (EMERGENCY STOP or any widget) interrupts this run: wind the scan
+                    # down, keep what finished, then hand the rerun back to Streamlit below
+                    interrupted.append(e)
+                    st.session_state.stop_scan = True
+                log_events(snap['logs'])
+
+            def on_stop(remaining):
+                # Not drained: RESUME rebuilds the unread rest from the kept input copies
+                log_event(f"SCAN STOPPED: ~{max(line_total - progress.done, 0)} UNCHECKED NODES KEPT IN CHECKPOINT. PRESS RESUME TO CONTINUE.")
+
+            control = RateControl(concurrency, adaptive, target_rate=target_rate, subnet_rate=subnet_rate)
+            metrics = ScanMetrics()
+            progress = ProgressReporter(line_total, metrics.timed("ui", show_progress))
+
+            def on_result(res):
+                if res['Status'] == "Working": live.append(res)
+                else: table.append(res)
+                scan_log.record(res)
+                progress.result(res)
+
+            def on_row(row):
+                matrix.append(row)
+                store.record_row(row)
+                scan_log.record_row(row)
+                progress.row(row)
 
-                st.session_state.ftp_results = ftp_temp
+            try:
+                resolver = default_resolver(geo_db.strip() or None)
+            except (OSError, RuntimeError) as e:
+                st.warning(f"GEO_DB UNAVAILABLE ({e}). USING CACHE + ONLINE LOOKUP.")
+                resolver = default_resolver()
+
+            pending = itertools.chain([first], records) if first else []
+            options = dict(on_result=on_result, on_row=on_row, should_stop=lambda: st.session_state.stop_scan, judges=judges, geo=resolver,
+                           must_have=must_have, connect_timeout=connect_timeout, on_stop=on_stop, control=control, metrics=metrics,
+                           samples=samples, keep=False)
+            with profiled() if profile_scan else nullcontext() as profiler:
+                if workers > 1:
+                    run_sharded(pending, t_list, timeout, real_ip, workers, concurrency, TARGET_TIMEOUT, **options)
+                else:
+                    run_pipeline(pending, t_list, timeout, real_ip, concurrency, TARGET_TIMEOUT, **options)
+            progress.flush()
+            st.session_state.scan_metrics = metrics
+            st.session_state.scan_profile = profile_report(profiler) if profiler else ""
+            resolver.cache.close()
+
+            # HEALTH STORE (after geo resolution so Country/ISP are persisted; cached nodes weren't re-checked)
+            table.extend(live)
+            for res in itertools.chain(unstored, table.records(first_new)): store.record(res)
+            store.close()
+            table.extend(cached_results)
+            matrix.extend(cached_matrix)
+            if st.session_state.stop_scan:
+                scan_log.mark_stored()
+                scan_log.close()
+            else:
+                scan_log.finish()
+
+            st.session_state.scan_version += 1
+            drop_exports()
 
             st.session_state.check_done = True
+            if interrupted: raise interrupted[0]
             status.empty()
             bar.empty()
             if st.session_state.stop_scan:
@@ -443,57 +514,37 @@ with col_act2:
 
 # --- RESULTS ---
 if st.session_state.check_done:
-    df = pd.DataFrame(st.session_state.results)
-    if not df.empty:
-        df_ok = df[df['Status'] == "Working"]
-        df_dead = df[df['Status'] == "Dead"]
-    else:
-        df_ok = pd.DataFrame()
-        df_dead = pd.DataFrame()
-    
+    # Derived frames/figures are memoized per scan version; widget reruns only slice them
+    views = views_for(st.session_state, st.session_state.scan_version)
+    df_ok, df_dead = views.ok, views.dead
+
     # METRICS
     m1, m2, m3, m4 = st.columns(4)
-    m1.metric("TOTAL_NODES", len(df))
+    m1.metric("TOTAL_NODES", len(views.frame))
     m2.metric("ACTIVE_NODES", len(df_ok))
-    m3.metric("AVG_LATENCY", f"{int(df_ok['Latency'].mean())}ms" if not df_ok.empty else "-")
+    m3.metric("AVG_LATENCY", f"{int(views.latency.mean())}ms" if not df_ok.empty else "-")
     m4.metric("TARGETS", len(target_text.strip().split('\n')))
 
-    # CHARTS & MAP
-    if not df_ok.empty and PLOTLY_AVAILABLE:
+    # CHARTS & MAP (built once per scan, and only while shown)
+    if not df_ok.empty and PLOTLY_AVAILABLE and st.toggle("GLOBAL_INTELLIGENCE", value=True):
         st.markdown('<div class="cyber-card">', unsafe_allow_html=True)
         st.markdown("##### <span class='neon-text'>GLOBAL_INTELLIGENCE</span>", unsafe_allow_html=True)
-        
-        fig = px.scatter_geo(
-            df_ok, locations="Country", locationmode='ISO-3', hover_name="ISP",
-            size="Latency", projection="orthographic", color="Protocol",
-            color_discrete_map={"HTTP": "#00f3ff", "SOCKS4": "#bc13fe", "SOCKS5": "#0aff0a"}
-        )
-        fig.update_layout(
-            font=dict(family="Orbitron", color="#00f3ff"),
-            paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
-            margin=dict(l=0,r=0,t=0,b=0),
-            geo=dict(bgcolor="rgba(0,0,0,0)", showland=True, landcolor="#0a0f14", oceancolor="#050505", showcountries=True, countrycolor="#333")
-        )
+        fig, fig_p, fig_h = views.memo("charts", lambda: build_charts(df_ok))
         st.plotly_chart(fig, use_container_width=True)
 
         cc1, cc2 = st.columns(2)
         with cc1:
-            pc = df_ok['Protocol'].value_counts().reset_index()
-            pc.columns = ['Protocol', 'Count']
-            fig_p = px.pie(pc, values='Count', names='Protocol', hole=0.5, color_discrete_sequence=['#00f3ff', '#bc13fe', '#0aff0a'])
-            fig_p.update_layout(title="PROTOCOLS", title_font_family="Orbitron", paper_bgcolor="rgba(0,0,0,0)", font_color="#ccc")
             st.plotly_chart(fig_p, use_container_width=True)
         with cc2:
-            fig_h = px.histogram(df_ok, x="Latency", nbins=20, color_discrete_sequence=['#bc13fe'])
-            fig_h.update_layout(title="LATENCY (ms)", title_font_family="Orbitron", paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0.3)", font_color="#ccc")
             st.plotly_chart(fig_h, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
     # FILTER
     if not df_ok.empty:
         max_lat = st.slider("LATENCY_FILTER (MS)", 0, 5000, 3000)
-        df_filt = df_ok[df_ok['Latency'] <= max_lat]
+        df_filt = views.filter(max_lat)
     else:
+        max_lat = None
         df_filt = df_ok
 
     # TABS
@@ -501,25 +552,18 @@ if st.session_state.check_done:
     t1, t2, t3 = st.tabs(["🚀 **MATRIX_GRID**", "✅ **ACTIVE_LIST**", "❌ **DEAD_POOL**"])
 
     with t1:
-        if st.session_state.ftp_results:
+        if len(st.session_state.ftp_results):
             st.markdown("##### CONNECTION MATRIX")
-            df_ftp = pd.DataFrame(st.session_state.ftp_results)
-            if not df_filt.empty:
-                valid_ips = set(df_filt['Full_Address'])
-                df_ftp = df_ftp[df_ftp['Raw_IP'].isin(valid_ips)]
+            df_ftp = views.matrix_for(max_lat) if max_lat is not None else views.matrix
 
             if not df_ftp.empty:
                 base = ['Proxy', 'Type']
                 t_cols = [c for c in df_ftp.columns if c not in base and c != 'Raw_IP']
-                def color_m(val):
-                    s = str(val)
-                    if 'ACCESS' in s: return 'color:#0f0; font-weight:bold; background:rgba(0,255,0,0.1)'
-                    if 'FORBID' in s: return 'color:#fa0'
-                    if 'TIME' in s: return 'color:#666'
-                    return ''
+                df_ftp, start = paginate(df_ftp, "matrix_page")
+                styled = views.memo(("styled", max_lat, start), lambda: df_ftp[base + t_cols].style.applymap(color_m))
 
                 sel_matrix = st.dataframe(
-                    df_ftp[base + t_cols].style.applymap(color_m),
+                    styled,
                     use_container_width=True,
                     on_select="rerun",
                     selection_mode="multi-row"
@@ -539,36 +583,91 @@ if st.session_state.check_done:
                     st.code("\n".join(copy_lines), language="text")
                 else:
                     st.caption("SELECT ROWS TO EXTRACT DETAILS")
+
+                # Best nodes by composite score (warm latency, jitter, loss, matrix success)
+                with st.expander("🏆 TOP_NODES"):
+                    rc1, rc2 = st.columns([3, 1])
+                    with rc1:
+                        rank_target = st.selectbox("RANK_FOR", ["ANY_TARGET"] + views.ranking.targets())
+                    with rc2:
+                        rank_n = st.number_input("TOP_N", 1, 500, 20)
+                    best = views.ranking.top(rank_n, None if rank_target == "ANY_TARGET" else rank_target)
+                    if best:
+                        st.code("\n".join(f"{r['Protocol'].lower()}://{r['Full_Address']}" for r in best), language="text")
+                        st.dataframe(pd.DataFrame(best)[[c for c in RANK_COLUMNS if c in best[0]]], use_container_width=True, hide_index=True)
+                    else:
+                        st.caption("NO NODE REACHED THIS TARGET")
             else:
                 st.warning("NO ACTIVE PROXIES MATCH FILTER.")
 
     with t2:
         if not df_filt.empty:
-            isps = sorted(df_filt['ISP'].unique().tolist())
             c_f1, c_f2 = st.columns([1, 2])
             with c_f1:
-                sel_isp = st.selectbox("FILTER_BY_ISP", ["ALL_NETWORKS"] + isps)
-            
-            if sel_isp != "ALL_NETWORKS":
-                df_display = df_filt[df_filt['ISP'] == sel_isp]
-            else:
-                df_display = df_filt
-                
-            csv = df_display.to_csv(index=False).encode('utf-8')
-            st.download_button("⬇ DOWNLOAD_CSV", csv, f"NETRUNNER_SCAN_{datetime.now().strftime('%M%S')}.csv", "text/csv")
+                sel_isp = st.selectbox("FILTER_BY_ISP", [ALL_ISPS] + views.isps_within(max_lat))
+            df_display = views.filter(max_lat, sel_isp)
+
+            # Exports are streamed to disk only on request (CSV/TXT/JSONL, gzip, Parquet)
+            export_panel(df_display, [c for c in df_display.columns], "active", (max_lat, sel_isp))
+            page, _ = paginate(df_display, "active_page")
             st.markdown("#### QUICK_COPY")
-            st.code("\n".join(df_display['Full_Address'].tolist()), language="text")
-            st.dataframe(df_display[['IP', 'Port', 'Protocol', 'Anonymity', 'ISP', 'Country', 'Latency']], use_container_width=True, hide_index=True)
+            st.code("\n".join(page['Full_Address'].tolist()), language="text")
+            st.dataframe(page[[c for c in ['IP', 'Port', 'Protocol', 'Anonymity', 'ISP', 'Country', 'Latency', 'P50_ms', 'Jitter_ms', 'Loss_pct', 'Score']
+                               if c in page.columns]], use_container_width=True, hide_index=True)
         else:
             st.warning("NO DATA MATCHES FILTERS.")
 
     with t3:
         if not df_dead.empty:
-            st.dataframe(df_dead[['IP', 'Port', 'Protocol']], use_container_width=True)
+            export_panel(df_dead, ['Full_Address', 'Protocol', 'Reason'], "dead", None, default="txt.gz")
+            page, _ = paginate(df_dead, "dead_page")
+            st.dataframe(page[[c for c in ['IP', 'Port', 'Protocol', 'Reason'] if c in page.columns]], use_container_width=True)
             with st.expander("VIEW_DUMP"):
-                st.code("\n".join(df_dead['Full_Address']))
+                st.code("\n".join(page['Full_Address']))
     st.markdown('</div>', unsafe_allow_html=True)
 
+    # TELEMETRY (stage timings of the last scan run in this session)
+    metrics = st.session_state.scan_metrics
+    if metrics is not None and metrics.stages:
+        with st.expander("📈 SCAN_TELEMETRY"):
+            st.dataframe(pd.DataFrame(metrics.summary()), use_container_width=True, hide_index=True)
+            st.caption("OUTCOMES: " + " · ".join(f"{k} {v}" for k, v in metrics.reasons.most_common()))
+            st.download_button("⬇ PROMETHEUS_TEXT", metrics.prometheus(), "netrunner.prom", "text/plain")
+            if st.session_state.scan_profile:
+                st.code(st.session_state.scan_profile, language="text")
+
+    # GATEWAY (one local proxy endpoint rotating over the live nodes; runs in its own thread across reruns)
+    if not df_ok.empty:
+        with st.expander("🛰️ ROTATION_GATEWAY"):
+            gw = st.session_state.gateway
+            gc1, gc2, gc3 = st.columns([2, 1, 1])
+            with gc1:
+                gw_host = st.text_input("BIND", "127.0.0.1", disabled=gw is not None)
+            with gc2:
+                gw_port = st.number_input("PORT", 1, 65535, GATEWAY_PORT, disabled=gw is not None)
+            with gc3:
+                st.write("")
+                if gw is None and st.button("▶ START", use_container_width=True):
+                    # Its own ranking: evictions must not leak into the TOP_NODES view
+                    gateway = Gateway(ProxyRanking(iter_records(df_ok), st.session_state.ftp_results.records()))
+                    try:
+                        st.session_state.gateway = GatewayThread(gateway, gw_host, int(gw_port)).start()
+                        st.rerun()
+                    except OSError as e:
+                        st.error(f"GATEWAY BIND FAILED: {e}")
+                elif gw is not None and st.button("⏹ STOP", use_container_width=True):
+                    gw.stop()
+                    st.session_state.gateway = None
+                    st.rerun()
+            if gw is not None:
+                stats = gw.gateway.stats()
+                st.success(f"ONLINE @ {gw.host}:{gw.port} · {stats['Upstreams']} UPSTREAMS · {stats['Connections']} CONNECTIONS · "
+                           f"{stats['Failed']} FAILED · {stats['Evicted']} EVICTED")
+                st.code(f"curl -x http://{gw.host}:{gw.port} http://example.com/\n"
+                        f"curl --proxy socks5h://{gw.host}:{gw.port} https://example.com/", language="text")
+            else:
+                st.caption("HTTP (CONNECT + PLAIN) AND SOCKS5 ON ONE PORT · PER-TARGET PICKS FROM THE MATRIX · FAILING NODES EVICTED")
+
 # --- TERMINAL ---
 if st.session_state.logs:
     st.markdown('<div class="cyber-card">', unsafe_allow_html=True)
@@ -0,0 +1,24 @@
+"""NETRUNNER scan engine: asyncio proxy checks usable outside the Streamlit UI.
+
+Importing this package only pulls in the standard library; the Streamlit app
+(app.py) and the ``python -m netrunner`` CLI are thin front-ends over it.
+"""
+from .engine import (
+    CONNECT_TIMEOUT, DEFAULT_CONCURRENCY, DEFAULT_TARGETS, JUDGE_URL, TARGET_TIMEOUT, USER_AGENTS,
+    check_proxy, check_target, fetch, get_real_ip, pipeline, run_pipeline, run_scan, run_verify, scan, verify_targets,
+)
+from .checkpoint import ScanLog, load_queue, save_queue
+from .columns import MatrixTable, ResultTable, with_addresses
+from .dedup import AddressSet, address_key, key_address
+from .detect import detect_protocols
+from .gateway import Gateway, GatewayThread, serve_gateway
+from .geo import GeoCache, GeoResolver, RangeDatabase, default_resolver, open_database
+from .judge import JudgePool, classify_anonymity, start_judge
+from .metrics import ScanMetrics, serve_metrics
+from .parser import ProxyRecord, iter_lines, iter_proxies, merge_sources, parse_line, parse_proxies
+from .progress import ProgressReporter, format_eta
+from .rank import ProxyRanking, sample_latency, score
+from .shard import run_sharded, shard_of, sharded_pipeline
+from .store import HealthStore
+from .throttle import AdaptiveLimit, RateControl, TokenBucket
+from .transport import ProxyError
@@ -0,0 +1,421 @@
+"""Throughput benchmark against a local mock proxy farm: ``python -m netrunner.bench``.
+
+The farm runs in its own process: fake HTTP / SOCKS4 / SOCKS5 proxies on
+loopback, a judge and target servers. Every fake proxy is a distinct
+``127.x.y.z`` address (Linux routes all of 127.0.0.0/8 to loopback) served
+by one listening socket, which tells nodes apart by the local address a
+connection arrived on. Behaviour per node (latency, dead port, hang,
+transparent / anonymous / elite) is drawn from a seeded RNG, so the parent
+knows the ground truth and can score accuracy as well as speed.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import random
+import signal
+import socket
+import struct
+import sys
+import time
+from array import array
+from collections import Counter, namedtuple
+from urllib.parse import urlsplit
+
+from .engine import scan, verify_targets
+from .judge import ANON_ANONYMOUS, ANON_ELITE, ANON_TRANSPARENT, start_judge
+from .parser import ProxyRecord
+from .throttle import RateControl
+
+# --- FAILSAFE IMPORT ---
+try:
+    import resource
+except ImportError:   # Windows: no rusage / rlimits
+    resource = None
+
+# --- FARM ---
+DEAD, HANG, ELITE, ANONYMOUS, TRANSPARENT = range(5)
+KIND_NAMES = ("DEAD", "HANG", "ELITE", "ANONYMOUS", "TRANSPARENT")
+PER_SUBNET = 254   # nodes per 127.b.c.0/24 (.1 - .254)
+BAD_GATEWAY = b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+CLIENT_IP = "127.0.0.1"    # what the judge sees from a transparent node
+SERVICE_IP = "127.0.0.2"   # judge and targets: not the client IP, or every Host header would look like a leak
+
+FarmSpec = namedtuple("FarmSpec", ["size", "protocols", "latency_ms", "spread", "dead", "hang", "transparent", "anonymous", "seed"],
+                      defaults=(1000, ("http", "socks4", "socks5"), 40.0, 0.5, 0.3, 0.05, 0.2, 0.2, 1))
+FarmSpec.__doc__ = """Shape of a mock farm: ``size`` nodes cycling through ``protocols``, a
+lognormal latency with median ``latency_ms`` and sigma ``spread``, and the
+fractions of ``dead`` (closed port) / ``hang`` (accepts, never answers)
+nodes; of the live ones, ``transparent`` leak the client IP and ``anonymous``
+add a Via header (HTTP nodes only; tunnels can't)."""
+
+
+class MockFarm:
+    """The nodes of a :class:`FarmSpec` and, once :meth:`start` ed, the servers behind them."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        rng = random.Random(spec.seed)
+        self.kinds = bytearray(spec.size)
+        self.delays = array("f", bytes(4 * spec.size))
+        for i in range(spec.size):
+            r = rng.random()
+            if r < spec.dead: kind = DEAD
+            elif r < spec.dead + spec.hang: kind = HANG
+            else:
+                a = rng.random()
+                kind = TRANSPARENT if a < spec.transparent else ANONYMOUS if a < spec.transparent + spec.anonymous else ELITE
+            self.kinds[i] = kind
+            self.delays[i] = min(rng.lognormvariate(math.log(spec.latency_ms), spec.spread), 60000.0) / 1000
+        self.port = self.dead_port = None
+
+    # --- ADDRESSING ---
+    @staticmethod
+    def address(i):
+        block, host = divmod(i, PER_SUBNET)
+        return f"127.{1 + block // 256}.{block % 256}.{host + 1}"
+
+    @staticmethod
+    def index(address):
+        _, b, c, d = (int(x) for x in address.split("."))
+        return ((b - 1) * 256 + c) * PER_SUBNET + d - 1
+
+    def protocol(self, i):
+        return self.spec.protocols[i % len(self.spec.protocols)]
+
+    def records(self, labeled=True):
+        """The farm as a proxy list (``labeled=False`` leaves protocols to fingerprinting)."""
+        for i in range(self.spec.size):
+            port = self.dead_port if self.kinds[i] == DEAD else self.port
+            yield ProxyRecord(self.address(i), str(port), self.protocol(i) if labeled else "auto")
+
+    def expected(self, res, timeout, handshake=None, handshaking=("socks4", "socks5")):
+        """Ground truth for a Phase 1 result: ``(alive, anonymity)`` (anonymity None for dead nodes).
+
+        A node slower than ``timeout`` (seconds) is expected dead; so is one of the
+        ``handshaking`` protocols slower than the ``handshake`` budget, since a
+        node's delay holds back its first answer.
+        """
+        i = self.index(res['IP'])
+        kind = self.kinds[i]
+        budget = min(timeout, handshake) if handshake is not None and self.protocol(i) in handshaking else timeout
+        if kind in (DEAD, HANG) or self.delays[i] >= budget: return False, None
+        if kind == TRANSPARENT: return True, ANON_TRANSPARENT
+        if kind == ANONYMOUS and self.protocol(i) == "http": return True, ANON_ANONYMOUS
+        return True, ANON_ELITE
+
+    # --- SERVERS ---
+    async def start(self):
+        # 0.0.0.0 so one socket answers for every 127.x.y.z; anything not from loopback is dropped
+        server = await asyncio.start_server(self._serve, "0.0.0.0", 0, backlog=8192)
+        self.port = server.sockets[0].getsockname()[1]
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.dead_port = s.getsockname()[1]   # closed again: connections are refused
+        return server
+
+    async def _serve(self, reader, writer):
+        local = writer.get_extra_info("sockname")[0]
+        client = writer.get_extra_info("peername")[0]
+        try:
+            if not client.startswith("127."): return
+            i = self.index(local)
+            kind = self.kinds[i]
+            if kind == HANG:
+                await reader.read()   # hold the connection open until the scanner gives up
+                return
+            await asyncio.sleep(self.delays[i])
+            egress = client if kind == TRANSPARENT else local   # a transparent node's traffic comes from you
+            handler = {"http": _http_node, "socks4": _socks4_node, "socks5": _socks5_node}[self.protocol(i)]
+            await handler(reader, writer, kind, client, egress)
+        except (OSError, EOFError, ValueError, IndexError, KeyError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        except asyncio.CancelledError:
+            pass   # farm shutting down with tunnels still open
+        finally:
+            writer.close()
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data: break
+            writer.write(data)
+            await writer.drain()
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _splice(reader, writer, up_reader, up_writer):
+    await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+
+
+async def _upstream(writer, host, port, egress, refusal):
+    # Like a real proxy, answer an unreachable destination with the protocol's own error.
+    # .invalid never resolves (RFC 6761): refuse it without tying up the resolver threads
+    try:
+        if host.endswith(".invalid"): raise OSError("unresolvable")
+        return await asyncio.open_connection(host, port, local_addr=(egress, 0))
+    except OSError:
+        writer.write(refusal)
+        await writer.drain()
+        return None, None
+
+
+async def _http_node(reader, writer, kind, client, egress):
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+    lines = head.split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    if method == "CONNECT":
+        host, _, port = target.rpartition(":")
+        up_reader, up_writer = await _upstream(writer, host, int(port), egress, BAD_GATEWAY)
+        if not up_writer: return
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+    else:
+        url = urlsplit(target)
+        up_reader, up_writer = await _upstream(writer, url.hostname, url.port or 80, egress, BAD_GATEWAY)
+        if not up_writer: return
+        # One request per upstream connection: ask both ends to close after it
+        out = [f"{method} {url.path or '/'}{'?' + url.query if url.query else ''} HTTP/1.1"]
+        out += [h for h in lines[1:] if h and not h.lower().startswith(("connection:", "proxy-connection:"))]
+        out.append("Connection: close")
+        if kind == TRANSPARENT: out.append(f"X-Forwarded-For: {client}")
+        elif kind == ANONYMOUS: out.append("Via: 1.1 netrunner-farm")
+        up_writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1"))
+    await _splice(reader, writer, up_reader, up_writer)
+
+
+async def _socks4_node(reader, writer, kind, client, egress):
+    req = await reader.readexactly(8)
+    await reader.readuntil(b"\x00")   # user id
+    port, ip = struct.unpack("!H", req[2:4])[0], socket.inet_ntoa(req[4:8])
+    up_reader, up_writer = await _upstream(writer, ip, port, egress, b"\x00\x5b" + req[2:8])
+    if not up_writer: return
+    writer.write(b"\x00\x5a" + req[2:8])
+    await _splice(reader, writer, up_reader, up_writer)
+
+
+async def _socks5_node(reader, writer, kind, client, egress):
+    _, methods = await reader.readexactly(2)
+    await reader.readexactly(methods)
+    writer.write(b"\x05\x00")
+    _, _, _, atyp = await reader.readexactly(4)
+    if atyp == 3: host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+    else: host = socket.inet_ntoa(await reader.readexactly(4))
+    port = struct.unpack("!H", await reader.readexactly(2))[0]
+    up_reader, up_writer = await _upstream(writer, host, port, egress, b"\x05\x04\x00\x01\x00\x00\x00\x00\x00\x00")
+    if not up_writer: return
+    writer.write(b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00")
+    await _splice(reader, writer, up_reader, up_writer)
+
+
+def _raise_nofile():
+    # Each in-flight check costs the farm three sockets and the scanner one
+    if resource is None: return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard: resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _farm_main(spec, targets, conn):
+    # Farm process: serve until the parent closes its end of the pipe
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _raise_nofile()
+
+    async def serve():
+        farm = MockFarm(spec)
+        servers = [await farm.start(), await start_judge(SERVICE_IP, 0)]
+        servers += [await start_judge(SERVICE_IP, 0) for _ in range(targets)]
+        ports = [s.sockets[0].getsockname()[1] for s in servers]
+        conn.send((farm.port, farm.dead_port, ports[1], ports[2:]))
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        except EOFError:
+            pass
+        conn.send(time.process_time())
+
+    asyncio.run(serve())
+
+
+# --- MEASUREMENT ---
+FARM_BUSY = 0.8   # farm CPU / bench wall time above which the farm, not the scanner, is the bottleneck
+
+def percentile(values, q):
+    if not values: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _Stopwatch:
+    # Per-item dispatch-to-completion time: items are stamped as the engine pulls them
+    def __init__(self):
+        self.started = {}
+        self.durations = []
+
+    def feed(self, items, key):
+        for item in items:
+            self.started[key(item)] = time.perf_counter()
+            yield item
+
+    def done(self, key):
+        self.durations.append((time.perf_counter() - self.started.pop(key)) * 1000)
+
+
+def _phase(name, count, wall, cpu, watch, **extra):
+    return {"phase": name, "count": count, "seconds": round(wall, 3), "rate": round(count / wall, 1) if wall else 0.0,
+            "p50_ms": _round(percentile(watch.durations, 0.5)), "p99_ms": _round(percentile(watch.durations, 0.99)),
+            "cpu_seconds": round(cpu, 3), **extra}
+
+
+def _round(v):
+    return None if v is None else round(v, 1)
+
+
+def _peak_rss_mb():
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)   # bytes on macOS, KiB elsewhere
+
+
+async def run_bench(spec, farm_port, dead_port, judge_url, target_urls, timeout=6, connect_timeout=1.5, target_timeout=5,
+                    control=None, concurrency=500, labeled=True):
+    """Phase 1 over the whole farm, then Phase 2 over its live nodes; returns one report dict per phase."""
+    farm = MockFarm(spec)
+    farm.port, farm.dead_port = farm_port, dead_port
+    control = control or RateControl.fixed(concurrency)
+    reports = []
+
+    watch = _Stopwatch()
+    cpu, t0 = time.process_time(), time.perf_counter()
+    results = await scan(watch.feed(farm.records(labeled), lambda r: f"{r.ip}:{r.port}"), timeout, CLIENT_IP,
+                         judges=judge_url, geo=False, connect_timeout=connect_timeout, control=control,
+                         on_result=lambda res: watch.done(res['Full_Address']))
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu
+    # Only real handshakes (and fingerprinting) answer to connect_timeout; a plain-HTTP judge request has the whole timeout
+    handshake = 2 * min(timeout, connect_timeout)
+    handshaking = ("socks4", "socks5") if labeled and not judge_url.startswith("https") else spec.protocols
+    wrong_status = wrong_anon = 0
+    for res in results:
+        alive, anon = farm.expected(res, timeout, handshake, handshaking)
+        wrong_status += alive != (res['Status'] == "Working")
+        wrong_anon += alive and res['Status'] == "Working" and anon != res['Anonymity']
+    reasons = Counter(res['Reason'] for res in results if res['Reason'])
+    live = [res for res in results if res['Status'] == "Working"]
+    reports.append(_phase("PHASE_1", len(results), wall, cpu, watch, alive=len(live), wrong_status=wrong_status,
+                          wrong_anonymity=wrong_anon, reasons=dict(reasons.most_common())))
+
+    if target_urls and live:
+        watch = _Stopwatch()
+        cpu, t0 = time.process_time(), time.perf_counter()
+        rows = await verify_targets(watch.feed(live, lambda r: r['Full_Address']), target_urls, target_timeout,
+                                    control=control, on_result=lambda row: watch.done(row['Raw_IP']))
+        wall, cpu = time.perf_counter() - t0, time.process_time() - cpu
+        cells = Counter(v for row in rows for k, v in row.items() if k not in ("Proxy", "Type", "Raw_IP"))
+        reports.append(_phase("PHASE_2", len(rows), wall, cpu, watch, cells=dict(cells.most_common())))
+    return reports
+
+
+def benchmark(spec=FarmSpec(), targets=4, **options):
+    """Start a farm process, run :func:`run_bench` against it and return the full report."""
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe()
+    proc = ctx.Process(target=_farm_main, args=(spec, targets, child), daemon=True)
+    proc.start()
+    try:
+        if not parent.poll(30): raise RuntimeError("mock farm did not start")
+        farm_port, dead_port, judge_port, target_ports = parent.recv()
+        _raise_nofile()
+        phases = asyncio.run(run_bench(spec, farm_port, dead_port, f"http://{SERVICE_IP}:{judge_port}/get",
+                                       [f"http://{SERVICE_IP}:{p}/" for p in target_ports], **options))
+        parent.send("stop")
+        farm_cpu = parent.recv() if parent.poll(5) else None
+    finally:
+        parent.close()
+        proc.join(5)
+        if proc.is_alive(): proc.terminate()
+    return {"spec": spec._asdict(), "phases": phases, "peak_rss_mb": _peak_rss_mb(),
+            "cpu_seconds": round(time.process_time(), 3), "farm_cpu_seconds": farm_cpu and round(farm_cpu, 3)}
+
+
+# --- REPORTING ---
+def format_report(report):
+    lines = []
+    for p in report['phases']:
+        lines.append(f"{p['phase']}: {p['count']} IN {p['seconds']:.2f}s  {p['rate']:.0f}/s  "
+                     f"p50 {p['p50_ms']}ms  p99 {p['p99_ms']}ms  CPU {p['cpu_seconds']:.2f}s")
+        if p['phase'] == "PHASE_1":
+            lines.append(f"  ALIVE {p['alive']}  WRONG_STATUS {p['wrong_status']}  WRONG_ANONYMITY {p['wrong_anonymity']}  "
+                         + " ".join(f"{k}={v}" for k, v in p['reasons'].items()))
+        else:
+            lines.append("  " + " ".join(f"{k}={v}" for k, v in p['cells'].items()))
+    lines.append(f"PEAK RSS {report['peak_rss_mb']} MB  CPU {report['cpu_seconds']:.2f}s  FARM CPU {report['farm_cpu_seconds']}s")
+    wall = sum(p['seconds'] for p in report['phases'])
+    if report['farm_cpu_seconds'] and wall and report['farm_cpu_seconds'] > FARM_BUSY * wall:
+        lines.append("WARNING: THE FARM WAS CPU-BOUND; THESE NUMBERS MEASURE IT, NOT THE SCANNER (LOWER -c OR ADD CORES)")
+    return "\n".join(lines)
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of ``report`` against ``baseline``: phases whose rate fell (or p99 rose) by more than ``tolerance``."""
+    before = {p['phase']: p for p in baseline['phases']}
+    found = []
+    for p in report['phases']:
+        old = before.get(p['phase'])
+        if not old: continue
+        if old['rate'] and p['rate'] < old['rate'] * (1 - tolerance):
+            found.append(f"{p['phase']} RATE {old['rate']:.0f}/s -> {p['rate']:.0f}/s")
+        if old['p99_ms'] and p['p99_ms'] and p['p99_ms'] > old['p99_ms'] * (1 + tolerance):
+            found.append(f"{p['phase']} p99 {old['p99_ms']}ms -> {p['p99_ms']}ms")
+    return found
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="netrunner.bench", description="Benchmark the scan engine against a local mock proxy farm.")
+    ap.add_argument("-n", "--size", type=int, default=FarmSpec().size, help="number of fake proxies")
+    ap.add_argument("--protocols", default="http,socks4,socks5", help="comma-separated protocols, assigned round-robin")
+    ap.add_argument("--latency", type=float, default=FarmSpec().latency_ms, help="median node latency in ms (lognormal)")
+    ap.add_argument("--spread", type=float, default=FarmSpec().spread, help="lognormal sigma of node latency")
+    ap.add_argument("--dead", type=float, default=FarmSpec().dead, help="fraction of closed ports")
+    ap.add_argument("--hang", type=float, default=FarmSpec().hang, help="fraction of nodes that accept and never answer")
+    ap.add_argument("--transparent", type=float, default=FarmSpec().transparent, help="fraction of live nodes leaking the client IP")
+    ap.add_argument("--anonymous", type=float, default=FarmSpec().anonymous, help="fraction of live nodes adding a Via header")
+    ap.add_argument("--seed", type=int, default=FarmSpec().seed)
+    ap.add_argument("--targets", type=int, default=4, help="target servers for Phase 2 (0 skips it)")
+    ap.add_argument("--auto", action="store_true", help="leave protocols unlabeled (exercise fingerprinting)")
+    ap.add_argument("-c", "--concurrency", type=int, default=500)
+    ap.add_argument("--adaptive", action="store_true", help="adaptive concurrency (-c is the ceiling)")
+    ap.add_argument("--target-rate", type=float, default=0, help="requests/s per target host (0 = unlimited)")
+    ap.add_argument("--subnet-rate", type=float, default=0, help="checks/s per /24 (0 = unlimited)")
+    ap.add_argument("--timeout", type=float, default=6)
+    ap.add_argument("--connect-timeout", type=float, default=1.5)
+    ap.add_argument("--target-timeout", type=float, default=5)
+    ap.add_argument("--json", metavar="PATH", help="also write the report as JSON (a baseline for --compare)")
+    ap.add_argument("--compare", metavar="PATH", help="exit 1 if rate or p99 regressed against this JSON report")
+    ap.add_argument("--tolerance", type=float, default=0.1, help="allowed regression for --compare (fraction)")
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    spec = FarmSpec(args.size, tuple(p.strip() for p in args.protocols.split(",") if p.strip()), args.latency, args.spread,
+                    args.dead, args.hang, args.transparent, args.anonymous, args.seed)
+    control = RateControl(args.concurrency, args.adaptive, target_rate=args.target_rate, subnet_rate=args.subnet_rate)
+    report = benchmark(spec, args.targets, timeout=args.timeout, connect_timeout=args.connect_timeout,
+                       target_timeout=args.target_timeout, control=control, labeled=not args.auto)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=1)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            regressions = compare(report, json.load(fh), args.tolerance)
+        for line in regressions: print("REGRESSION: " + line, file=sys.stderr)
+        if regressions: return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+import itertools
+import json
+import os
+import time
+from collections import namedtuple
+
+from .config import DATA_DIR
+from .dedup import AddressSet, address_key
+from .parser import iter_proxies
+
+# --- FAILSAFE IMPORT ---
+try:
+    import fcntl
+except ImportError:   # Windows: no flock, so concurrent scans aren't detected
+    fcntl = None
+
+# --- CONSTANTS ---
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoint")
+RESUME_PATH = os.path.join(CHECKPOINT_DIR, "remaining.txt")
+
+# A replayed ScanLog. meta: the S header; results/rows: everything settled; unstored: results not
+# yet in the health store; remaining: lazy iterator over the records still to scan; count: how many
+# (of the spooled queue; the input the scan never reached is not counted)
+Resumed = namedtuple("Resumed", ["meta", "results", "rows", "unstored", "remaining", "count"])
+
+
+def queue_line(record):
+    """A record as a proxy-list line that :func:`iter_proxies` parses back unchanged."""
+    ip, port, protocol = record
+    return f"{ip}:{port}\n" if protocol == "auto" else f"{protocol}://{ip}:{port}\n"
+
+
+def save_queue(records, path=RESUME_PATH):
+    """Write unchecked ``records`` (e.g. from a stopped scan's ``on_stop``) and return how many.
+
+    The file is an ordinary proxy list, so it can also be fed straight back to
+    ``python -m netrunner``. It is written to a temp name and renamed, so a
+    crash never leaves a half-written queue behind.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with open(path + ".tmp", "w", encoding="utf-8") as fh:
+        for rec in records:
+            fh.write(queue_line(rec))
+            count += 1
+    os.replace(path + ".tmp", path)
+    return count
+
+
+def load_queue(path=RESUME_PATH):
+    """Lazily re-read a saved queue as :class:`ProxyRecord` s (labels kept, unlabeled stay ``auto``)."""
+    with open(path, encoding="utf-8") as fh:
+        yield from iter_proxies(fh, "AUTO")
+
+
+# --- SCAN LOG ---
+class ScanLog:
+    """Append-only on-disk checkpoint of a running scan.
+
+    ``start`` tees the input into ``queue.txt`` as the pipeline pulls it, so
+    the first check doesn't wait for the whole list to be parsed. Every Phase 1
+    result and matrix row is appended to ``scan.log`` as a tagged JSON line
+    (``S`` header, ``R`` result, ``M`` matrix row, ``Q`` queue cursor, ``D``
+    "all above is in the health store"). Writes go through a large buffer
+    flushed every ``flush_secs``, so logging costs a ``json.dumps`` per
+    result; each flush also flushes the queue and logs how many records it
+    durably holds. :meth:`resume` replays the log (skipping a torn last line)
+    and yields exactly the queued proxies that never settled: not logged, or
+    logged Working but still missing their matrix row. If the scan died before
+    pulling all of its input, the rest is rebuilt from the ``input`` the
+    caller described in :meth:`start`. A running scan holds :meth:`lock` on
+    the directory, so a second one can't write into the same checkpoint.
+    """
+
+    def __init__(self, directory=CHECKPOINT_DIR, flush_secs=1.0):
+        self.directory = directory
+        self.queue_path = os.path.join(directory, "queue.txt")
+        self.log_path = os.path.join(directory, "scan.log")
+        self._flush_secs = flush_secs
+        self._fh = None
+        self._queue = None
+        self._spooled = 0
+        self._last = 0.0
+        # resume() can rebuild everything not yet pulled (spooled list, or an input to re-read),
+        # so a stopped scan needn't drain the rest of its queue
+        self.replayable = False
+        self._lock = None
+
+    def lock(self):
+        """Claim the directory for this scan until :meth:`close`; False if another scan (process or UI session) has it."""
+        if fcntl is None or self._lock: return True
+        os.makedirs(self.directory, exist_ok=True)
+        fh = open(os.path.join(self.directory, "lock"), "w")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)   # per open file, so it also separates threads
+        except OSError:
+            fh.close()
+            return False
+        self._lock = fh
+        return True
+
+    def exists(self):
+        return os.path.exists(self.log_path) and os.path.exists(self.queue_path)
+
+    def input_path(self, index):
+        return os.path.join(self.directory, f"input-{index}.txt")
+
+    def keep_input(self, index, data):
+        """Keep a copy of an input that can't be re-read later (an upload) for ``input``; returns its path.
+
+        A raw copy, not parsed, so it costs a write rather than the parse
+        :meth:`start` avoids doing up front.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.input_path(index), "wb") as fh:
+            fh.write(data)
+        return self.input_path(index)
+
+    # --- WRITES ---
+    def start(self, records, targets=(), input=None):
+        """Open a fresh log over ``records``; returns the records to scan and their count (0 if not known yet).
+
+        An iterator is spooled lazily, as it is consumed; a list is already in
+        memory and is written out at once. ``input`` is JSON describing how to
+        rebuild the stream (files, protocol, ...); :meth:`resume` hands it
+        back to its ``rebuild`` callback if the scan never got to the end.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._open("w")
+        meta = {"targets": [t for t in targets if t.strip()], "started": time.time()}
+        self.replayable = isinstance(records, list) or input is not None
+        if isinstance(records, list):
+            count = save_queue(records, self.queue_path)
+            self._write("S", meta)
+            self._write("Q", {"spooled": count, "done": True})
+            return load_queue(self.queue_path), count
+        self._write("S", dict(meta, input=input))
+        open(self.queue_path, "w").close()
+        return self._tee(records), 0
+
+    def _tee(self, records, spooled=0):
+        self._queue = open(self.queue_path, "a", encoding="utf-8", buffering=1 << 20)
+        self._spooled = spooled
+        for rec in records:
+            self._queue.write(queue_line(rec))
+            self._spooled += 1
+            yield rec
+        self._queue.close()
+        self._queue = None
+        self._write("Q", {"spooled": self._spooled, "done": True})
+        self.flush()
+
+    def _open(self, mode):
+        self._fh = open(self.log_path, mode, encoding="utf-8", buffering=1 << 20)
+        self._last = time.monotonic()
+
+    def _write(self, tag, obj):
+        self._fh.write(tag + "\t" + json.dumps(obj, ensure_ascii=False) + "\n")
+        if time.monotonic() - self._last >= self._flush_secs: self.flush()
+
+    def record(self, result):
+        self._write("R", result)
+
+    def record_row(self, row):
+        self._write("M", row)
+
+    def flush(self):
+        if self._queue:
+            # Queue first, so the cursor never points past what is on disk
+            self._queue.flush()
+            self._fh.write("Q\t" + json.dumps({"spooled": self._spooled}) + "\n")
+        if self._fh:
+            self._fh.flush()
+            self._last = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._queue:
+            self._queue.close()
+            self._queue = None
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        if self._lock:
+            self._lock.close()
+            self._lock = None
+
+    def finish(self):
+        """The scan completed: drop the checkpoint (and its directory, if nothing else is in it)."""
+        # The lock file goes while still held, so nobody locks a file that is about to vanish
+        if self._lock: os.remove(self._lock.name)
+        self.close()
+        index = 0
+        while os.path.exists(self.input_path(index)):
+            os.remove(self.input_path(index))
+            index += 1
+        for path in (self.log_path, self.queue_path):
+            if os.path.exists(path): os.remove(path)
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass   # remaining.txt, or another scan's files
+
+    def mark_stored(self):
+        """Note that everything logged so far is in the health store (see :meth:`resume`)."""
+        self._write("D", {})
+        self.flush()
+
+    # --- RESUME ---
+    def resume(self, rebuild=None):
+        """Replay the log into a :class:`Resumed` and reopen the log for appending.
+
+        If the input was never fully spooled, ``rebuild(input)`` (the
+        ``input`` given to :meth:`start`) must return the input records again;
+        the ones already queued or settled are skipped. Without it the scan
+        resumes from what was queued.
+        """
+        meta, results, rows, stored, raw = {}, {}, {}, set(), {}
+        cursor = {"spooled": 0}
+        with open(self.log_path, encoding="utf-8") as fh:
+            for line in fh:
+                tag, _, payload = line.partition("\t")
+                try:
+                    obj = json.loads(payload)
+                except ValueError:
+                    continue  # torn write from a crash
+                if tag == "S": meta = obj
+                elif tag == "R":
+                    results[obj['Full_Address']] = obj
+                    raw[obj['Full_Address']] = line
+                elif tag == "M":
+                    rows[obj['Raw_IP']] = obj
+                    raw[("M", obj['Raw_IP'])] = line
+                elif tag == "Q": cursor = obj
+                elif tag == "D": stored = set(results)
+        if meta.get("targets"):
+            # A live node without its matrix row was interrupted mid-verification: scan it again
+            for addr in [a for a, r in results.items() if r['Status'] == "Working" and a not in rows]:
+                del results[addr]
+        rows = {a: row for a, row in rows.items() if a in results}
+        stored &= set(results)
+        if not cursor.get("done"): self._truncate_queue(cursor["spooled"])
+        # Compact the log to the settled state (original lines, no re-encoding), then keep appending to it
+        self._open("w")
+        self._write("S", meta)
+        self._fh.writelines(raw[addr] for addr in stored)
+        self._write("D", {})
+        self._fh.writelines(raw[addr] for addr in results if addr not in stored)
+        self._fh.writelines(raw[("M", addr)] for addr in rows)
+        self.flush()
+        settled = set(results)
+        self.replayable = bool(cursor.get("done") or rebuild and meta.get("input") is not None)
+        remaining = (rec for rec in load_queue(self.queue_path) if f"{rec.ip}:{rec.port}" not in settled)
+        if not cursor.get("done") and rebuild and meta.get("input") is not None:
+            # The queue is kept as-is and the rebuilt tail is teed onto its end, once the queue is done
+            remaining = itertools.chain(remaining, self._tee(self._rest(rebuild(meta["input"]), settled), cursor["spooled"]))
+        else:
+            self._write("Q", {"spooled": cursor["spooled"], "done": True})
+        self.flush()
+        pending = max(cursor["spooled"] - len(settled), 0)
+        return Resumed(meta, list(results.values()), list(rows.values()),
+                       [res for addr, res in results.items() if addr not in stored], remaining, pending)
+
+    def _rest(self, records, settled):
+        queued = AddressSet(address_key(rec.ip, rec.port) for rec in load_queue(self.queue_path))
+        for rec in records:
+            if address_key(rec.ip, rec.port) not in queued and f"{rec.ip}:{rec.port}" not in settled: yield rec
+
+    def _truncate_queue(self, lines):
+        # A crash can leave queue lines past the last logged cursor, the final one possibly torn
+        with open(self.queue_path, "rb+") as fh:
+            for _ in range(lines): fh.readline()
+            fh.truncate()
@@ -0,0 +1,335 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import signal
+import sys
+import time
+
+from .checkpoint import RESUME_PATH, ScanLog, save_queue
+from .engine import (
+    CONNECT_TIMEOUT, DEFAULT_CONCURRENCY, DEFAULT_TARGETS, JUDGE_URL, TARGET_TIMEOUT,
+    get_real_ip, pipeline,
+)
+from .export import export_format, write_export
+from .gateway import GATEWAY_PORT, Gateway, serve_gateway
+from .geo import GEO_CACHE_PATH, default_resolver
+from .judge import JudgePool, serve_judge
+from .metrics import ScanMetrics, profiled, serve_metrics
+from .dedup import AddressSet
+from .parser import merge_sources
+from .progress import ProgressReporter, format_eta
+from .rank import SAMPLE_FIELDS, ProxyRanking
+from .shard import shard_of, sharded_pipeline
+from .store import FRESH_SECS, STORE_PATH, HealthStore
+from .throttle import SUBNET_RATE, TARGET_RATE, RateControl
+
+RESULT_FIELDS = ["IP", "Port", "Protocol", "Country", "ISP", "Latency", "Status", "Full_Address", "Anonymity",
+                 "Connect_ms", "Handshake_ms", "Reason", "Detected"]
+SCORE_FIELDS = ["Score"] + list(SAMPLE_FIELDS)   # written when any row has them
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(prog="netrunner", description="Headless NETRUNNER proxy scan.")
+    ap.add_argument("input", nargs="*", help="proxy list files, merged and deduplicated ('-' for stdin)")
+    ap.add_argument("-o", "--output", help="write results to .csv/.json/.jsonl/.txt (optionally .gz) or .parquet (default: CSV to stdout)")
+    ap.add_argument("-t", "--target", action="append", dest="targets", help="target URL for the matrix phase (repeatable)")
+    ap.add_argument("--targets-file", help="file with one target URL per line")
+    ap.add_argument("--must-have", action="append", help="finish a proxy's matrix row once these targets answered (repeatable)")
+    ap.add_argument("--no-matrix", action="store_true", help="skip target matrix verification")
+    ap.add_argument("-c", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help="checks in flight (the ceiling, unless --fixed-concurrency)")
+    ap.add_argument("-w", "--workers", type=int, default=1, help="scan in this many processes (0 = one per core)")
+    ap.add_argument("--shard", metavar="K/N", type=_shard_spec, help="only scan shard K of N (0-based), e.g. one slice per machine")
+    ap.add_argument("--fixed-concurrency", action="store_true", help="don't adapt concurrency to timeouts/latency")
+    ap.add_argument("--target-rate", type=float, default=TARGET_RATE, help="max requests/s per target host (default 0 = unlimited)")
+    ap.add_argument("--subnet-rate", type=float, default=SUBNET_RATE, help="max checks/s started per proxy /24 (0 = unlimited)")
+    ap.add_argument("--timeout", type=float, default=6, help="Phase 1 timeout in seconds")
+    ap.add_argument("--connect-timeout", type=float, default=CONNECT_TIMEOUT, help="TCP connect timeout in seconds (SOCKS/CONNECT handshakes get twice this)")
+    ap.add_argument("--target-timeout", type=float, default=TARGET_TIMEOUT, help="per-target timeout in seconds")
+    ap.add_argument("--protocol", default="AUTO", choices=["AUTO", "http", "socks4", "socks5"],
+                    help="protocol for unlabeled lines (AUTO fingerprints each node)")
+    ap.add_argument("--judge", action="append", dest="judges",
+                    help="judge URL echoing origin + headers, e.g. one started with --serve-judge (repeatable, round-robin)")
+    ap.add_argument("--no-geo", action="store_true", help="skip country/ISP lookups")
+    ap.add_argument("--geo-db", help="offline geo database (.mmdb or start,end,country CSV)")
+    ap.add_argument("--geo-cache", default=GEO_CACHE_PATH, help="on-disk geo lookup cache")
+    ap.add_argument("--geo-offline", action="store_true", help="never call ip-api; use cache/database only")
+    ap.add_argument("--store", default=STORE_PATH, help="persistent health store (SQLite)")
+    ap.add_argument("--no-store", action="store_true", help="don't read or write the health store")
+    ap.add_argument("--incremental", action="store_true", help="skip recently-checked proxies, back off dead ones")
+    ap.add_argument("--merge-history", nargs="?", const="all", choices=["all", "alive"],
+                    help="also queue the proxies in the health store (all, or only those alive last time)")
+    ap.add_argument("--fresh-hours", type=float, default=FRESH_SECS / 3600, help="incremental: live proxies younger than this are reused")
+    ap.add_argument("--alive-only", action="store_true", help="only write working proxies")
+    ap.add_argument("--samples", type=int, default=0, metavar="K",
+                    help="time K extra judge requests per live proxy over a warm connection (min/p50/p90/jitter/loss)")
+    ap.add_argument("--top", type=int, metavar="N", help="only write the N best-scoring live proxies, best first")
+    ap.add_argument("--top-for", metavar="URL", help="with --top: rank only proxies that reached this target")
+    ap.add_argument("--resume", action="store_true", help="continue the last interrupted scan from its checkpoint log")
+    ap.add_argument("--no-checkpoint", action="store_true", help="don't keep a checkpoint log of this scan")
+    ap.add_argument("--remaining", default=RESUME_PATH, metavar="PATH",
+                    help="on Ctrl-C, save the unchecked proxies here (a proxy list to resume from)")
+    ap.add_argument("--quiet", action="store_true", help="no live progress line on stderr")
+    ap.add_argument("--stats", action="store_true", help="print per-stage timings (connect, handshake, judge, ...) at the end")
+    ap.add_argument("--metrics", metavar="PATH", help="keep Prometheus-format metrics in this file during the scan")
+    ap.add_argument("--metrics-port", metavar="[HOST:]PORT", help="serve Prometheus metrics at /metrics during the scan")
+    ap.add_argument("--profile", metavar="PATH", help="run under cProfile; dump stats here and print the top entries")
+    ap.add_argument("--gateway", nargs="?", const=str(GATEWAY_PORT), metavar="[HOST:]PORT",
+                    help=f"after the scan, serve the live proxies as one rotating HTTP/SOCKS5 proxy (default port {GATEWAY_PORT}); "
+                         "without input, serve the store's live proxies")
+    ap.add_argument("--serve-judge", metavar="[HOST:]PORT", help="run the built-in judge server instead of scanning")
+    return ap
+
+
+def _shard_spec(text):
+    k, _, n = text.partition("/")
+    if not (k.isdigit() and n.isdigit() and int(k) < int(n)): raise argparse.ArgumentTypeError("expected K/N with 0 <= K < N")
+    return int(k), int(n)
+
+
+def _read_lines(path):
+    if path == "-": return sys.stdin.read().splitlines()
+    with open(path, encoding="utf-8", errors="replace") as fh:
+        return fh.read().splitlines()
+
+
+def _open_input(path):
+    if path == "-": return sys.stdin
+    return open(path, encoding="utf-8", errors="replace")
+
+
+def _input_records(spec, store=None, seen=None):
+    # The scan's input stream, from a JSON-able spec (so a checkpoint can rebuild it)
+    with contextlib.ExitStack() as stack:
+        history = store.history(spec["history"] == "alive") if store and spec["history"] else ()
+        records = merge_sources([stack.enter_context(_open_input(path)) for path in spec["files"]], spec["protocol"], history, seen)
+        if spec["shard"]:
+            k, n = spec["shard"]
+            records = (p for p in records if shard_of(p, n) == k)
+        yield from records
+
+
+def _target_list(args):
+    if args.targets_file: return _read_lines(args.targets_file)
+    if args.targets: return args.targets
+    return DEFAULT_TARGETS.split("\n")
+
+
+def _host_port(spec, host):
+    h, _, port = spec.rpartition(":")
+    return h or host, int(port)
+
+
+def _stats_table(metrics):
+    lines = [f"{'STAGE':<10} {'COUNT':>8} {'MEAN':>9} {'P50':>9} {'P90':>9} {'P99':>9} {'TOTAL':>9}"]
+    for row in metrics.summary():
+        lines.append(f"{row['Stage']:<10} {row['Count']:>8} {row['Mean_ms']:>7}ms {row['P50_ms']:>7}ms {row['P90_ms']:>7}ms "
+                     f"{row['P99_ms']:>7}ms {row['Total_s']:>8}s")
+    lines.append("OUTCOMES: " + "  ".join(f"{k}={v}" for k, v in metrics.reasons.most_common()))
+    return "\n".join(lines)
+
+
+async def _write_metrics(metrics, path, every=5.0):
+    while True:
+        metrics.write(path)
+        await asyncio.sleep(every)
+
+
+def _progress_line(snap, control=None):
+    total = f"/{snap['total']}" if snap['total'] else ""
+    width = f"  c={control.concurrency}" if control else ""
+    sys.stderr.write(f"\r{snap['done']}{total} checked  {snap['alive']} alive ({snap['alive_rate']:.0%})  "
+                     f"{snap['verified']} verified  {snap['rate']:.0f}/s{width}  ETA {format_eta(snap['eta'])}  ")
+    sys.stderr.flush()
+
+
+def write_results(results, matrix, path=None, alive_only=False):
+    """Write Phase 1 rows (merged with matrix columns); the format follows ``path``'s suffix.
+
+    Everything but ``.json`` is streamed in chunks (see :mod:`netrunner.export`).
+    """
+    rows = [r for r in results if not alive_only or r["Status"] == "Working"]
+    by_addr = {m["Raw_IP"]: m for m in matrix}
+    t_cols = [c for c in (matrix[0] if matrix else {}) if c not in ("Proxy", "Type", "Raw_IP")]
+    for r in rows:
+        m = by_addr.get(r["Full_Address"], {})
+        for c in t_cols: r[c] = m.get(c, "")
+
+    if path and path.endswith(".json"):
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, ensure_ascii=False, indent=1)
+        return
+    fields = RESULT_FIELDS + [f for f in SCORE_FIELDS if any(f in r for r in rows)] + t_cols
+    if path and export_format(path).startswith("txt"): fields = ["Full_Address"]
+    if not path:
+        write_export(rows, fields, sys.stdout.buffer)
+        return
+    with open(path, "wb") as fh:
+        write_export(rows, fields, fh, export_format(path))
+
+
+async def run(args):
+    judges = JudgePool(args.judges or [JUDGE_URL])
+    real_ip = await get_real_ip(judges)
+    started = time.perf_counter()
+    t_list = [] if args.no_matrix else _target_list(args)
+    log = None if args.no_checkpoint else ScanLog()
+    if log and not log.lock():
+        print("CHECKPOINT IN USE BY ANOTHER SCAN (wait for it to end, or pass --no-checkpoint)", file=sys.stderr)
+        return [], []
+    resolver = None if args.no_geo else default_resolver(args.geo_db, args.geo_cache, not args.geo_offline)
+    store = None if args.no_store else HealthStore(args.store)
+    cached, cached_matrix = [], []
+    resumed = None
+    seen = AddressSet()   # packed keys of every proxy queued from the inputs
+    metrics = ScanMetrics() if args.stats or args.metrics or args.metrics_port else None
+    server = await serve_metrics(metrics, *_host_port(args.metrics_port, "127.0.0.1")) if args.metrics_port else None
+    writer = asyncio.ensure_future(_write_metrics(metrics, args.metrics)) if args.metrics else None
+    with contextlib.ExitStack() as stack:
+        if args.resume:
+            resumed = log.resume(lambda spec: _input_records(spec, store))
+            t_list = resumed.meta.get("targets", [])
+            proxies, total = resumed.remaining, resumed.count
+            print(f"RESUMING: {len(resumed.results)} DONE, {total} LEFT", file=sys.stderr)
+        else:
+            spec = {"files": [p if p == "-" else os.path.abspath(p) for p in args.input], "protocol": args.protocol,
+                    "history": args.merge_history, "shard": args.shard}
+            proxies = stack.enter_context(contextlib.closing(_input_records(spec, store, seen)))
+            if store and args.incremental:
+                proxies, skipped = store.plan(proxies, args.fresh_hours * 3600)
+                cached, cached_matrix = store.cached_results(skipped)
+                print(f"INCREMENTAL: {len(proxies)} DUE, {len(skipped)} SKIPPED", file=sys.stderr)
+            total = len(proxies) if isinstance(proxies, list) else 0
+            # The queue is teed into the checkpoint as the pipeline pulls it; a resume after
+            # a crash re-reads the inputs past it (stdin can't be re-read)
+            if log: proxies, total = log.start(proxies, t_list, None if "-" in args.input else spec)
+        control = RateControl(args.concurrency, not args.fixed_concurrency, target_rate=args.target_rate, subnet_rate=args.subnet_rate)
+        sharded = args.workers != 1
+        progress = None
+        if not args.quiet and sys.stderr.isatty():
+            # A sharded scan's adaptive limits live in the workers
+            progress = ProgressReporter(total, lambda snap: _progress_line(snap, None if sharded else control), interval=0.5)
+
+        def on_result(res):
+            if log: log.record(res)
+            if progress: progress.result(res)
+
+        def on_row(row):
+            if log: log.record_row(row)
+            if store: store.record_row(row)
+            if progress: progress.row(row)
+
+        # First Ctrl-C: abort in-flight checks, keep partial results, save what's left
+        stop = []
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, lambda: (stop.append(True), loop.remove_signal_handler(signal.SIGINT)))
+        except (NotImplementedError, RuntimeError):
+            pass  # no loop signal handlers (Windows): Ctrl-C stays a hard KeyboardInterrupt
+
+        def on_stop(remaining):
+            if log and log.replayable:
+                # Resume rebuilds the unread rest of the input: reading it all now would only delay the stop
+                print("\nSTOPPED: UNCHECKED PROXIES KEPT IN THE CHECKPOINT (resume: python -m netrunner --resume)", file=sys.stderr)
+                return
+            count = save_queue(remaining, args.remaining)
+            print(f"\nSTOPPED: {count} UNCHECKED SAVED TO {args.remaining}"
+                  + (" (resume: python -m netrunner --resume)" if log else f" (resume: python -m netrunner {args.remaining})"),
+                  file=sys.stderr)
+
+        options = dict(on_result=on_result, on_row=on_row, should_stop=lambda: bool(stop), judges=judges, geo=resolver,
+                       must_have=args.must_have, connect_timeout=args.connect_timeout, on_stop=on_stop, control=control,
+                       metrics=metrics, samples=args.samples)
+        if sharded:
+            results, matrix = await sharded_pipeline(proxies, t_list, args.timeout, real_ip, args.workers or None,
+                                                     args.concurrency, args.target_timeout, **options)
+        else:
+            results, matrix = await pipeline(proxies, t_list, args.timeout, real_ip, args.concurrency, args.target_timeout,
+                                             **options)
+        if progress:
+            progress.flush()
+            sys.stderr.write("\n")
+    if server: server.close()
+    if writer:
+        writer.cancel()
+        metrics.write(args.metrics)
+    if args.stats: print(_stats_table(metrics), file=sys.stderr)
+    if resolver: resolver.cache.close()
+    if store:
+        # Recorded after the pipeline so geo fields resolved off the hot path are included
+        for r in itertools.chain(resumed.unstored if resumed else (), results): store.record(r)
+        store.close()
+    if log:
+        if stop:
+            if store: log.mark_stored()
+            log.close()
+        else:
+            log.finish()
+    if resumed:
+        results = resumed.results + results
+        matrix = resumed.rows + matrix
+    results += cached
+    matrix += cached_matrix
+    if not results:
+        print("STOPPED BEFORE ANY NODE FINISHED." if stop else "NO VALID NODES DETECTED. CHECK INPUT FORMAT.", file=sys.stderr)
+        return [], []
+    alive = sum(r["Status"] == "Working" for r in results)
+    print(f"SCAN: {alive}/{len(results)} ALIVE, {len(matrix)} VERIFIED in {time.perf_counter() - started:.1f}s"
+          + (f", {seen.duplicates} DUPLICATES DROPPED" if seen.duplicates else ""), file=sys.stderr)
+    return results, matrix
+
+
+def _serve_judge(spec):
+    try:
+        asyncio.run(serve_judge(*_host_port(spec, "0.0.0.0")))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _serve_gateway(results, matrix, spec):
+    gateway = Gateway(ProxyRanking(results, matrix))
+    if not len(gateway.ranking):
+        print("GATEWAY: NO LIVE PROXIES TO SERVE.", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(serve_gateway(gateway, *_host_port(spec, "127.0.0.1")))
+    except KeyboardInterrupt:
+        pass
+    stats = gateway.stats()
+    print(f"GATEWAY: {stats['Connections']} CONNECTIONS, {stats['Failed']} FAILED, {stats['Evicted']} UPSTREAMS EVICTED",
+          file=sys.stderr)
+    return 0
+
+
+def _stored_live(path):
+    store = HealthStore(path)
+    try:
+        return store.cached_results(list(store.history(alive_only=True)))
+    finally:
+        store.close()
+
+
+def main(argv=None):
+    ap = build_parser()
+    args = ap.parse_args(argv)
+    if args.serve_judge: return _serve_judge(args.serve_judge)
+    if args.resume and (args.no_checkpoint or not ScanLog().exists()): ap.error("no checkpoint to resume")
+    if not args.input and not args.resume and not args.merge_history:
+        if args.gateway and not args.no_store: return _serve_gateway(*_stored_live(args.store), args.gateway)
+        ap.error("an input file is required unless --serve-judge, --resume, --merge-history or --gateway is given")
+    if args.merge_history and args.no_store: ap.error("--merge-history needs the health store")
+    if args.top_for and not args.top: ap.error("--top-for needs --top")
+    if args.samples < 0: ap.error("--samples must be >= 0")
+    with profiled(args.profile, out=sys.stderr) if args.profile else contextlib.nullcontext():
+        results, matrix = asyncio.run(run(args))
+    if not results: return 1
+    written = ProxyRanking(results, matrix).top(args.top, args.top_for) if args.top else results
+    write_results(written, matrix, args.output, args.alive_only)
+    if args.gateway:
+        sys.stdout.flush()
+        return _serve_gateway(results, matrix, args.gateway)
+    return 0
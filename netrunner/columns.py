@@ -0,0 +1,226 @@
+import math
+import socket
+import struct
+from array import array
+
+_NAN = float("nan")
+_UNPACK_IP = struct.Struct("!I")
+
+
+def pack_ip(ip):
+    try:
+        return _UNPACK_IP.unpack(socket.inet_aton(ip))[0]
+    except (OSError, TypeError):
+        return 0   # unparseable dotted quad (e.g. 999.1.1.1): such nodes never pass Phase 1 anyway
+
+
+def unpack_ip(n):
+    return socket.inet_ntoa(_UNPACK_IP.pack(n))
+
+
+class Categorical:
+    """Dictionary-encoded string column: one small int per row plus the distinct values once."""
+
+    def __init__(self, typecode="b"):
+        self.codes = array(typecode)
+        self.categories = []
+        self._index = {}
+
+    def code(self, value):
+        if value is None: return -1
+        c = self._index.get(value)
+        if c is None:
+            c = self._index[value] = len(self.categories)
+            self.categories.append(value)
+            if c > _MAX_CODE[self.codes.typecode]:
+                self.codes = array(_WIDER[self.codes.typecode], self.codes)
+        return c
+
+    def append(self, value):
+        c = self.code(value)   # may swap in a wider codes array
+        self.codes.append(c)
+
+    def __getitem__(self, i):
+        c = self.codes[i]
+        return None if c < 0 else self.categories[c]
+
+    def nbytes(self):
+        return self.codes.itemsize * len(self.codes)
+
+
+_MAX_CODE = {"b": 127, "h": 32767, "i": 2 ** 31 - 1}
+_WIDER = {"b": "h", "h": "i"}
+
+
+def _detach(col):
+    # A pandas/numpy view pins the buffer; copy the column so it can keep growing
+    return array(col.typecode, col)
+
+
+class ResultTable:
+    """Phase 1 results as typed, array-backed columns.
+
+    IPv4 is packed into a uint32, the port into a uint16, string fields are
+    dictionary-encoded and Latency / Connect_ms / Handshake_ms are float32
+    with NaN where there is no value (dead nodes). A row costs ~30 bytes
+    instead of a ~1.5 KB dict. The scoring fields (``Score`` and the latency
+    samples) get float32 columns too, added the first time a result carries
+    them, so scans without them don't pay for them. :meth:`row` rounds the
+    float32 values back to what ``check_proxy``/``score`` produced (whole ms,
+    ``Score`` to one decimal). :meth:`frame` exposes
+    the numeric columns to pandas as zero-copy views.
+    """
+
+    CATEGORIES = ("Protocol", "Status", "Anonymity", "Country", "ISP", "Reason", "Detected")
+    FLOATS = ("Latency", "Connect_ms", "Handshake_ms")
+    OPTIONAL = ("Score", "Min_ms", "P50_ms", "P90_ms", "Jitter_ms", "Loss_pct")
+    DECIMALS = {"Score": 1}   # everything else is whole milliseconds / percent
+
+    def __init__(self):
+        self.ip = array("I")
+        self.port = array("H")
+        self.cats = {name: Categorical("i" if name == "ISP" else "b") for name in self.CATEGORIES}
+        self.floats = {name: array("f") for name in self.FLOATS}
+
+    def __len__(self):
+        return len(self.ip)
+
+    def append(self, res):
+        alive = res['Status'] == "Working"
+        try:
+            self.ip.append(pack_ip(res['IP']))
+        except BufferError:
+            self._unpin()
+            self.ip.append(pack_ip(res['IP']))
+        self.port.append(int(res['Port']) & 0xFFFF)
+        for name, col in self.cats.items(): col.append(res.get(name))
+        for name in self.OPTIONAL:
+            if name not in self.floats and res.get(name) is not None:
+                self.floats[name] = array("f", [_NAN]) * (len(self.ip) - 1)
+        for name, col in self.floats.items():
+            value = res.get(name)
+            col.append(_NAN if value is None or (name == "Latency" and not alive) else value)
+
+    def extend(self, results):
+        for res in results: self.append(res)
+        return self
+
+    @classmethod
+    def from_records(cls, results):
+        return cls().extend(results)
+
+    def _unpin(self):
+        self.ip, self.port = _detach(self.ip), _detach(self.port)
+        for col in self.cats.values(): col.codes = _detach(col.codes)
+        for name in self.floats: self.floats[name] = _detach(self.floats[name])
+
+    def row(self, i):
+        """Rebuild the result dict for row ``i`` (the shape ``check_proxy`` returns)."""
+        ip, port = unpack_ip(self.ip[i]), str(self.port[i])
+        res = {"IP": ip, "Port": port, "Full_Address": f"{ip}:{port}"}
+        for name, col in self.cats.items(): res[name] = col[i]
+        for name, col in self.floats.items():
+            value = col[i]
+            res[name] = None if math.isnan(value) else round(value, self.DECIMALS.get(name))
+        if res['Latency'] is None: res['Latency'] = 99999
+        return res
+
+    def records(self, start=0):
+        return (self.row(i) for i in range(start, len(self)))
+
+    def nbytes(self):
+        return (self.ip.itemsize * len(self.ip) + self.port.itemsize * len(self.port)
+                + sum(c.nbytes() for c in self.cats.values())
+                + sum(c.itemsize * len(c) for c in self.floats.values()))
+
+    def frame(self):
+        """A pandas DataFrame over the columns (IP as uint32; see :func:`with_addresses`)."""
+        import numpy as np
+        import pandas as pd
+        data = {"IP": np.frombuffer(self.ip, dtype=np.uint32), "Port": np.frombuffer(self.port, dtype=np.uint16)}
+        for name, col in self.cats.items(): data[name] = _categorical(col)
+        for name, col in self.floats.items():
+            data[name] = np.frombuffer(col, dtype=np.float32)
+        return pd.DataFrame(data, copy=False)
+
+
+def with_addresses(df):
+    """Add dotted ``IP`` and ``Full_Address`` string columns to a (filtered) :meth:`ResultTable.frame`.
+
+    Strings are only materialised for the rows being shown or exported.
+    """
+    df = df.copy()
+    ips = [unpack_ip(n) for n in df['IP'].tolist()]
+    df['IP'] = ips
+    df['Full_Address'] = [f"{ip}:{port}" for ip, port in zip(ips, df['Port'].tolist())]
+    return df
+
+
+class MatrixTable:
+    """Phase 2 matrix rows: one dictionary-encoded code column per target URL."""
+
+    def __init__(self, targets=()):
+        self.ip = array("I")
+        self.port = array("H")
+        self.protocol = Categorical()
+        self.targets = {}
+        for url in targets: self._target(url)
+
+    def __len__(self):
+        return len(self.ip)
+
+    def _target(self, url):
+        col = self.targets.get(url)
+        if col is None:
+            col = self.targets[url] = Categorical()
+            for _ in range(len(self.ip)): col.append(None)
+        return col
+
+    def append(self, row):
+        for key in row:
+            if key not in ("Proxy", "Type", "Raw_IP"): self._target(key)
+        ip, _, port = row['Raw_IP'].rpartition(":")
+        try:
+            self.ip.append(pack_ip(ip))
+        except BufferError:
+            self._unpin()
+            self.ip.append(pack_ip(ip))
+        self.port.append(int(port) & 0xFFFF)
+        self.protocol.append(row['Type'])
+        for url, col in self.targets.items(): col.append(row.get(url))
+
+    def extend(self, rows):
+        for row in rows: self.append(row)
+        return self
+
+    @classmethod
+    def from_records(cls, rows):
+        return cls().extend(rows)
+
+    def _unpin(self):
+        self.ip, self.port = _detach(self.ip), _detach(self.port)
+        self.protocol.codes = _detach(self.protocol.codes)
+        for col in self.targets.values(): col.codes = _detach(col.codes)
+
+    def row(self, i):
+        addr = f"{unpack_ip(self.ip[i])}:{self.port[i]}"
+        out = {"Proxy": addr, "Type": self.protocol[i], "Raw_IP": addr}
+        for url, col in self.targets.items(): out[url] = col[i]
+        return out
+
+    def records(self):
+        return (self.row(i) for i in range(len(self)))
+
+    def frame(self):
+        import pandas as pd
+        # Only live nodes reach the matrix, so the address strings stay few
+        addr = [f"{unpack_ip(ip)}:{port}" for ip, port in zip(self.ip, self.port)]
+        data = {"Proxy": addr, "Type": _categorical(self.protocol), "Raw_IP": addr}
+        for url, col in self.targets.items(): data[url] = _categorical(col)
+        return pd.DataFrame(data, copy=False)
+
+
+def _categorical(col):
+    import numpy as np
+    import pandas as pd
+    return pd.Categorical.from_codes(np.frombuffer(col.codes, dtype=col.codes.typecode), col.categories)
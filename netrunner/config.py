@@ -0,0 +1,4 @@
+import os
+
+# Where persistent state (geo cache, health store, checkpoints) lives
+DATA_DIR = os.environ.get("NETRUNNER_HOME", os.path.join(os.path.expanduser("~"), ".netrunner"))
@@ -0,0 +1,124 @@
+"""Canonical proxy addresses and a compact set of them, for dedup across huge inputs.
+
+An ``ip:port`` becomes one 48-bit integer (``ip << 16 | port``), so
+``1.1.1.1:80``, ``http://1.1.1.1:80`` and ``001.001.001.001:80`` are the same
+node. :class:`AddressSet` holds tens of millions of such keys at about four
+bytes each, where a ``set`` of address strings costs well over a hundred.
+"""
+import socket
+import struct
+from array import array
+from bisect import bisect_left
+
+_BUCKETS = 1 << 16   # one per first-two-octets prefix
+SPLIT_AT = 4096      # a bucket this large is split by third octet (keeps inserts short on a dense /16)
+_UNPACK_IP = struct.Struct("!I").unpack
+
+
+def address_key(ip, port):
+    """The 48-bit key of a dotted-quad IPv4 address and port, or None if any octet or the port is out of range.
+
+    Octets are read as decimal, so ``"010.0.0.1"`` is 10.0.0.1 (``inet_aton``
+    would read it as octal 8.0.0.1).
+    """
+    try:
+        port = int(port)
+    except (ValueError, TypeError):
+        return None
+    if not 0 < port <= 0xFFFF: return None
+    try:
+        packed = socket.inet_aton(ip)
+        if socket.inet_ntoa(packed) == ip: return _UNPACK_IP(packed)[0] << 16 | port   # already canonical
+    except (OSError, TypeError, ValueError):
+        pass
+    parts = ip.split(".") if isinstance(ip, str) else ()
+    if len(parts) != 4 or not all(p.isascii() and p.isdigit() for p in parts): return None
+    a, b, c, d = map(int, parts)
+    if not (a <= 255 and b <= 255 and c <= 255 and d <= 255): return None
+    return (a << 40) | (b << 32) | (c << 24) | (d << 16) | port
+
+
+def key_address(key):
+    """The canonical ``(ip, port)`` strings of a key from :func:`address_key`."""
+    return f"{key >> 40}.{(key >> 32) & 255}.{(key >> 24) & 255}.{(key >> 16) & 255}", str(key & 0xFFFF)
+
+
+class AddressSet:
+    """Exact set of address keys, about 4 bytes per member.
+
+    Keys are bucketed by their first two octets; each bucket is a sorted
+    ``array("I")`` of the remaining 32 bits (last two octets and the port),
+    searched with bisect and grown by an in-place insert. A bucket past
+    ``SPLIT_AT`` keys becomes 256 such arrays, one per third octet, so a
+    densely scanned /16 doesn't turn every insert into a long memmove. Being
+    exact matters here: a Bloom filter's false positives would silently drop
+    real proxies.
+    ``duplicates`` counts the adds that found their key already present.
+    """
+
+    def __init__(self, keys=()):
+        self._buckets = [None] * _BUCKETS
+        self._len = 0
+        self.duplicates = 0
+        self.update(keys)
+
+    def __len__(self):
+        return self._len
+
+    def _bucket(self, key, create):
+        hi, low = key >> 32, key & 0xFFFFFFFF
+        bucket = self._buckets[hi]
+        if type(bucket) is list:
+            split, hi = bucket, low >> 24
+            bucket = split[hi]
+        else:
+            split = self._buckets
+        if bucket is None and create: bucket = split[hi] = array("I")
+        return bucket, low
+
+    def __contains__(self, key):
+        bucket, low = self._bucket(key, False)
+        if not bucket: return False
+        i = bisect_left(bucket, low)
+        return i < len(bucket) and bucket[i] == low
+
+    def add(self, key):
+        """Add ``key``; True if it was new."""
+        hi, low = key >> 32, key & 0xFFFFFFFF
+        bucket = self._buckets[hi]
+        if bucket is None:
+            bucket = self._buckets[hi] = array("I")
+        elif type(bucket) is list:
+            bucket = bucket[low >> 24] or self._bucket(key, True)[0]
+        i = bisect_left(bucket, low)
+        if i < len(bucket) and bucket[i] == low:
+            self.duplicates += 1
+            return False
+        bucket.insert(i, low)
+        self._len += 1
+        if len(bucket) == SPLIT_AT and self._buckets[key >> 32] is bucket: self._split(key >> 32)
+        return True
+
+    def _split(self, hi):
+        split = [None] * 256
+        for low in self._buckets[hi]:
+            sub = split[low >> 24]
+            if sub is None: sub = split[low >> 24] = array("I")
+            sub.append(low)   # already in order
+        self._buckets[hi] = split
+
+    def update(self, keys):
+        for key in keys: self.add(key)
+        return self
+
+    def __iter__(self):
+        """Every key, in ascending (address, port) order."""
+        for hi, bucket in enumerate(self._buckets):
+            if not bucket: continue
+            base = hi << 32
+            for sub in (bucket if type(bucket) is list else [bucket]):
+                if sub:
+                    for low in sub: yield base | low
+
+    def nbytes(self):
+        return 4 * self._len
@@ -0,0 +1,72 @@
+import asyncio
+import ipaddress
+import struct
+
+DETECT_GRACE = 0.25   # how long other candidates may still answer once one protocol is confirmed
+PREFERENCE = ("socks5", "socks4", "http")
+# Reserved .invalid name: a proxy answers with a fast DNS-failure status, never loops or leaves the box
+HTTP_PROBE = b"HEAD http://netrunner.invalid/ HTTP/1.0\r\nHost: netrunner.invalid\r\n\r\n"
+
+
+def _socks4_probe(ip, port):
+    # CONNECT back to the proxy's own address: any 0x5A-0x5D reply proves SOCKS4
+    try: packed = ipaddress.IPv4Address(ip).packed
+    except ValueError: packed = b"\x00\x00\x00\x01"
+    return b"\x04\x01" + struct.pack("!H", int(port)) + packed + b"\x00"
+
+
+def _classify(protocol, reply):
+    if protocol == "socks5": return len(reply) >= 2 and reply[0] == 0x05 and reply[1] == 0x00
+    if protocol == "socks4": return len(reply) >= 2 and reply[0] == 0x00 and 0x5A <= reply[1] <= 0x5D
+    return reply.startswith(b"HTTP/")
+
+
+async def _probe(ip, port, protocol, connect_timeout):
+    """One connection, a few bytes out, a few bytes back. Returns ``(protocol, ok, reason)``."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, int(port)), connect_timeout)
+    except asyncio.TimeoutError:
+        return protocol, False, "CONNECT_TIMEOUT"
+    except (OSError, ValueError):
+        return protocol, False, "CONNECT_REFUSED"
+    try:
+        if protocol == "socks5": writer.write(b"\x05\x01\x00")
+        elif protocol == "socks4": writer.write(_socks4_probe(ip, port))
+        else: writer.write(HTTP_PROBE)
+        await writer.drain()
+        reply = await asyncio.wait_for(reader.read(8), 2 * connect_timeout)
+        return protocol, _classify(protocol, reply), "NO_PROTOCOL"
+    except (OSError, EOFError, asyncio.TimeoutError):
+        return protocol, False, "NO_PROTOCOL"
+    finally:
+        writer.close()
+
+
+async def detect_protocols(ip, port, connect_timeout, grace=DETECT_GRACE):
+    """Fingerprint ``ip:port`` as SOCKS5 / SOCKS4 / HTTP with parallel minimal handshakes.
+
+    Returns ``(protocols, reason)``: the protocols that answered, in preference
+    order (SOCKS5 > SOCKS4 > HTTP), and a failure reason when none did. Once one
+    protocol is confirmed the others get ``grace`` seconds before being dropped,
+    so a plain HTTP proxy doesn't wait out a silent SOCKS greeting.
+    """
+    tasks = [asyncio.ensure_future(_probe(ip, port, p, connect_timeout)) for p in PREFERENCE]
+    found, reasons = set(), set()
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=grace if found else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done: break  # grace expired
+            for task in done:
+                protocol, ok, reason = task.result()
+                if ok: found.add(protocol)
+                else: reasons.add(reason)
+    finally:
+        for task in pending: task.cancel()
+        if pending: await asyncio.gather(*pending, return_exceptions=True)
+    protocols = [p for p in PREFERENCE if p in found]
+    if protocols: return protocols, ""
+    for reason in ("NO_PROTOCOL", "CONNECT_TIMEOUT", "CONNECT_REFUSED"):
+        if reason in reasons: return [], reason
+    return [], "NO_PROTOCOL"
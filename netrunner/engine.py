@@ -0,0 +1,451 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import random
+import time
+
+from .detect import detect_protocols
+from .geo import default_resolver
+from .judge import ANON_UNKNOWN, classify_anonymity, judge_pool
+from .rank import sample_latency, score
+from .throttle import RateControl
+from .transport import NET_ERRORS, ProxySession, fetch, http_request, open_tunnel
+
+# --- CONSTANTS ---
+JUDGE_URL = "http://httpbin.org/get"
+REAL_IP_URL = "https://api.ipify.org"
+DEFAULT_CONCURRENCY = 500
+TARGET_TIMEOUT = 5
+CONNECT_TIMEOUT = 1.5  # stage 1 budget: dead ports fail here instead of burning the full timeout
+STOP_POLL = 0.1        # how often a running scan polls should_stop
+WARM_TTL = 2.0         # a live proxy's judge connection is kept this long for its matrix row
+
+DEFAULT_TARGETS = """http://10.16.100.244/
+http://172.16.50.4/
+http://new.circleftp.net/
+http://ftp.samonline.net/"""
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0"
+]
+
+
+# --- CHECKS ---
+async def get_real_ip(judges=None, timeout=3):
+    """Our public IP: asked of the judges first (and benching dead ones), then ipify."""
+    if judges is not None:
+        origin = await judge_pool(judges).probe(timeout)
+        if origin: return origin
+    try:
+        _, _, body = await asyncio.wait_for(fetch(REAL_IP_URL), timeout)
+        return body.decode().strip()
+    except NET_ERRORS:
+        return "Unknown"
+
+
+def new_result(ip, port, protocol):
+    return {
+        "IP": ip, "Port": port, "Protocol": protocol.upper(),
+        "Country": "-", "ISP": "Unknown", "Latency": 99999, "Status": "Dead",
+        "Full_Address": f"{ip}:{port}", "Anonymity": "Unknown",
+        "Connect_ms": None, "Handshake_ms": None, "Reason": "", "Detected": ""
+    }
+
+
+def _ms(since):
+    return round((time.perf_counter() - since) * 1000)
+
+
+async def check_proxy(proxy_data, timeout, real_ip, judge_url=JUDGE_URL, connect_timeout=CONNECT_TIMEOUT, session=None):
+    """Async equivalent of the Phase 1 ``check_proxy_basic`` check, run as staged probes.
+
+    0. for ``"auto"`` records, fingerprint the protocol (see :func:`detect_protocols`)
+    1. TCP connect to the proxy, bounded by ``connect_timeout``
+    2. protocol handshake (SOCKS4 request / SOCKS5 greeting + connect / CONNECT for https
+       judges), bounded by ``2 * connect_timeout``; a plain-HTTP judge through an HTTP
+       proxy has no handshake, so ``Handshake_ms`` stays empty there
+    3. the judge request for anonymity, only for survivors, within the rest of ``timeout``
+
+    ``proxy_data`` is an ``(ip, port, protocol)`` record such as :class:`ProxyRecord`.
+    Per-stage timings land in ``Connect_ms``/``Handshake_ms``; dead nodes get a ``Reason``.
+    With ``session`` (a :class:`ProxySession`, bound here to the detected protocol)
+    the judge request asks for keep-alive and a live proxy's connection is
+    parked in the session instead of closed, for the matrix row to reuse.
+    """
+    ip, port, protocol = proxy_data
+    result = new_result(ip, port, protocol)
+    headers = {'User-Agent': random.choice(USER_AGENTS)}
+    start = time.perf_counter()
+    deadline = start + timeout
+
+    # STAGE 0: FINGERPRINT UNLABELED NODES
+    if protocol == "auto":
+        detected, reason = await detect_protocols(ip, port, min(connect_timeout, timeout))
+        if not detected:
+            result['Reason'] = reason
+            return result
+        protocol = detected[0]
+        result['Protocol'] = protocol.upper()
+        result['Detected'] = "+".join(p.upper() for p in detected)
+        start = time.perf_counter()  # keep Latency comparable with labeled nodes
+
+    if session is not None: session.proxy = (protocol, ip, port)
+
+    # STAGE 1: TCP CONNECT
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, int(port)), min(connect_timeout, timeout))
+    except asyncio.TimeoutError:
+        result['Reason'] = "CONNECT_TIMEOUT"
+        return result
+    except (OSError, ValueError):
+        result['Reason'] = "CONNECT_REFUSED"
+        return result
+    result['Connect_ms'] = _ms(start)
+
+    parked = False
+    try:
+        # STAGE 2: PROTOCOL HANDSHAKE
+        stage = time.perf_counter()
+        try:
+            # A handshake is one or two round trips; a silent peer here is not speaking the protocol
+            absolute = await asyncio.wait_for(open_tunnel(reader, writer, protocol, judge_url),
+                                              min(deadline - stage, 2 * connect_timeout))
+        except asyncio.TimeoutError:
+            result['Reason'] = "HANDSHAKE_TIMEOUT"
+            return result
+        except NET_ERRORS:
+            result['Reason'] = "HANDSHAKE_FAILED"
+            return result
+        if not absolute: result['Handshake_ms'] = _ms(stage)
+
+        # STAGE 3: JUDGE REQUEST
+        try:
+            status, reply, body = await asyncio.wait_for(
+                http_request(reader, writer, judge_url, absolute, headers, keep_alive=session is not None),
+                deadline - time.perf_counter())
+        except asyncio.TimeoutError:
+            result['Reason'] = "HTTP_TIMEOUT"
+            return result
+        except NET_ERRORS:
+            result['Reason'] = "HTTP_ERROR"
+            return result
+        latency = _ms(start)
+        if session is not None and status == 200:
+            parked = session.park(judge_url, reader, writer, absolute, status, reply)
+    finally:
+        if not parked: writer.close()
+
+    if status != 200:
+        result['Reason'] = f"HTTP_{status}"
+        return result
+
+    result['Latency'] = latency
+    result['Status'] = "Working"
+
+    # ANONYMITY
+    try:
+        result['Anonymity'] = classify_anonymity(json.loads(body), real_ip)
+    except (ValueError, AttributeError):
+        result['Anonymity'] = ANON_UNKNOWN
+    return result
+
+
+def _judge_verdict(res):
+    # Only rate-limit/overload answers are the judge's fault; proxy-side failures say nothing about it
+    if res['Status'] == "Working": return True
+    if res['Reason'] in ("HTTP_429", "HTTP_503"): return False
+    return None
+
+
+async def _judged_check(pool, proxy, timeout, real_ip, connect_timeout, session=None):
+    url = pool.pick()
+    res = await check_proxy(proxy, timeout, real_ip, url, connect_timeout, session)
+    verdict = _judge_verdict(res)
+    if verdict is not None: pool.report(url, verdict)
+    return res
+
+
+async def _controlled_check(control, pool, proxy, timeout, real_ip, connect_timeout, metrics=None, samples=0, session=None):
+    # Rate wait first: a node queued behind its /24's bucket must not hold a concurrency slot
+    queued = time.perf_counter()
+    await control.subnet(proxy[0])
+    async with control.slots:
+        started = time.perf_counter()
+        res = await _judged_check(pool, proxy, timeout, real_ip, connect_timeout, session)
+        checked = time.perf_counter()
+        if samples and res['Status'] == "Working":
+            await sample_latency(res, pool.pick(), samples, timeout, {'User-Agent': random.choice(USER_AGENTS)}, session)
+            if metrics: metrics.observe("sample", _ms(checked))
+    control.report(res)
+    if metrics: metrics.check(res, (started - queued) * 1000, (checked - started) * 1000)
+    if res['Status'] == "Working": res['Score'] = score(res)
+    return res
+
+
+async def _controlled_row(control, res, target_urls, timeout, must_have, metrics=None, gate=None, session=None):
+    # Target tokens are reserved and waited for before any slot is taken, as in _controlled_check
+    queued = time.perf_counter()
+    await control.row([u.strip() for u in target_urls if u.strip()])
+    async with gate or contextlib.nullcontext(), control.slots:
+        started = time.perf_counter()
+        row = await check_target(res, target_urls, timeout, must_have, None, metrics, session)
+    control.report_row(row)
+    if metrics: metrics.row(row, (started - queued) * 1000, _ms(started))
+    return row
+
+
+def matrix_code(status):
+    if status == 200: return "ACCESS_GRANTED"
+    if status == 403: return "FORBIDDEN"
+    if status == 404: return "NOT_FOUND"
+    return f"ERR_{status}"
+
+
+async def check_target(proxy_data, target_urls, timeout=TARGET_TIMEOUT, must_have=None, control=None, metrics=None,
+                       session=None):
+    """Phase 2: fetch the target URLs through the proxy and record a matrix row.
+
+    Targets are fetched concurrently, so a row costs roughly the slowest target
+    rather than the sum; each takes its own connection from a
+    :class:`ProxySession`, the first one for a host (or for any plain-HTTP
+    target through an HTTP proxy) the warm judge connection ``session`` may
+    hold from Phase 1 (see :func:`pipeline`). The session is closed after the
+    row either way. With ``must_have``
+    the row is closed as soon as those targets have answered; targets still in
+    flight are cancelled and recorded as ``SKIPPED``. A :class:`RateControl`
+    paces requests per target host; the wait is not counted against ``timeout``.
+    ``metrics`` (a :class:`ScanMetrics`) times each target fetch.
+    """
+    ip = proxy_data.get('IP') or proxy_data.get('ip')
+    port = proxy_data.get('Port') or proxy_data.get('port')
+    protocol = proxy_data.get('Protocol') or proxy_data.get('protocol')
+    if session is None: session = ProxySession((protocol.lower(), ip, port), {'User-Agent': random.choice(USER_AGENTS)})
+
+    proxy_result = {
+        "Proxy": f"{ip}:{port}",
+        "Type": protocol.upper(),
+        "Raw_IP": f"{ip}:{port}"
+    }
+    urls = [u.strip() for u in target_urls if u.strip()]
+
+    async def probe(url):
+        if control: await control.target(url)
+        started = time.perf_counter()
+        try:
+            status, _, _ = await asyncio.wait_for(session.get(url), timeout)
+            proxy_result[url] = matrix_code(status)
+        except NET_ERRORS:
+            proxy_result[url] = "TIMEOUT"
+        if metrics: metrics.observe("target", _ms(started))
+
+    tasks = {url: asyncio.ensure_future(probe(url)) for url in dict.fromkeys(urls)}
+    try:
+        required = [tasks[u] for u in (must_have or ()) if u in tasks]
+        await asyncio.gather(*(required or tasks.values()))
+    finally:
+        for url, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                proxy_result[url] = "SKIPPED"
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        session.close()
+    # Keep columns in target order regardless of completion order
+    for url in urls: proxy_result[url] = proxy_result.pop(url)
+    return proxy_result
+
+
+# --- EXECUTION ---
+async def _pool(items, check, concurrency, on_result, should_stop, on_stop=None, inflight=None, keep=True):
+    """Run ``check`` over ``items`` with ``concurrency`` workers.
+
+    ``should_stop`` is polled every ``STOP_POLL`` seconds; once it is true the
+    workers are cancelled mid-check (their sockets close on the way out) and
+    ``on_stop`` receives an iterator over the unfinished items: the ones that
+    were in flight, then the untouched rest of ``items``. ``inflight`` lets the
+    caller settle an item early (see :func:`pipeline`). With ``keep=False``
+    results only go to ``on_result`` and the returned list stays empty.
+    """
+    results = []
+    source = iter(items)
+    inflight = {} if inflight is None else inflight   # id(item) -> item (result dicts aren't hashable)
+    stopped = False
+
+    async def worker():
+        for item in source:
+            inflight[id(item)] = item
+            res = await check(item)
+            inflight.pop(id(item), None)
+            if keep: results.append(res)
+            if on_result: on_result(res)
+
+    async def watch():
+        nonlocal stopped
+        while not should_stop(): await asyncio.sleep(STOP_POLL)
+        stopped = True
+        for w in workers: w.cancel()
+
+    workers = [asyncio.ensure_future(worker()) for _ in range(max(1, concurrency))]
+    watcher = asyncio.ensure_future(watch()) if should_stop else None
+    try:
+        await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        if watcher: watcher.cancel()
+        for w in workers: w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    for w in workers:
+        if not w.cancelled() and w.exception(): raise w.exception()
+    if stopped and on_stop: on_stop(itertools.chain(list(inflight.values()), source))
+    return results
+
+
+def _open_resolver(geo, metrics=None):
+    # geo=True -> default cached resolver, False/None -> no lookups, or a GeoResolver instance
+    resolver = default_resolver() if geo is True else (geo or None)
+    if resolver and metrics: resolver.metrics = metrics
+    return resolver
+
+
+async def _close_resolver(geo, resolver):
+    if resolver is None: return
+    await resolver.drain()
+    if geo is True: resolver.cache.close()
+
+
+async def scan(proxies, timeout, real_ip, concurrency=DEFAULT_CONCURRENCY, on_result=None, should_stop=None, judges=JUDGE_URL, geo=True,
+               connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None, samples=0):
+    """Run ``check_proxy`` over ``proxies`` with at most ``concurrency`` checks in flight.
+
+    ``proxies`` may be any iterable (including a lazy generator); it is consumed
+    incrementally by a fixed pool of worker coroutines, so memory stays flat.
+    ``on_result`` is called with each result dict as it completes. Country/ISP
+    are filled in by the ``geo`` resolver off the hot path, before this returns.
+    When ``should_stop()`` turns true, checks in flight are aborted, the
+    results so far are returned and ``on_stop`` gets the unchecked proxies.
+    A :class:`RateControl` (``control``) replaces the fixed ``concurrency``
+    with its own worker ceiling, adaptive limit and rate limits. Stage
+    timings go to ``metrics`` (a :class:`ScanMetrics`) when given. With
+    ``samples``, every live proxy is timed that many more times over a warm
+    connection (see :func:`sample_latency`); live results carry a ``Score``.
+    """
+    resolver = _open_resolver(geo, metrics)
+    pool = judge_pool(judges)
+    control = control or RateControl.fixed(concurrency)
+
+    async def check(proxy):
+        res = await _controlled_check(control, pool, proxy, timeout, real_ip, connect_timeout, metrics, samples)
+        if resolver and res['Status'] == "Working": resolver.submit(res)
+        return res
+
+    try:
+        return await _pool(proxies, check, control.workers, on_result, should_stop, on_stop)
+    finally:
+        await _close_resolver(geo, resolver)
+
+
+async def verify_targets(results, target_urls, timeout=TARGET_TIMEOUT, concurrency=DEFAULT_CONCURRENCY, on_result=None, should_stop=None, must_have=None,
+                         on_stop=None, control=None, metrics=None):
+    """Run ``check_target`` for every Phase 1 result and return the matrix rows."""
+    control = control or RateControl.fixed(concurrency)
+    return await _pool(results, lambda p: _controlled_row(control, p, target_urls, timeout, must_have, metrics), control.workers,
+                       on_result, should_stop, on_stop)
+
+
+async def pipeline(proxies, target_urls, timeout, real_ip, concurrency=DEFAULT_CONCURRENCY, target_timeout=TARGET_TIMEOUT,
+                   on_result=None, on_row=None, should_stop=None, judges=JUDGE_URL, geo=True, must_have=None,
+                   connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None, samples=0, keep=True):
+    """Phase 1 and Phase 2 as one pipelined pass.
+
+    Each worker checks a proxy and, if it came back Working, hands it to a
+    matrix task and moves on to the next proxy, so dead nodes never reach
+    Phase 2 and a paced or slow matrix never holds up Phase 1. Up to
+    ``concurrency`` rows run at once beside the workers. A live proxy's judge
+    connection is kept open for up to ``WARM_TTL`` seconds, so its row (and
+    any latency samples) can reuse it instead of connecting again. ``judges`` is a URL,
+    a list of URLs or a :class:`JudgePool`, rotated round-robin.
+    Returns ``(results, matrix)``; on a stop these are the partial results, and
+    ``on_stop`` gets the proxies whose Phase 1 check never completed. With a
+    :class:`RateControl` both stages also draw on its adaptive limit.
+    ``samples`` works as in :func:`scan`; a proxy's ``Score`` is updated
+    with its matrix success rate once its row is in. Callers that consume
+    ``on_result``/``on_row`` themselves pass ``keep=False``, so the scan is not
+    held twice; the returned lists are then empty.
+    """
+    target_urls = [u.strip() for u in target_urls if u.strip()]
+    resolver = _open_resolver(geo, metrics)
+    pool = judge_pool(judges)
+    control = control or RateControl.fixed(concurrency)
+    results, matrix = [], []
+    inflight = {}
+    rows, errors = set(), []
+    row_slots = asyncio.Semaphore(control.workers)
+
+    async def verify(res, session):
+        row = await _controlled_row(control, res, target_urls, target_timeout, must_have, metrics, row_slots, session)
+        res['Score'] = score(res, row)
+        if keep: matrix.append(row)
+        if on_row: on_row(row)
+
+    def settled(task):
+        rows.discard(task)
+        if not task.cancelled() and task.exception(): errors.append(task.exception())
+
+    async def check(proxy):
+        ip, port, protocol = proxy
+        session = ProxySession((protocol, ip, port), {'User-Agent': random.choice(USER_AGENTS)}) if target_urls else None
+        try:
+            res = await _controlled_check(control, pool, proxy, timeout, real_ip, connect_timeout, metrics, samples, session)
+        except BaseException:
+            if session: session.close()
+            raise
+        # Reported from here on: a stop during the matrix must not queue it again
+        inflight.pop(id(proxy), None)
+        if keep: results.append(res)
+        if on_result: on_result(res)
+        if res['Status'] == "Working" and resolver: resolver.submit(res)
+        if res['Status'] != "Working" or not target_urls or (should_stop and should_stop()):
+            if session: session.close()
+            return res
+        # A row still waiting for its slot when WARM_TTL runs out connects afresh
+        asyncio.get_running_loop().call_later(WARM_TTL, session.close)
+        task = asyncio.ensure_future(verify(res, session))
+        rows.add(task)
+        task.add_done_callback(settled)
+        return res
+
+    try:
+        await _pool(proxies, check, control.workers, None, should_stop, on_stop, inflight, keep=False)
+        # Rows still being verified after the last check; a stop abandons them
+        while rows and not errors and not (should_stop and should_stop()):
+            await asyncio.wait(rows, timeout=STOP_POLL)
+        if errors: raise errors[0]
+    finally:
+        for task in rows: task.cancel()
+        await asyncio.gather(*rows, return_exceptions=True)
+        await _close_resolver(geo, resolver)
+    return results, matrix
+
+
+def run_scan(proxies, timeout, real_ip, concurrency=DEFAULT_CONCURRENCY, on_result=None, should_stop=None, judges=JUDGE_URL, geo=True,
+             connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None, samples=0):
+    """Blocking wrapper around :func:`scan` for synchronous callers."""
+    return asyncio.run(scan(proxies, timeout, real_ip, concurrency, on_result, should_stop, judges, geo, connect_timeout, on_stop, control,
+                            metrics, samples))
+
+
+def run_pipeline(proxies, target_urls, timeout, real_ip, concurrency=DEFAULT_CONCURRENCY, target_timeout=TARGET_TIMEOUT,
+                 on_result=None, on_row=None, should_stop=None, judges=JUDGE_URL, geo=True, must_have=None,
+                 connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None, samples=0, keep=True):
+    """Blocking wrapper around :func:`pipeline`."""
+    return asyncio.run(pipeline(proxies, target_urls, timeout, real_ip, concurrency, target_timeout,
+                                on_result, on_row, should_stop, judges, geo, must_have, connect_timeout, on_stop, control, metrics,
+                                samples, keep))
+
+
+def run_verify(results, target_urls, timeout=TARGET_TIMEOUT, concurrency=DEFAULT_CONCURRENCY, on_result=None, should_stop=None, must_have=None,
+               on_stop=None, control=None, metrics=None):
+    """Blocking wrapper around :func:`verify_targets`."""
+    return asyncio.run(verify_targets(results, target_urls, timeout, concurrency, on_result, should_stop, must_have, on_stop, control,
+                                      metrics))
@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import zlib
+
+# --- FAILSAFE IMPORT ---
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+EXPORT_FORMATS = ("csv", "csv.gz", "txt", "txt.gz", "jsonl", "jsonl.gz") + (("parquet",) if PARQUET_AVAILABLE else ())
+CHUNK_ROWS = 5000
+MIME = {"csv": "text/csv", "txt": "text/plain", "jsonl": "application/x-ndjson",
+        "gz": "application/gzip", "parquet": "application/vnd.apache.parquet"}
+
+
+def _batches(rows, size=CHUNK_ROWS):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+
+def _csv_chunks(rows, fields):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    for batch in _batches(rows):
+        writer.writerows(batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell(): yield buf.getvalue().encode("utf-8")
+
+
+def _txt_chunks(rows, fields):
+    key = fields[0]
+    for batch in _batches(rows):
+        yield "".join(f"{row[key]}\n" for row in batch).encode("utf-8")
+
+
+def _jsonl_chunks(rows, fields):
+    for batch in _batches(rows):
+        yield "".join(json.dumps({k: row.get(k) for k in fields}, ensure_ascii=False, default=str) + "\n"
+                      for row in batch).encode("utf-8")
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip a stream of byte chunks incrementally."""
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = z.compress(chunk)
+        if out: yield out
+    yield z.flush()
+
+
+_WRITERS = {"csv": _csv_chunks, "txt": _txt_chunks, "jsonl": _jsonl_chunks}
+
+
+def export_format(path):
+    """Infer the export format from a file name (``.csv``, ``.txt.gz``, ``.parquet``, ...)."""
+    name = path.lower()
+    for fmt in sorted(EXPORT_FORMATS + ("parquet",), key=len, reverse=True):
+        if name.endswith("." + fmt): return fmt
+    return "csv"
+
+
+def iter_export(rows, fields, fmt="csv"):
+    """Serialise ``rows`` (dicts) as a stream of byte chunks, ``CHUNK_ROWS`` rows at a time.
+
+    ``txt`` writes only the first of ``fields`` (one address per line); a
+    ``.gz`` suffix on the format gzips the stream as it goes.
+    """
+    base, _, compressed = fmt.partition(".")
+    if base not in _WRITERS: raise ValueError(f"unsupported stream format: {fmt}")
+    chunks = _WRITERS[base](rows, fields)
+    return gzip_chunks(chunks) if compressed == "gz" else chunks
+
+
+def write_export(rows, fields, fh, fmt="csv"):
+    """Stream ``rows`` to the binary file object ``fh``; memory stays at one chunk."""
+    if fmt == "parquet":
+        if not PARQUET_AVAILABLE: raise RuntimeError("Parquet export needs pyarrow")
+        writer = None
+        for batch in _batches(rows):
+            table = pa.Table.from_pylist([{k: row.get(k) for k in fields} for row in batch])
+            if writer is None:
+                # All-null columns in the first batch would pin the type to null
+                schema = pa.schema([f.with_type(pa.string()) if pa.types.is_null(f.type) else f for f in table.schema])
+                writer = pq.ParquetWriter(fh, schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer: writer.close()
+        else: pq.write_table(pa.table({k: pa.array([], pa.string()) for k in fields}), fh)
+        return
+    for chunk in iter_export(rows, fields, fmt): fh.write(chunk)
+
+
+def mime_type(fmt):
+    return MIME["gz"] if fmt.endswith(".gz") else MIME[fmt]
@@ -0,0 +1,412 @@
+"""Rotating proxy gateway: one local endpoint in front of the verified proxies.
+
+Clients point at the gateway as an HTTP proxy (``CONNECT`` tunnels and
+absolute-form ``http://`` requests) or a SOCKS5 proxy, on the same port. Each
+connection is carried through one of the best-scoring live upstreams of a
+:class:`ProxyRanking`, taken in turn; when the destination host is one of
+the scan's matrix targets, only upstreams that reached it
+(``ACCESS_GRANTED``) are used. An upstream that fails ``evict_after`` times
+in a row is dropped from the rotation, and the request moves on to the next
+one. A clean refusal of the destination (a SOCKS error reply, a non-200
+CONNECT answer) is the destination's failure, not the upstream's: it only
+counts against an upstream once it refused several hosts other upstreams
+have reached. A plain-HTTP request only counts as served once the
+upstream's response head is back, so one that accepts connections and then
+hangs or answers garbage is evicted too.
+"""
+import asyncio
+import ipaddress
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import Counter, deque
+from urllib.parse import urlsplit
+
+from .engine import CONNECT_TIMEOUT
+from .transport import NET_ERRORS, ProxyError, TunnelRefused, tunnel
+
+# --- CONSTANTS ---
+GATEWAY_PORT = 8118
+ROTATE_TOP = 20          # rotate over this many best-scoring upstreams per target
+RETRIES = 3              # upstreams tried per client connection before giving up
+EVICT_AFTER = 2          # consecutive failures that drop an upstream from the rotation
+WARM_CONNECTIONS = 2     # pre-opened idle TCP connections kept per upstream in use
+IDLE_TTL = 15.0          # seconds an idle upstream connection is trusted (proxies reap idle sockets)
+HEAD_TIMEOUT = 10.0      # client must send its request head / SOCKS greeting within this
+RESPONSE_TIMEOUT = 30.0  # an upstream must start answering a plain-HTTP request within this
+BUFFER_BODY = 1 << 20    # request bodies up to this are buffered, so another upstream can retry them
+REACHED_KEEP = 4096      # destinations remembered as reachable (refusals for them count as upstream failures)
+HOP_HEADERS = ("connection", "keep-alive", "proxy-connection", "proxy-authorization", "te", "trailer", "upgrade")
+
+_SOCKS_OK = b"\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+_SOCKS_FAIL = b"\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00"
+_SOCKS_NO_COMMAND = b"\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00"
+
+
+# Failures that say nothing about the upstream: it refused the destination, or the name doesn't resolve / encode
+_DESTINATION_ERRORS = (TunnelRefused, socket.gaierror, UnicodeError)
+
+# --- UPSTREAM POOL ---
+class UpstreamPool:
+    """Warm TCP connections to upstream proxies.
+
+    A tunnel uses its connection up, so connections can't be reused after the
+    fact; instead the pool opens the next ones ahead of time, so a request
+    pays only the handshake, not the TCP connect to the proxy. Only upstreams
+    that have been used are kept warm.
+    """
+
+    def __init__(self, warm=WARM_CONNECTIONS, ttl=IDLE_TTL, connect_timeout=CONNECT_TIMEOUT):
+        self.warm, self.ttl, self.connect_timeout = warm, ttl, connect_timeout
+        self._idle = {}
+        self._tasks = set()
+
+    async def acquire(self, proxy):
+        """A connected ``(reader, writer)`` to ``proxy`` (``(protocol, ip, port)``), warm if one is idle."""
+        idle = self._idle.get(proxy)
+        now = time.monotonic()
+        conn = None
+        while idle and conn is None:
+            reader, writer, opened = idle.popleft()
+            if now - opened < self.ttl and not reader.at_eof() and not writer.is_closing(): conn = reader, writer
+            else: writer.close()
+        if conn is None: conn = await self._connect(proxy)
+        self._refill(proxy)
+        return conn
+
+    async def _connect(self, proxy):
+        return await asyncio.wait_for(asyncio.open_connection(proxy[1], int(proxy[2])), self.connect_timeout)
+
+    def _refill(self, proxy):
+        if not self.warm or proxy in self._idle and len(self._idle[proxy]) >= self.warm: return
+        task = asyncio.ensure_future(self._fill(proxy))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, proxy):
+        idle = self._idle.setdefault(proxy, deque())
+        try:
+            while len(idle) < self.warm:
+                reader, writer = await self._connect(proxy)
+                idle.append((reader, writer, time.monotonic()))
+        except NET_ERRORS:
+            pass
+
+    def drop(self, proxy):
+        for _, writer, _ in self._idle.pop(proxy, ()): writer.close()
+
+    def close(self):
+        for task in self._tasks: task.cancel()
+        for proxy in list(self._idle): self.drop(proxy)
+
+
+def _upstream(res):
+    protocol = res['Protocol'].lower()
+    return ("http" if protocol not in ("socks4", "socks5") else protocol), res['IP'], int(res['Port'])
+
+
+# --- GATEWAY ---
+class Gateway:
+    """The gateway over ``ranking`` (a :class:`ProxyRanking` of verified proxies).
+
+    ``rotate`` best upstreams per target are used in turn; each client
+    connection tries up to ``retries`` of them. The ranking is shared:
+    evictions are ``ranking.discard`` calls, and proxies added to it later
+    join the rotation.
+    """
+
+    def __init__(self, ranking, rotate=ROTATE_TOP, retries=RETRIES, evict_after=EVICT_AFTER, warm=WARM_CONNECTIONS,
+                 connect_timeout=CONNECT_TIMEOUT):
+        self.ranking = ranking
+        self.rotate, self.retries, self.evict_after = rotate, retries, evict_after
+        self.connect_timeout = connect_timeout
+        self.pool = UpstreamPool(warm, connect_timeout=connect_timeout)
+        self.server = None
+        self.requests = self.failed = 0
+        self.served = Counter()
+        self.evicted = []
+        self._strikes = Counter()
+        self._refused = {}   # address -> reachable hosts it refused since its last success
+        self._turn = Counter()
+        self._reached = {}   # host -> None, oldest first
+        self._hosts = {}
+        for url in ranking.targets(): self._hosts.setdefault(urlsplit(url).hostname, url)
+
+    # --- SELECTION ---
+    def candidates(self, host):
+        """Upstream results to try for ``host``, starting from this target's next turn in the rotation."""
+        target = self._hosts.get(host)
+        best = self.ranking.top(self.rotate, target) if target else []
+        if not best: target, best = None, self.ranking.top(self.rotate)
+        if not best: return []
+        turn = self._turn[target] % len(best)
+        self._turn[target] += 1
+        return best[turn:] + best[:turn]
+
+    def report(self, res, ok, refused=None):
+        """Record an upstream's outcome; ``refused`` is the host it cleanly refused, if that was the failure."""
+        addr = res['Full_Address']
+        if ok:
+            self._strikes.pop(addr, None)
+            self._refused.pop(addr, None)
+            self.served[addr] += 1
+            return
+        if refused is not None:
+            hosts = self._refused.setdefault(addr, set())
+            hosts.add(refused)
+            if len(hosts) < 2: return   # one destination going down says nothing about the upstream
+        self._strikes[addr] += 1
+        if self._strikes[addr] >= self.evict_after and addr in self.ranking:
+            self.ranking.discard(addr)
+            self.pool.drop(_upstream(res))
+            self._refused.pop(addr, None)
+            self.evicted.append(addr)
+
+    async def open(self, host, port, send=None, retries=None):
+        """Connect to ``host:port`` through the rotation; returns ``(reader, writer, head)``.
+
+        ``send`` carries a plain-HTTP request: ``await send(writer, absolute)``
+        writes it, in absolute form to HTTP upstreams (no CONNECT, as the
+        matrix check reached them). The upstream has then served the request
+        only once its response head (returned as ``head``, still to be
+        relayed) arrives within ``RESPONSE_TIMEOUT``; a 502/504 from an HTTP
+        upstream is its refusal of the host. Without ``send``, ``head`` is empty.
+
+        Raises :class:`TunnelRefused` as soon as an upstream cleanly refuses a
+        host no upstream has reached yet, and :class:`ProxyError` when every
+        upstream tried failed.
+        """
+        for res in self.candidates(host)[:retries or self.retries]:
+            proxy = _upstream(res)
+            try:
+                reader, writer = await self.pool.acquire(proxy)
+            except NET_ERRORS:
+                self.report(res, False)
+                continue
+            plain = send is not None and proxy[0] == "http"
+            head = b""
+            try:
+                if not plain: await asyncio.wait_for(tunnel(reader, writer, proxy[0], host, port), 2 * self.connect_timeout)
+                if send is not None:
+                    await send(writer, plain)
+                    head = await asyncio.wait_for(_response_head(reader, plain), RESPONSE_TIMEOUT)
+            except _DESTINATION_ERRORS as e:
+                writer.close()
+                # Nobody has reached this host: a bad URL must not drain the rotation
+                if host not in self._reached: raise TunnelRefused(f"{host}:{port} refused upstream ({e})") from e
+                self.report(res, False, refused=host)
+                continue
+            except NET_ERRORS:
+                writer.close()
+                self.report(res, False)
+                continue
+            self.report(res, True)
+            self._reached.pop(host, None)
+            self._reached[host] = None
+            if len(self._reached) > REACHED_KEEP: del self._reached[next(iter(self._reached))]
+            return reader, writer, head
+        raise ProxyError(f"no upstream reached {host}:{port}")
+
+    # --- CLIENTS ---
+    async def _client(self, reader, writer):
+        self.requests += 1
+        try:
+            first = await asyncio.wait_for(reader.readexactly(1), HEAD_TIMEOUT)
+            if first == b"\x05": await self._socks5(reader, writer)
+            else: await self._http(first, reader, writer)
+        except NET_ERRORS + (asyncio.IncompleteReadError,):
+            pass
+        except asyncio.CancelledError:
+            pass   # gateway shutting down with tunnels still open
+        finally:
+            writer.close()
+
+    async def _socks5(self, reader, writer):
+        methods = (await asyncio.wait_for(reader.readexactly(1), HEAD_TIMEOUT))[0]
+        await reader.readexactly(methods)
+        writer.write(b"\x05\x00")
+        ver, cmd, _, atyp = await asyncio.wait_for(reader.readexactly(4), HEAD_TIMEOUT)
+        if atyp == 0x01: host = str(ipaddress.IPv4Address(await reader.readexactly(4)))
+        elif atyp == 0x04: host = str(ipaddress.IPv6Address(await reader.readexactly(16)))
+        elif atyp == 0x03: host = (await reader.readexactly((await reader.readexactly(1))[0])).decode("idna")
+        else: raise ProxyError("SOCKS5 bad address type")
+        port = struct.unpack("!H", await reader.readexactly(2))[0]
+        if cmd != 0x01:
+            writer.write(_SOCKS_NO_COMMAND)
+            return
+        try:
+            up_reader, up_writer, _ = await self.open(host, port)
+        except ProxyError:
+            self.failed += 1
+            writer.write(_SOCKS_FAIL)
+            return
+        writer.write(_SOCKS_OK)
+        await _splice(reader, writer, up_reader, up_writer)
+
+    async def _http(self, first, reader, writer):
+        head = first + await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEAD_TIMEOUT)
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        if method == "CONNECT":
+            host, _, port = target.rpartition(":")
+            host, port = host.strip("[]"), int(port)
+        else:
+            parts = urlsplit(target)
+            if parts.scheme != "http" or not parts.hostname:
+                writer.write(b"HTTP/1.1 400 Bad Request\r\nConnection: close\r\nContent-Length: 0\r\n\r\n")
+                return
+            host, port = parts.hostname, parts.port or 80
+        send, retries = (None, None) if method == "CONNECT" else await _plain_request(lines, parts, reader, writer)
+        try:
+            up_reader, up_writer, response = await self.open(host, port, send, retries)
+        except ProxyError:
+            self.failed += 1
+            writer.write(b"HTTP/1.1 502 Bad Gateway\r\nConnection: close\r\nContent-Length: 0\r\n\r\n")
+            return
+        writer.write(response or b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await _splice(reader, writer, up_reader, up_writer)
+
+    # --- SERVER ---
+    async def start(self, host="127.0.0.1", port=GATEWAY_PORT):
+        self.server = await asyncio.start_server(self._client, host, port, backlog=1024)
+        return self.server
+
+    def close(self):
+        if self.server: self.server.close()
+        self.pool.close()
+
+    def stats(self):
+        return {"Upstreams": len(self.ranking), "Connections": self.requests, "Failed": self.failed,
+                "Evicted": len(self.evicted), "Busiest": self.served.most_common(5)}
+
+
+async def _plain_request(lines, parts, reader, writer):
+    # One request per upstream connection: hop-by-hop headers go, the upstream closes after answering.
+    # Returns (send, retries): a body too big to buffer is streamed once, so it gets a single upstream
+    method, target, version = lines[0].split(" ", 2)
+    path = parts.path or "/"
+    if parts.query: path += "?" + parts.query
+    headers = [l for l in lines[1:] if l and l.split(":", 1)[0].strip().lower() not in HOP_HEADERS + ("expect",)]
+    if not any(l.lower().startswith("host:") for l in headers): headers.append(f"Host: {parts.netloc}")
+    fields = {l.split(":", 1)[0].strip().lower(): l.split(":", 1)[1].strip() for l in lines[1:] if ":" in l}
+    chunked = "chunked" in fields.get("transfer-encoding", "").lower()
+    length = int(fields.get("content-length", "0") or 0)
+    # The body is read here, before any upstream answers, so answer Expect ourselves
+    if (chunked or length) and fields.get("expect", "").lower() == "100-continue":
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+    body = b"" if chunked or length > BUFFER_BODY else await asyncio.wait_for(reader.readexactly(length), HEAD_TIMEOUT)
+    tail = "".join(l + "\r\n" for l in headers + ["Connection: close"]).encode("latin-1") + b"\r\n" + body
+
+    async def send(up_writer, absolute):
+        up_writer.write(f"{method} {target if absolute else path} {version}\r\n".encode("latin-1") + tail)
+        if chunked: await _copy_chunked(reader, up_writer)
+        elif length > BUFFER_BODY: await _copy(reader, up_writer, length)
+        await up_writer.drain()
+
+    return send, (1 if chunked or length > BUFFER_BODY else None)
+
+
+async def _response_head(reader, absolute):
+    head = await reader.readuntil(b"\r\n\r\n")
+    try:
+        status = int(head.split(b"\r\n", 1)[0].split(b" ", 2)[1])
+    except (IndexError, ValueError):
+        raise ProxyError("Malformed HTTP status line")
+    # Through a tunnel a 502/504 is the origin's own answer; from an HTTP upstream it is the proxy's
+    if absolute and status in (502, 504): raise TunnelRefused(f"upstream answered {status}")
+    return head
+
+
+async def _copy(reader, writer, length):
+    while length:
+        data = await reader.readexactly(min(length, 65536))
+        writer.write(data)
+        await writer.drain()
+        length -= len(data)
+
+
+async def _copy_chunked(reader, writer):
+    while True:
+        line = await reader.readuntil(b"\r\n")
+        writer.write(line)
+        size = int(line.split(b";")[0].strip() or b"0", 16)
+        if size == 0: break
+        await _copy(reader, writer, size + 2)
+    while True:   # trailers, up to the blank line
+        line = await reader.readuntil(b"\r\n")
+        writer.write(line)
+        if line == b"\r\n": return
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data: break
+            writer.write(data)
+            await writer.drain()
+    except OSError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _splice(reader, writer, up_reader, up_writer):
+    # Both directions until either side closes
+    tasks = [asyncio.ensure_future(_pipe(reader, up_writer)), asyncio.ensure_future(_pipe(up_reader, writer))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        up_writer.close()
+
+
+async def serve_gateway(gateway, host="127.0.0.1", port=GATEWAY_PORT):
+    server = await gateway.start(host, port)
+    # stderr: the CLI may be writing results to stdout
+    print(f"GATEWAY ONLINE: http://{host}:{port} + socks5://{host}:{port} OVER {len(gateway.ranking)} PROXIES", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        gateway.close()
+
+
+# --- BACKGROUND ---
+class GatewayThread(threading.Thread):
+    """Run a :class:`Gateway` on its own event loop in a daemon thread (for the Streamlit UI)."""
+
+    def __init__(self, gateway, host="127.0.0.1", port=GATEWAY_PORT):
+        super().__init__(name="netrunner-gateway", daemon=True)
+        self.gateway, self.host, self.port = gateway, host, port
+        self.error = None
+        self.ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+    def run(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self.gateway.start(self.host, self.port))
+        except OSError as e:
+            self.error = e
+        self.ready.set()
+        if self.error is None: self._loop.run_forever()
+        self.gateway.close()
+        tasks = asyncio.all_tasks(self._loop)   # tunnels still open
+        for task in tasks: task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self._loop.close()
+
+    def start(self):
+        """Start serving; raises the bind error (port in use, ...) if there was one."""
+        super().start()
+        self.ready.wait()
+        if self.error: raise self.error
+        return self
+
+    def stop(self, timeout=5):
+        if self._loop.is_running(): self._loop.call_soon_threadsafe(self._loop.stop)
+        self.join(timeout)
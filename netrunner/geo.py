@@ -0,0 +1,253 @@
+import asyncio
+import csv
+import ipaddress
+import json
+import os
+import sqlite3
+import time
+from array import array
+from bisect import bisect_right
+
+from .config import DATA_DIR
+from .transport import NET_ERRORS, fetch
+
+# --- FAILSAFE IMPORT ---
+try:
+    import maxminddb
+    MMDB_AVAILABLE = True
+except ImportError:
+    MMDB_AVAILABLE = False
+
+# --- CONSTANTS ---
+GEO_CACHE_PATH = os.path.join(DATA_DIR, "geo_cache.sqlite")
+GEO_BATCH_URL = "http://ip-api.com/batch?fields=status,query,countryCode,isp"
+GEO_BATCH_SIZE = 100  # ip-api batch endpoint limit
+GEO_TTL = 14 * 86400
+GEO_FAIL_TTL = 86400  # ip-api "fail" answers (reserved / unannounced ranges) are retried after a day
+GEO_UNKNOWN = ("-", "Unknown")
+GEO_MAX_ENTRIES = 500_000
+
+
+def ip_to_int(ip):
+    return int(ipaddress.IPv4Address(ip))
+
+
+# --- OFFLINE DATABASES ---
+class RangeDatabase:
+    """Sorted IPv4 range table searched with bisect.
+
+    Loads CSVs whose first two columns are the range start/end (dotted quads or
+    integers, e.g. IP2Location LITE / DB-IP exports); ``country_col`` and the
+    optional ``isp_col`` pick the label columns.
+    """
+
+    def __init__(self, path, country_col=2, isp_col=None):
+        rows = []
+        with open(path, newline="", encoding="utf-8", errors="replace") as fh:
+            for row in csv.reader(fh):
+                try:
+                    start, end = (int(v) if v.isdigit() else ip_to_int(v) for v in row[:2])
+                except (ValueError, IndexError):
+                    continue  # header / malformed line
+                isp = row[isp_col] if isp_col is not None and len(row) > isp_col else ""
+                rows.append((start, end, row[country_col] if len(row) > country_col else "-", isp))
+        rows.sort()
+        self._starts = array("L", (r[0] for r in rows))
+        self._ends = array("L", (r[1] for r in rows))
+        # Interned label table keeps millions of ranges to a few MB
+        labels, self._label_idx = {}, array("L")
+        for _, _, country, isp in rows:
+            self._label_idx.append(labels.setdefault((country, isp), len(labels)))
+        self._labels = list(labels)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, ip):
+        n = ip_to_int(ip)
+        i = bisect_right(self._starts, n) - 1
+        if i < 0 or n > self._ends[i]: return None
+        country, isp = self._labels[self._label_idx[i]]
+        return country or "-", isp or "Unknown"
+
+
+class MMDBDatabase:
+    """MaxMind-format database (GeoLite2/GeoIP2 Country, City, ASN or ISP)."""
+
+    def __init__(self, path):
+        if not MMDB_AVAILABLE:
+            raise RuntimeError("maxminddb is not installed; pip install maxminddb or use a CSV range database")
+        self._reader = maxminddb.open_database(path)
+
+    def lookup(self, ip):
+        rec = self._reader.get(ip)
+        if not rec: return None
+        country = (rec.get("country") or rec.get("registered_country") or {}).get("iso_code", "-")
+        isp = rec.get("isp") or rec.get("organization") or rec.get("autonomous_system_organization") or "Unknown"
+        return country, isp
+
+
+def open_database(path):
+    """Open an offline geo database, picking the format from the file extension."""
+    if path.lower().endswith(".mmdb"): return MMDBDatabase(path)
+    return RangeDatabase(path)
+
+
+# --- CACHE ---
+class GeoCache:
+    """On-disk ip -> (country, isp) cache with TTL expiry and LRU trimming."""
+
+    def __init__(self, path=GEO_CACHE_PATH, ttl=GEO_TTL, max_entries=GEO_MAX_ENTRIES):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS geo (ip INTEGER PRIMARY KEY, country TEXT, isp TEXT, fetched REAL, used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS geo_used ON geo(used)")
+        self._touched = set()
+
+    def get(self, ip):
+        n = ip_to_int(ip)
+        row = self._db.execute("SELECT country, isp, fetched FROM geo WHERE ip = ?", (n,)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl: return None
+        self._touched.add(n)
+        return row[0], row[1]
+
+    def put_many(self, entries, ttl=None):
+        """Store ``{ip: (country, isp)}`` in one transaction; a shorter ``ttl`` backdates them to expire sooner."""
+        now = time.time()
+        fetched = now - max(0, self.ttl - ttl) if ttl is not None else now
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO geo (ip, country, isp, fetched, used) VALUES (?, ?, ?, ?, ?)",
+                [(ip_to_int(ip), c, i, fetched, now) for ip, (c, i) in entries.items()])
+
+    def flush(self):
+        """Persist LRU timestamps for hits and trim the oldest entries past ``max_entries``."""
+        now = time.time()
+        with self._db:
+            if self._touched:
+                self._db.executemany("UPDATE geo SET used = ? WHERE ip = ?", [(now, n) for n in self._touched])
+                self._touched.clear()
+            excess = self._db.execute("SELECT COUNT(*) FROM geo").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._db.execute("DELETE FROM geo WHERE ip IN (SELECT ip FROM geo ORDER BY used LIMIT ?)", (excess,))
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+
+# --- RESOLVER ---
+class GeoResolver:
+    """Fills Country/ISP on result dicts without blocking the scan.
+
+    Lookups go cache -> offline database -> batched ip-api requests. Network
+    lookups are collected by a background task and sent ``GEO_BATCH_SIZE`` at a
+    time, honouring ip-api's rate-limit headers; results are patched in place.
+    Private and reserved addresses (common in BDIX lists) are never sent, and
+    ip-api's ``fail`` answers are cached for ``GEO_FAIL_TTL``, so a rescan
+    doesn't ask about them again.
+    """
+
+    def __init__(self, cache=None, database=None, network=True, batch_url=GEO_BATCH_URL):
+        self.cache = cache
+        self.database = database
+        self.network = network
+        self.batch_url = batch_url
+        self.network_calls = 0
+        self.metrics = None   # a ScanMetrics times each batch call when set
+        self._pending = {}
+        self._queue = None
+        self._task = None
+
+    def _local(self, ip):
+        if self.cache is not None:
+            hit = self.cache.get(ip)
+            if hit: return hit
+        if self.database is not None:
+            hit = self.database.lookup(ip)
+            if hit:
+                if self.cache is not None: self.cache.put_many({ip: hit})
+                return hit
+        return None
+
+    def submit(self, result):
+        """Resolve ``result['IP']`` now if known locally, otherwise queue it for a batch call."""
+        ip = result['IP']
+        hit = self._local(ip)
+        if hit:
+            result['Country'], result['ISP'] = hit
+            return
+        if not self.network or not _is_global(ip): return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        waiting = self._pending.setdefault(ip, [])
+        waiting.append(result)
+        if len(waiting) == 1: self._queue.put_nowait(ip)
+
+    async def _run(self):
+        while True:
+            ip = await self._queue.get()
+            if ip is None: return
+            batch = [ip]
+            # Give concurrent workers a moment to fill the batch
+            try:
+                while len(batch) < GEO_BATCH_SIZE:
+                    nxt = await asyncio.wait_for(self._queue.get(), 0.5)
+                    if nxt is None:
+                        await self._resolve(batch)
+                        return
+                    batch.append(nxt)
+            except asyncio.TimeoutError:
+                pass
+            await self._resolve(batch)
+
+    async def _resolve(self, batch):
+        resolved, failed = {}, {}
+        started = time.perf_counter()
+        try:
+            self.network_calls += 1
+            _, headers, body = await asyncio.wait_for(
+                fetch(self.batch_url, method="POST", body=json.dumps(batch).encode(),
+                      headers={"Content-Type": "application/json"}), 10)
+            for entry in json.loads(body):
+                if entry.get("status") == "success":
+                    resolved[entry["query"]] = (entry["countryCode"], entry["isp"])
+                elif entry.get("status") == "fail":
+                    failed[entry["query"]] = GEO_UNKNOWN
+            if headers.get("x-rl") == "0":
+                await asyncio.sleep(int(headers.get("x-ttl", "60")) + 1)
+        except NET_ERRORS + (KeyError, TypeError):
+            pass
+        if self.metrics: self.metrics.observe("geo_batch", (time.perf_counter() - started) * 1000)
+        if resolved and self.cache is not None:
+            self.cache.put_many(resolved)
+        if failed and self.cache is not None:
+            self.cache.put_many(failed, GEO_FAIL_TTL)
+        for ip in batch:
+            hit = resolved.get(ip)
+            for result in self._pending.pop(ip, []):
+                if hit: result['Country'], result['ISP'] = hit
+
+    async def drain(self):
+        """Wait for queued lookups to finish and persist the cache."""
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._queue = self._task = None
+        if self.cache is not None: self.cache.flush()
+
+
+def _is_global(ip):
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+def default_resolver(database_path=None, cache_path=GEO_CACHE_PATH, network=True):
+    """Resolver with the persistent cache, an optional offline database and ip-api fallback."""
+    return GeoResolver(GeoCache(cache_path), open_database(database_path) if database_path else None, network)
@@ -0,0 +1,153 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+
+from .transport import NET_ERRORS, fetch
+
+# --- CONSTANTS ---
+ANON_ELITE = "🛡️ ELITE"
+ANON_ANONYMOUS = "🎭 ANONYMOUS"
+ANON_TRANSPARENT = "⚠️ TRANSPARENT"
+ANON_UNKNOWN = "❓ UNKNOWN"
+
+# Headers that give away a proxy hop even when the client IP is hidden
+PROXY_HEADERS = (
+    "via", "x-forwarded-for", "forwarded", "x-real-ip", "x-forwarded", "forwarded-for",
+    "client-ip", "x-client-ip", "x-originating-ip", "x-proxy-id", "proxy-connection", "x-bluecoat-via",
+)
+_IP_RE = re.compile(r"\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b")
+
+JUDGE_PORT = 8899
+JUDGE_FAILS_TO_BENCH = 3
+JUDGE_BENCH_SECS = 60
+
+
+def classify_anonymity(payload, real_ip):
+    """Grade a judge echo (``{"origin": ..., "headers": {...}}``) as elite / anonymous / transparent.
+
+    Transparent: our real IP shows up in the origin or a forwarding header
+    (:data:`PROXY_HEADERS`). Anonymous: it doesn't, but proxy headers (Via,
+    X-Forwarded-For, ...) do. Elite: neither. Other headers are not searched:
+    ``Host`` carries the judge's own address, which is the scanner's public
+    IP when the judge is self-hosted.
+    """
+    origin = str(payload.get("origin", ""))
+    headers = {str(k).lower(): str(v) for k, v in (payload.get("headers") or {}).items()}
+    if not origin and not headers: return ANON_UNKNOWN
+    seen = set(_IP_RE.findall(origin + " " + " ".join(v for h, v in headers.items() if h in PROXY_HEADERS)))
+    if real_ip and real_ip != "Unknown" and real_ip in seen:
+        return ANON_TRANSPARENT
+    if any(h in headers for h in PROXY_HEADERS):
+        return ANON_ANONYMOUS
+    return ANON_ELITE
+
+
+# --- JUDGE POOL ---
+class JudgePool:
+    """Round-robin over judge URLs with simple health tracking.
+
+    A judge that answers with a server error / rate limit (or garbage) counts a
+    failure; after ``JUDGE_FAILS_TO_BENCH`` in a row it sits out
+    ``JUDGE_BENCH_SECS``. Proxy-side failures (timeouts, refused tunnels) are
+    not the judge's fault and are not reported here.
+    """
+
+    def __init__(self, urls):
+        self.urls = list(dict.fromkeys(u.strip() for u in urls if u.strip()))
+        if not self.urls: raise ValueError("JudgePool needs at least one judge URL")
+        self._cycle = itertools.cycle(self.urls)
+        self.fails = dict.fromkeys(self.urls, 0)
+        self.served = dict.fromkeys(self.urls, 0)
+        self._benched = {}
+
+    def pick(self):
+        now = time.monotonic()
+        for _ in range(len(self.urls)):
+            url = next(self._cycle)
+            if self._benched.get(url, 0) <= now:
+                self.served[url] += 1
+                return url
+        # Everything benched: fall back to the judge that comes back soonest
+        url = min(self.urls, key=lambda u: self._benched.get(u, 0))
+        self.served[url] += 1
+        return url
+
+    def report(self, url, ok):
+        if url not in self.fails: return
+        if ok:
+            self.fails[url] = 0
+            return
+        self.fails[url] += 1
+        if self.fails[url] >= JUDGE_FAILS_TO_BENCH:
+            self._benched[url] = time.monotonic() + JUDGE_BENCH_SECS
+            self.fails[url] = 0
+
+    def healthy(self):
+        now = time.monotonic()
+        return [u for u in self.urls if self._benched.get(u, 0) <= now]
+
+    async def probe(self, timeout=5):
+        """Hit every judge directly; bench the dead ones. Returns our origin IP as the judges see it."""
+        async def one(url):
+            try:
+                status, _, body = await asyncio.wait_for(fetch(url), timeout)
+                origin = json.loads(body).get("origin", "").split(",")[0].strip() if status == 200 else None
+            except NET_ERRORS + (AttributeError,):
+                origin = None
+            if origin is None:
+                self._benched[url] = time.monotonic() + JUDGE_BENCH_SECS
+            return origin
+        origins = [o for o in await asyncio.gather(*(one(u) for u in self.urls)) if o]
+        return origins[0] if origins else None
+
+
+def judge_pool(judges):
+    """Accept a URL, a list of URLs or an existing :class:`JudgePool`."""
+    if isinstance(judges, JudgePool): return judges
+    if isinstance(judges, str): return JudgePool([judges])
+    return JudgePool(judges)
+
+
+# --- BUILT-IN JUDGE SERVER ---
+async def _handle(reader, writer):
+    peer = (writer.get_extra_info("peername") or ("",))[0]
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, _, rest = lines[0].partition(" ")
+            target = rest.rsplit(" ", 1)[0]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    k, v = line.split(":", 1)
+                    headers[k.strip()] = v.strip()
+            length = int(headers.get("Content-Length", "0") or 0)
+            if length: await reader.readexactly(length)
+            body = json.dumps({"origin": peer, "method": method, "url": target, "headers": headers}).encode()
+            close = headers.get("Connection", "").lower() == "close" or lines[0].endswith("HTTP/1.0")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\nConnection: %s\r\n\r\n" % (len(body), b"close" if close else b"keep-alive")
+                         + body)
+            await writer.drain()
+            if close: break
+    except (OSError, EOFError, asyncio.LimitOverrunError, ValueError):
+        pass
+    except asyncio.CancelledError:
+        pass   # server shutting down with keep-alive clients still connected
+    finally:
+        writer.close()
+
+
+async def start_judge(host="0.0.0.0", port=JUDGE_PORT):
+    """Start the judge server; it echoes the origin IP and request headers it saw as JSON."""
+    return await asyncio.start_server(_handle, host, port, backlog=4096)
+
+
+async def serve_judge(host="0.0.0.0", port=JUDGE_PORT):
+    server = await start_judge(host, port)
+    print(f"JUDGE ONLINE: http://{host}:{port}/get")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import cProfile
+import contextlib
+import io
+import os
+import pstats
+import time
+from collections import Counter
+
+# --- CONSTANTS ---
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+METRICS_PORT = 9464
+# Stages a scan reports, in the order the summary lists them
+STAGES = {
+    "wait": "rate-limit token + concurrency slot wait before a check",
+    "check": "whole Phase 1 check (fingerprint + connect + handshake + judge)",
+    "detect": "protocol fingerprinting of unlabeled nodes",
+    "connect": "TCP connect to the proxy",
+    "handshake": "SOCKS / CONNECT handshake",
+    "judge": "judge request through the tunnel, first byte to body",
+    "sample": "warm-connection latency samples of one live proxy",
+    "row": "whole matrix row (all targets)",
+    "target": "one target fetch through the proxy",
+    "geo_batch": "one batched ip-api lookup (including rate-limit backoff)",
+    "ui": "one progress render",
+}
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (ms): an observation is a bisect and a few adds."""
+
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)   # last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.count += 1
+        if ms > self.max: self.max = ms
+
+    def quantile(self, q):
+        """Estimate the ``q`` quantile by interpolating inside its bucket."""
+        if not self.count: return None
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = BUCKETS_MS[i - 1] if i else 0.0
+                hi = BUCKETS_MS[i] if i < len(BUCKETS_MS) else lo * 2
+                return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class ScanMetrics:
+    """Per-stage timing histograms and outcome counters for one scan.
+
+    The engine feeds it (``metrics=`` on :func:`pipeline` and friends); it can
+    be rendered as a summary table or in the Prometheus text format, written
+    to a file (:meth:`write`) or served (:func:`serve_metrics`) while the
+    scan runs.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.reasons = Counter()
+        self.cells = Counter()
+        self.started = time.time()
+
+    def observe(self, stage, ms):
+        h = self.stages.get(stage)
+        if h is None: h = self.stages[stage] = Histogram()
+        h.observe(ms)
+
+    def check(self, res, wait_ms, check_ms):
+        """Record one Phase 1 check from its result's stage timings."""
+        self.observe("wait", wait_ms)
+        self.observe("check", check_ms)
+        self.reasons[res['Reason'] or res['Status'].upper()] += 1
+        connect, handshake = res['Connect_ms'], res['Handshake_ms']
+        if connect is not None: self.observe("connect", connect)
+        if handshake is not None: self.observe("handshake", handshake)
+        if res['Status'] == "Working":
+            self.observe("judge", res['Latency'] - (connect or 0) - (handshake or 0))
+            # Latency restarts after fingerprinting, so the difference is the detection time
+            if res['Detected']: self.observe("detect", check_ms - res['Latency'])
+
+    def row(self, row, wait_ms, row_ms):
+        self.observe("wait", wait_ms)
+        self.observe("row", row_ms)
+        for key, value in row.items():
+            if key not in ("Proxy", "Type", "Raw_IP"): self.cells[value] += 1
+
+    def merge(self, other):
+        """Fold another scan's metrics (e.g. a shard worker's) into these."""
+        for stage, h in other.stages.items():
+            mine = self.stages.get(stage)
+            if mine is None: mine = self.stages[stage] = Histogram()
+            mine.counts = [a + b for a, b in zip(mine.counts, h.counts)]
+            mine.total += h.total
+            mine.count += h.count
+            mine.max = max(mine.max, h.max)
+        self.reasons.update(other.reasons)
+        self.cells.update(other.cells)
+        return self
+
+    def timed(self, stage, fn):
+        """Wrap ``fn`` so every call is observed under ``stage`` (e.g. a UI render callback)."""
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.observe(stage, (time.perf_counter() - t0) * 1000)
+        return wrapper
+
+    # --- OUTPUT ---
+    def summary(self):
+        """One dict per stage seen: count, mean / p50 / p90 / p99 (ms) and total seconds."""
+        rows = []
+        for stage in sorted(self.stages, key=lambda s: list(STAGES).index(s) if s in STAGES else len(STAGES)):
+            h = self.stages[stage]
+            rows.append({"Stage": stage, "Count": h.count, "Mean_ms": round(h.total / h.count, 1),
+                         "P50_ms": round(h.quantile(0.5), 1), "P90_ms": round(h.quantile(0.9), 1),
+                         "P99_ms": round(h.quantile(0.99), 1), "Total_s": round(h.total / 1000, 2)})
+        return rows
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format (seconds, per convention)."""
+        out = ["# HELP netrunner_stage_seconds Time spent per scan stage.",
+               "# TYPE netrunner_stage_seconds histogram"]
+        for stage, h in self.stages.items():
+            cumulative = 0
+            for le, n in zip(BUCKETS_MS + (None,), h.counts):
+                cumulative += n
+                bound = "+Inf" if le is None else repr(le / 1000)
+                out.append(f'netrunner_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            out.append(f'netrunner_stage_seconds_sum{{stage="{stage}"}} {h.total / 1000:.6f}')
+            out.append(f'netrunner_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        out += ["# HELP netrunner_checks_total Phase 1 checks by outcome.", "# TYPE netrunner_checks_total counter"]
+        out += [f'netrunner_checks_total{{outcome="{k}"}} {v}' for k, v in sorted(self.reasons.items())]
+        out += ["# HELP netrunner_matrix_cells_total Matrix cells by code.", "# TYPE netrunner_matrix_cells_total counter"]
+        out += [f'netrunner_matrix_cells_total{{code="{k}"}} {v}' for k, v in sorted(self.cells.items())]
+        out += ["# HELP netrunner_scan_start_time_seconds Unix time the scan started.",
+                "# TYPE netrunner_scan_start_time_seconds gauge", f"netrunner_scan_start_time_seconds {self.started:.3f}"]
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        """Atomically write :meth:`prometheus` to ``path`` (for node_exporter's textfile collector)."""
+        with open(path + ".tmp", "w", encoding="utf-8") as fh:
+            fh.write(self.prometheus())
+        os.replace(path + ".tmp", path)
+
+
+# --- EXPORT ---
+async def serve_metrics(metrics, host="127.0.0.1", port=METRICS_PORT):
+    """Serve ``metrics`` at ``http://host:port/metrics`` from the running loop; returns the server."""
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = metrics.prometheus().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+
+# --- PROFILING ---
+@contextlib.contextmanager
+def profiled(path=None, top=25, out=None):
+    """Run the block under cProfile; dump stats to ``path`` and/or print the ``top`` entries to ``out``.
+
+    Deterministic profiling roughly doubles the cost of a Python-heavy scan;
+    use it to find hotspots, not to measure throughput.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path: profiler.dump_stats(path)
+        if out is not None: out.write(profile_report(profiler, top))
+
+
+def profile_report(profiler, top=25):
+    buf = io.StringIO()
+    pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(top)
+    return buf.getvalue()
@@ -0,0 +1,121 @@
+import re
+from collections import namedtuple
+
+from .dedup import AddressSet, address_key, key_address
+
+# Compact per-proxy record (a tuple, ~1/4 the size of the old dict rows)
+ProxyRecord = namedtuple("ProxyRecord", ["ip", "port", "protocol"])
+
+# --- PRECOMPILED PATTERNS ---
+_IP_PORT = re.compile(r"(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d+)")
+_IPV4 = re.compile(r"\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}")
+_URI = re.compile(r'(?:(?P<proto>[a-z0-9]+)://)?(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(?P<port>\d+)', re.IGNORECASE)
+_WS = re.compile(r"\s+")
+
+
+def _sniff_proto(text):
+    if "socks5" in text: return "socks5"
+    if "socks4" in text: return "socks4"
+    if "https" in text: return "https"
+    if "http" in text: return "http"
+    return None
+
+
+def parse_line(line, force_proto="AUTO"):
+    """Parse one stripped, non-empty line into ``(ip, port, protocol)`` or None.
+
+    The address comes back canonical (``001.002.003.004:0080`` -> ``1.2.3.4``,
+    ``80``); lines with an octet over 255 or a port outside 1-65535 are None.
+    """
+    parsed = _parse(line, force_proto)
+    return None if parsed is None else parsed[1:]
+
+
+def _parse(line, force_proto):
+    # -> (address key, ip, port, protocol) or None, with the address canonical
+    parsed = _parse_raw(line, force_proto)
+    if parsed is None: return None
+    ip, port, protocol = parsed
+    key = address_key(ip, port)
+    if key is None: return None
+    if ip[0] == "0" or ".0" in ip or port[0] == "0": ip, port = key_address(key)
+    return key, ip, port, protocol
+
+
+def _parse_raw(line, force_proto):
+    # FAST PATH: bare "ip:port" (the bulk of scraped lists)
+    match = _IP_PORT.fullmatch(line)
+    if match:
+        return match.group(1), match.group(2), force_proto if force_proto != "AUTO" else "auto"
+
+    parsed_ip, parsed_port, parsed_proto = None, None, None
+
+    # STRATEGY 1: Tab/Space Separated (e.g., "1.1.1.1 8080 SOCKS5")
+    parts = _WS.split(line, 3)
+    if len(parts) >= 2 and parts[1].isdigit() and _IPV4.fullmatch(parts[0]):
+        parsed_ip, parsed_port = parts[0], parts[1]
+        if len(parts) >= 3:
+            parsed_proto = _sniff_proto(parts[2].lower())
+
+    # STRATEGY 2: Standard URI or IP:Port
+    if not parsed_ip:
+        match = _URI.search(line)
+        if not match: return None
+        parsed_ip, parsed_port, parsed_proto = match.group('ip'), match.group('port'), match.group('proto')
+
+    # FINALIZE PROTOCOL
+    if parsed_proto:
+        return parsed_ip, parsed_port, parsed_proto.lower()
+    if force_proto != "AUTO":
+        return parsed_ip, parsed_port, force_proto
+    # Fallback sniff from text; unlabeled nodes are fingerprinted by the engine
+    return parsed_ip, parsed_port, _sniff_proto(line.lower()) or "auto"
+
+
+def iter_proxies(lines, force_proto="AUTO", seen=None):
+    """Lazily yield a :class:`ProxyRecord` per unique ``ip:port`` found in ``lines``.
+
+    ``lines`` can be any iterable of str (a file object, a list, a generator), so
+    scanning can start on the first record while the rest is still being read.
+    Addresses are canonicalised and deduplicated on their packed key (the
+    first occurrence, and its protocol label, wins); pass an
+    :class:`AddressSet` as ``seen`` to dedup across several calls.
+    """
+    seen = AddressSet() if seen is None else seen
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        parsed = _parse(line, force_proto)
+        if parsed is None or not seen.add(parsed[0]): continue
+        yield ProxyRecord(*parsed[1:])
+
+
+def unique(records, seen=None):
+    """Drop ``(ip, port, protocol)`` records whose address is invalid or already in ``seen``."""
+    seen = AddressSet() if seen is None else seen
+    for rec in records:
+        key = address_key(rec[0], rec[1])
+        if key is not None and seen.add(key): yield ProxyRecord(*key_address(key), rec[2])
+
+
+def merge_sources(sources, force_proto="AUTO", history=(), seen=None):
+    """One deduplicated record stream over several line ``sources`` (files, uploads), then ``history``.
+
+    ``history`` is an iterable of records, such as :meth:`HealthStore.history`;
+    its proxies are only yielded when no source listed them. Everything is
+    streamed: the only state is the :class:`AddressSet` of packed keys.
+    """
+    seen = AddressSet() if seen is None else seen
+    for lines in sources: yield from iter_proxies(lines, force_proto, seen)
+    yield from unique(history, seen)
+
+
+def iter_lines(stream, encoding="utf-8"):
+    """Yield decoded lines from a binary stream (e.g. an upload) without reading it whole."""
+    for raw in stream:
+        yield raw.decode(encoding, "replace")
+
+
+def parse_proxies(lines, force_proto="AUTO"):
+    """Eager form of :func:`iter_proxies`, returning a list of records."""
+    return list(iter_proxies(lines, force_proto))
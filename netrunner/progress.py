@@ -0,0 +1,78 @@
+import time
+from collections import deque
+
+PROGRESS_INTERVAL = 0.25   # seconds between renders (at most 4 UI updates per second)
+RATE_WINDOW = 5.0          # throughput is measured over this trailing window
+LOG_KEEP = 60
+
+
+class ProgressReporter:
+    """Coalesce per-result progress into at most one ``render`` call per ``interval``.
+
+    The engine callbacks (``result`` / ``row`` / ``log``) only bump counters and
+    buffer log lines, so a 100k-node scan costs 100k integer increments instead
+    of 100k UI updates. ``render`` receives a snapshot dict::
+
+        {"done", "total", "alive", "verified", "elapsed", "rate", "eta", "alive_rate", "logs"}
+
+    where ``rate`` is results/s over the last ``RATE_WINDOW`` seconds, ``eta``
+    is seconds left (None while unknown) and ``logs`` holds the lines buffered
+    since the previous render.
+    """
+
+    def __init__(self, total, render, interval=PROGRESS_INTERVAL, clock=time.monotonic):
+        self.total = total
+        self.done = self.alive = self.verified = 0
+        self._render = render
+        self._interval = interval
+        self._clock = clock
+        self._started = self._last = clock()
+        self._samples = deque([(self._started, 0)])
+        self._logs = deque(maxlen=LOG_KEEP)
+
+    # --- ENGINE CALLBACKS ---
+    def result(self, res):
+        self.done += 1
+        if res['Status'] == "Working":
+            self.alive += 1
+            self._logs.append(f"ALIVE: {res['IP']} ({res['Anonymity']})")
+        self._tick()
+
+    def row(self, row):
+        self.verified += 1
+        self._tick()
+
+    def log(self, message):
+        self._logs.append(message)
+
+    def _tick(self):
+        if self._clock() - self._last >= self._interval: self.flush()
+
+    # --- RENDERING ---
+    def snapshot(self):
+        now = self._clock()
+        samples = self._samples
+        samples.append((now, self.done))
+        while len(samples) > 2 and now - samples[1][0] >= RATE_WINDOW: samples.popleft()
+        t0, d0 = samples[0]
+        rate = (self.done - d0) / (now - t0) if now > t0 else 0.0
+        left = max(self.total - self.done, 0)
+        logs = list(self._logs)
+        self._logs.clear()
+        return {
+            "done": self.done, "total": self.total, "alive": self.alive, "verified": self.verified,
+            "elapsed": now - self._started, "rate": rate, "eta": left / rate if rate and self.total else None,
+            "alive_rate": self.alive / self.done if self.done else 0.0, "logs": logs,
+        }
+
+    def flush(self):
+        """Render now, regardless of the throttle (call once more when the scan ends)."""
+        self._last = self._clock()
+        self._render(self.snapshot())
+
+
+def format_eta(seconds):
+    if seconds is None: return "--:--"
+    seconds = int(seconds)
+    if seconds >= 3600: return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
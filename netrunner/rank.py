@@ -0,0 +1,155 @@
+"""Multi-sample latency scoring and a ranked index of live proxies.
+
+Phase 1 ``Latency`` is a single cold request (TCP connect, handshake and
+judge round trip in one wall-clock sample), so it is a poor way to order
+proxies. :func:`sample_latency` times several requests over one warm
+keep-alive connection instead, and :func:`score` folds those samples, their
+loss and the matrix success rate into one number. :class:`ProxyRanking`
+keeps live proxies ordered by that score, overall and per target.
+"""
+import asyncio
+import time
+from bisect import bisect_left, insort
+
+from .transport import NET_ERRORS, ProxySession
+
+# --- CONSTANTS ---
+SAMPLES = 5              # warm requests timed per live proxy when sampling is on
+JITTER_WEIGHT = 1.0      # ms of score per ms of jitter
+MATRIX_WEIGHT = 0.5      # share of the reliability term that comes from the matrix success rate
+MIN_RELIABILITY = 0.05   # floor, so a proxy that lost everything scores very badly instead of dividing by zero
+SAMPLE_FIELDS = ("Min_ms", "P50_ms", "P90_ms", "Jitter_ms", "Loss_pct")
+_META = ("Proxy", "Type", "Raw_IP")
+
+
+# --- SAMPLING ---
+def latency_stats(times, samples):
+    """Min / median / p90 / jitter (ms) of ``times`` and the share of ``samples`` lost, as result fields."""
+    stats = dict.fromkeys(SAMPLE_FIELDS)
+    stats['Loss_pct'] = round(100 * (samples - len(times)) / samples) if samples else 0
+    if not times: return stats
+    ordered = sorted(times)
+    stats['Min_ms'] = ordered[0]
+    stats['P50_ms'] = ordered[(len(ordered) - 1) // 2]
+    stats['P90_ms'] = ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+    # RFC 3550-style jitter: mean difference between consecutive samples
+    stats['Jitter_ms'] = round(sum(abs(a - b) for a, b in zip(times, times[1:])) / (len(times) - 1)) if len(times) > 1 else 0
+    return stats
+
+
+async def sample_latency(res, url, samples=SAMPLES, timeout=5, headers=None, session=None):
+    """Time ``samples`` requests for ``url`` through the live proxy in ``res``; adds :data:`SAMPLE_FIELDS` to it.
+
+    One untimed warm-up request opens the connection and runs the handshake;
+    the timed ones reuse it, so the numbers are round trips through the proxy
+    rather than connection setup. A non-200 answer counts as a lost sample;
+    a network error or timeout ends the run and the rest count as lost too.
+    A given ``session`` is used (warm-up included) and left open for its owner.
+    """
+    own = session is None
+    if own: session = ProxySession((res['Protocol'].lower(), res['IP'], res['Port']), headers)
+    times = []
+    try:
+        status, _, _ = await asyncio.wait_for(session.get(url), timeout)
+        for _ in range(samples if status == 200 else 0):
+            started = time.perf_counter()
+            status, _, _ = await asyncio.wait_for(session.get(url), timeout)
+            if status == 200: times.append(round((time.perf_counter() - started) * 1000))
+    except NET_ERRORS:
+        pass
+    finally:
+        if own: session.close()
+    res.update(latency_stats(times, samples))
+    return res
+
+
+# --- SCORING ---
+def granted(row):
+    """The targets a matrix row reached (``ACCESS_GRANTED``)."""
+    return [k for k, v in row.items() if k not in _META and v == "ACCESS_GRANTED"]
+
+
+def matrix_rate(row):
+    """Share of a row's answered targets that were granted (``SKIPPED`` ones don't count); None without any."""
+    codes = [v for k, v in row.items() if k not in _META and v != "SKIPPED"]
+    return sum(v == "ACCESS_GRANTED" for v in codes) / len(codes) if codes else None
+
+
+def score(res, row=None):
+    """Composite score of a live proxy in effective milliseconds; lower is better.
+
+    The warm median (or the cold ``Latency`` without samples) plus the
+    jitter, divided by a reliability factor: the share of samples answered,
+    times a blend of 1 and the matrix success rate when ``row`` is given.
+    """
+    base = res.get('P50_ms')
+    if base is None: base = res['Latency']
+    base += JITTER_WEIGHT * (res.get('Jitter_ms') or 0)
+    reliability = 1 - (res.get('Loss_pct') or 0) / 100
+    rate = matrix_rate(row) if row else None
+    if rate is not None: reliability *= 1 - MATRIX_WEIGHT + MATRIX_WEIGHT * rate
+    return round(base / max(reliability, MIN_RELIABILITY), 1)
+
+
+# --- RANKED INDEX ---
+class ProxyRanking:
+    """Live proxies ordered by :func:`score`, overall and per target URL.
+
+    Each order is a sorted list of ``(score, address)`` kept with bisect:
+    finding a position is O(log n), and the insert itself is a memmove. A
+    heap would not do here: a proxy is re-scored when its matrix row lands,
+    which means removing its old entry, and a heap can't remove an entry or
+    read its best N without popping them. :meth:`top` is a slice.
+    """
+
+    def __init__(self, results=(), rows=()):
+        self._entries = {}   # address -> (score, result, granted targets)
+        self._order = []
+        self._targets = {}
+        self.extend(results, rows)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, addr):
+        return addr in self._entries
+
+    def add(self, res, row=None):
+        """Index (or re-score) a Phase 1 result; dead ones are dropped from the index."""
+        addr = res['Full_Address']
+        self.discard(addr)
+        if res['Status'] != "Working": return
+        key = (score(res, row), addr)
+        targets = granted(row) if row else []
+        self._entries[addr] = (key[0], res, targets)
+        insort(self._order, key)
+        for url in targets: insort(self._targets.setdefault(url, []), key)
+
+    def add_row(self, row):
+        """Re-score an indexed proxy from its matrix row; rows of unknown proxies are ignored."""
+        entry = self._entries.get(row['Raw_IP'])
+        if entry: self.add(entry[1], row)
+
+    def extend(self, results=(), rows=()):
+        for res in results: self.add(res)
+        for row in rows: self.add_row(row)
+        return self
+
+    def discard(self, addr):
+        entry = self._entries.pop(addr, None)
+        if entry is None: return
+        key = (entry[0], addr)
+        for order in [self._order] + [self._targets[url] for url in entry[2]]:
+            del order[bisect_left(order, key)]
+
+    def score_of(self, addr):
+        entry = self._entries.get(addr)
+        return entry[0] if entry else None
+
+    def top(self, n=10, target=None):
+        """The ``n`` best-scoring live results, best first; with ``target``, only proxies granted on it."""
+        order = self._order if target is None else self._targets.get(target, ())
+        return [self._entries[addr][1] for _, addr in order[:n]]
+
+    def targets(self):
+        return list(self._targets)
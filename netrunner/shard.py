@@ -0,0 +1,202 @@
+"""Sharded scans: the proxy list split across worker processes, results merged back.
+
+The list is partitioned by a consistent (jump) hash of ``ip:port`` into one
+spool file per shard; each worker process runs :func:`pipeline` over its
+spool and streams results back in batches. The parent is the merger: it
+runs the caller's callbacks, geo lookups and checkpointing exactly as a
+single-process scan would, and returns the same ``(results, matrix)``.
+
+The same hash backs ``python -m netrunner --shard K/N``, so N machines given
+the same list each scan a disjoint slice.
+"""
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import tempfile
+import time
+import traceback
+import zlib
+
+from .checkpoint import load_queue, queue_line, save_queue
+from .engine import (
+    CONNECT_TIMEOUT, DEFAULT_CONCURRENCY, JUDGE_URL, STOP_POLL, TARGET_TIMEOUT, _close_resolver, _open_resolver, pipeline,
+)
+from .judge import JudgePool
+from .metrics import ScanMetrics
+from .rank import score
+from .throttle import RateControl
+
+SHARD_BATCH = 500     # results per message from a worker
+SHARD_FLUSH = 0.2     # ... or whatever a worker has after this many seconds
+
+
+# --- PARTITIONING ---
+def jump_hash(key, buckets):
+    """Lamping & Veach jump consistent hash: going from N to N+1 buckets moves only 1/(N+1) of the keys."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_of(record, shards):
+    """The shard (``0 .. shards-1``) an ``(ip, port, protocol)`` record belongs to; stable across runs and machines."""
+    return jump_hash(zlib.crc32(f"{record[0]}:{record[1]}".encode()), shards)
+
+
+def partition(records, shards, directory):
+    """Spool ``records`` into one proxy-list file per shard; returns ``[(path, count), ...]``."""
+    paths = [os.path.join(directory, f"shard-{k}.txt") for k in range(shards)]
+    counts = [0] * shards
+    files = [open(p, "w", encoding="utf-8", buffering=1 << 20) for p in paths]
+    try:
+        for rec in records:
+            k = shard_of(rec, shards)
+            files[k].write(queue_line(rec))
+            counts[k] += 1
+    finally:
+        for fh in files: fh.close()
+    return list(zip(paths, counts))
+
+
+# --- WORKER PROCESS ---
+def _shard_main(spool, out, stop, remaining_path, kwargs):
+    # Entry point of a worker process (spawned, so it must stay importable and its args picklable).
+    # Ctrl-C reaches the whole process group; only the parent acts on it, via ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        metrics = ScanMetrics() if kwargs.pop("metrics") else None
+        stopped = asyncio.run(_shard_scan(spool, out, stop, remaining_path, kwargs, metrics))
+        out.put(("E", spool, stopped, None, metrics))
+    except BaseException:
+        out.put(("E", spool, False, traceback.format_exc(), None))
+
+
+async def _shard_scan(spool, out, stop, remaining_path, kwargs, metrics):
+    batch = ([], [])
+    stopped = []
+
+    def send():
+        if batch[0] or batch[1]:
+            out.put(("B", batch[0][:], batch[1][:]))
+            batch[0].clear()
+            batch[1].clear()
+
+    def on_result(res):
+        batch[0].append(res)
+        if len(batch[0]) >= SHARD_BATCH: send()
+
+    def on_stop(remaining):
+        save_queue(remaining, remaining_path)
+        stopped.append(True)
+
+    async def flusher():
+        while True:
+            await asyncio.sleep(SHARD_FLUSH)
+            send()
+
+    control = RateControl(**kwargs.pop("control"))
+    task = asyncio.ensure_future(flusher())
+    try:
+        await pipeline(load_queue(spool), on_result=on_result, on_row=batch[1].append, should_stop=stop.is_set,
+                       geo=False, on_stop=on_stop, control=control, metrics=metrics, keep=False, **kwargs)
+    finally:
+        task.cancel()
+        send()
+    return bool(stopped)
+
+
+# --- MERGER ---
+async def sharded_pipeline(proxies, target_urls, timeout, real_ip, workers=None, concurrency=DEFAULT_CONCURRENCY,
+                           target_timeout=TARGET_TIMEOUT, on_result=None, on_row=None, should_stop=None, judges=JUDGE_URL,
+                           geo=True, must_have=None, connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None,
+                           samples=0, keep=True):
+    """:func:`pipeline` fanned out over ``workers`` processes (default: one per core).
+
+    Same arguments and return value as :func:`pipeline`. ``concurrency`` (or
+    ``control``'s ceiling and rates) is divided between the workers. Geo
+    lookups and every callback run here in the parent, so callers (store,
+    checkpoint, UI) are unchanged. On a stop the workers abort their checks in
+    flight and ``on_stop`` gets every shard's unchecked proxies. Each worker's
+    stage timings are merged into ``metrics`` as it finishes.
+    """
+    shards = max(1, workers or os.cpu_count() or 1)
+    control = control or RateControl.fixed(concurrency)
+    judge_urls = judges.urls if isinstance(judges, JudgePool) else judges
+    kwargs = {"target_urls": target_urls, "timeout": timeout, "real_ip": real_ip, "target_timeout": target_timeout,
+              "judges": judge_urls, "must_have": must_have, "connect_timeout": connect_timeout, "control": control.split(shards),
+              "metrics": metrics is not None, "samples": samples}
+    ctx = multiprocessing.get_context("spawn")   # never fork a process that may be running threads (Streamlit)
+    loop = asyncio.get_running_loop()
+    resolver = _open_resolver(geo, metrics)
+    results, matrix = [], []
+    scoring = {}   # live results still waiting for their matrix row (a worker may ship a result before it is re-scored)
+    stopped = False
+    with tempfile.TemporaryDirectory(prefix="netrunner-shards-") as tmp:
+        out, stop = ctx.Queue(), ctx.Event()
+        procs = []
+        for spool, count in partition(proxies, shards, tmp):
+            if not count: continue
+            procs.append(ctx.Process(target=_shard_main, daemon=True,
+                                     args=(spool, out, stop, spool + ".remaining", dict(kwargs))))
+        try:
+            for p in procs: p.start()
+            live, errors = len(procs), []
+            while live:
+                if not stop.is_set() and should_stop and should_stop(): stop.set()
+                try:
+                    msg = await loop.run_in_executor(None, out.get, True, STOP_POLL)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs) and out.empty():
+                        raise RuntimeError("shard worker died without reporting")
+                    continue
+                if msg[0] == "B":
+                    for res in msg[1]:
+                        if keep: results.append(res)
+                        if on_result: on_result(res)
+                        if res['Status'] != "Working": continue
+                        if resolver: resolver.submit(res)
+                        if target_urls: scoring[res['Full_Address']] = res
+                    for row in msg[2]:
+                        res = scoring.pop(row['Raw_IP'], None)
+                        if res: res['Score'] = score(res, row)
+                        if keep: matrix.append(row)
+                        if on_row: on_row(row)
+                    await asyncio.sleep(0)   # let geo lookups run between batches
+                else:
+                    live -= 1
+                    stopped |= msg[2]
+                    if msg[3]: errors.append(msg[3])
+                    if msg[4] and metrics is not None: metrics.merge(msg[4])
+            if errors: raise RuntimeError("shard worker failed:\n" + errors[0])
+            if stopped and on_stop:
+                on_stop(itertools.chain.from_iterable(load_queue(path) for path in _remaining(tmp)))
+        finally:
+            stop.set()
+            deadline = time.monotonic() + 5
+            for p in procs:
+                p.join(max(0.0, deadline - time.monotonic()))
+                if p.is_alive(): p.terminate()
+            await _close_resolver(geo, resolver)
+    return results, matrix
+
+
+def _remaining(directory):
+    # Shards that were stopped left their unchecked proxies next to their spool, in shard order
+    names = sorted((n for n in os.listdir(directory) if n.endswith(".remaining")),
+                   key=lambda n: int(n.split("-")[1].split(".")[0]))
+    return [os.path.join(directory, n) for n in names]
+
+
+def run_sharded(proxies, target_urls, timeout, real_ip, workers=None, concurrency=DEFAULT_CONCURRENCY,
+                target_timeout=TARGET_TIMEOUT, on_result=None, on_row=None, should_stop=None, judges=JUDGE_URL, geo=True,
+                must_have=None, connect_timeout=CONNECT_TIMEOUT, on_stop=None, control=None, metrics=None, samples=0, keep=True):
+    """Blocking wrapper around :func:`sharded_pipeline`."""
+    return asyncio.run(sharded_pipeline(proxies, target_urls, timeout, real_ip, workers, concurrency, target_timeout,
+                                        on_result, on_row, should_stop, judges, geo, must_have, connect_timeout, on_stop, control,
+                                        metrics, samples, keep))
@@ -0,0 +1,161 @@
+import os
+import sqlite3
+import time
+
+from .config import DATA_DIR
+from .parser import ProxyRecord
+
+# --- CONSTANTS ---
+STORE_PATH = os.path.join(DATA_DIR, "health.sqlite")
+FRESH_SECS = 6 * 3600          # live proxies checked more recently than this are skipped
+BACKOFF_BASE = 3600            # first re-check delay for a dead proxy
+BACKOFF_MAX = 14 * 86400       # cap for the exponential dead-node backoff
+HISTORY_KEEP = 30 * 86400     # latency_history rows older than this are pruned on close
+_CHUNK = 500                   # sqlite host-parameter batch size
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS proxies (
+    addr TEXT PRIMARY KEY, ip TEXT, port TEXT, protocol TEXT,
+    status TEXT, latency INTEGER, anonymity TEXT, country TEXT, isp TEXT,
+    last_checked REAL, last_alive REAL, fail_streak INTEGER DEFAULT 0, next_check REAL
+);
+CREATE INDEX IF NOT EXISTS proxies_rank ON proxies(status, latency);
+CREATE TABLE IF NOT EXISTS latency_history (addr TEXT, ts REAL, latency INTEGER);
+CREATE INDEX IF NOT EXISTS latency_history_addr ON latency_history(addr, ts);
+CREATE TABLE IF NOT EXISTS matrix (addr TEXT, target TEXT, code TEXT, ts REAL, PRIMARY KEY (addr, target));
+"""
+
+
+class HealthStore:
+    """Persistent per-proxy health: last status, latency history and target-matrix outcomes.
+
+    Writes are buffered and committed in batches (``flush``) so recording every
+    result of a scan costs a list append, not a transaction.
+    """
+
+    def __init__(self, path=STORE_PATH, batch=1000):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+        self._batch = batch
+        self._results = []
+        self._rows = []
+
+    # --- WRITES ---
+    def record(self, result):
+        self._results.append(result)
+        if len(self._results) >= self._batch: self.flush()
+
+    def record_row(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self._batch: self.flush()
+
+    def flush(self):
+        if not self._results and not self._rows: return
+        now = time.time()
+        results, self._results = self._results, []
+        rows, self._rows = self._rows, []
+        with self._db:
+            alive = [r for r in results if r['Status'] == "Working"]
+            dead = [r for r in results if r['Status'] != "Working"]
+            self._db.executemany(
+                """INSERT INTO proxies (addr, ip, port, protocol, status, latency, anonymity, country, isp,
+                                        last_checked, last_alive, fail_streak, next_check)
+                   VALUES (?, ?, ?, ?, 'Working', ?, ?, ?, ?, ?, ?, 0, NULL)
+                   ON CONFLICT(addr) DO UPDATE SET protocol=excluded.protocol, status='Working',
+                       latency=excluded.latency, anonymity=excluded.anonymity, country=excluded.country,
+                       isp=excluded.isp, last_checked=excluded.last_checked, last_alive=excluded.last_alive,
+                       fail_streak=0, next_check=NULL""",
+                [(r['Full_Address'], r['IP'], r['Port'], r['Protocol'].lower(), r['Latency'], r['Anonymity'],
+                  r['Country'], r['ISP'], now, now) for r in alive])
+            # Dead nodes back off exponentially: base * 2^streak, capped
+            self._db.executemany(
+                """INSERT INTO proxies (addr, ip, port, protocol, status, latency, last_checked, fail_streak, next_check)
+                   VALUES (?, ?, ?, ?, 'Dead', NULL, ?, 1, ?)
+                   ON CONFLICT(addr) DO UPDATE SET protocol=excluded.protocol, status='Dead',
+                       last_checked=excluded.last_checked, fail_streak=fail_streak + 1,
+                       next_check=excluded.last_checked + MIN(?, ? * (1 << MIN(fail_streak, 20)))""",
+                [(r['Full_Address'], r['IP'], r['Port'], r['Protocol'].lower(), now, now + BACKOFF_BASE,
+                  BACKOFF_MAX, BACKOFF_BASE) for r in dead])
+            self._db.executemany("INSERT INTO latency_history (addr, ts, latency) VALUES (?, ?, ?)",
+                                 [(r['Full_Address'], now, r['Latency']) for r in alive])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO matrix (addr, target, code, ts) VALUES (?, ?, ?, ?)",
+                [(row['Raw_IP'], k, v, now) for row in rows for k, v in row.items() if k not in ("Proxy", "Type", "Raw_IP")])
+
+    def prune(self, keep=HISTORY_KEEP):
+        with self._db:
+            self._db.execute("DELETE FROM latency_history WHERE ts < ?", (time.time() - keep,))
+
+    def close(self):
+        self.flush()
+        self.prune()
+        self._db.close()
+
+    # --- READS ---
+    def _lookup(self, addrs):
+        found = {}
+        for i in range(0, len(addrs), _CHUNK):
+            chunk = addrs[i:i + _CHUNK]
+            q = ",".join("?" * len(chunk))
+            for row in self._db.execute(
+                    f"SELECT addr, status, latency, last_checked, next_check FROM proxies WHERE addr IN ({q})", chunk):
+                found[row[0]] = row[1:]
+        return found
+
+    def plan(self, records, fresh_secs=FRESH_SECS, now=None):
+        """Split ``records`` into ``(due, skipped)`` for an incremental re-scan.
+
+        ``due`` is ordered: previously-live proxies fastest first, then never-seen
+        ones, then dead ones whose backoff has expired. ``skipped`` holds live
+        proxies checked within ``fresh_secs`` and dead ones still backing off.
+        """
+        now = now or time.time()
+        records = list(records)
+        known = self._lookup([f"{r.ip}:{r.port}" for r in records])
+        live, new, dead, skipped = [], [], [], []
+        for rec in records:
+            state = known.get(f"{rec.ip}:{rec.port}")
+            if state is None:
+                new.append(rec)
+                continue
+            status, latency, last_checked, next_check = state
+            if status == "Working":
+                if now - last_checked < fresh_secs: skipped.append(rec)
+                else: live.append((latency, rec))
+            elif next_check is not None and next_check > now:
+                skipped.append(rec)
+            else:
+                dead.append(rec)
+        live.sort(key=lambda x: x[0])
+        return [rec for _, rec in live] + new + dead, skipped
+
+    def cached_results(self, records):
+        """Rebuild Phase 1 result dicts and matrix rows for live ``records`` from the store."""
+        addrs = [f"{r.ip}:{r.port}" for r in records]
+        results, matrix = [], {}
+        for i in range(0, len(addrs), _CHUNK):
+            chunk = addrs[i:i + _CHUNK]
+            q = ",".join("?" * len(chunk))
+            for addr, ip, port, proto, latency, anon, country, isp in self._db.execute(
+                    f"""SELECT addr, ip, port, protocol, latency, anonymity, country, isp FROM proxies
+                        WHERE status = 'Working' AND addr IN ({q})""", chunk):
+                results.append({
+                    "IP": ip, "Port": port, "Protocol": proto.upper(),
+                    "Country": country, "ISP": isp, "Latency": latency, "Status": "Working",
+                    "Full_Address": addr, "Anonymity": anon,
+                    "Connect_ms": None, "Handshake_ms": None, "Reason": "", "Detected": ""
+                })
+                matrix[addr] = {"Proxy": addr, "Type": proto.upper(), "Raw_IP": addr}
+            for addr, target, code in self._db.execute(
+                    f"SELECT addr, target, code FROM matrix WHERE addr IN ({q})", chunk):
+                if addr in matrix: matrix[addr][target] = code
+        return results, list(matrix.values())
+
+    def history(self, alive_only=False):
+        """Every stored proxy as a :class:`ProxyRecord`, streamed off the cursor (live ones first)."""
+        where = "WHERE status = 'Working'" if alive_only else ""
+        for ip, port, proto in self._db.execute(
+                f"SELECT ip, port, protocol FROM proxies {where} ORDER BY status DESC, latency"):
+            yield ProxyRecord(ip, port, proto or "auto")
@@ -0,0 +1,262 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+
+# --- CONSTANTS ---
+AIMD_MIN = 20            # adaptive concurrency never drops below this (or the ceiling, if lower)
+AIMD_WINDOW = 50         # fewest outcomes per adjustment; the window grows with the limit (~one "round trip")
+AIMD_BACKOFF = 0.7       # multiplicative decrease on a congested window
+AIMD_TOLERANCE = 0.15    # timeout ratio this far above its baseline counts as congestion
+LATENCY_SLACK = 2.0      # ... and so does a median latency this many times its baseline (+ LATENCY_FLOOR_MS)
+LATENCY_FLOOR_MS = 20
+BASELINE_DRIFT = 0.25    # how fast a baseline follows a persistently worse level (a dead stretch of the list)
+TARGET_RATE = 0          # requests/s per target host in the matrix phase (0 = unpaced; opt in for a throttling target)
+SUBNET_RATE = 50.0       # Phase 1 checks/s started per proxy /24
+BUCKETS_KEEP = 65536     # idle buckets beyond this are forgotten (a full bucket carries no state)
+
+
+# --- TOKEN BUCKETS ---
+class TokenBucket:
+    """``rate`` tokens per second, up to ``burst`` banked.
+
+    A token is reserved the moment it is asked for (the balance may go
+    negative), so concurrent callers are served in order, each sleeping
+    exactly as long as its place in the queue needs.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self.tokens = self.burst
+        self._clock = clock
+        self._stamp = clock()
+
+    def reserve(self):
+        """Take a token; return how many seconds to wait before using it."""
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._stamp) * self.rate) - 1
+        self._stamp = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self):
+        wait = self.reserve()
+        if wait: await asyncio.sleep(wait)
+
+
+class BucketMap:
+    """One :class:`TokenBucket` per key (target host, proxy subnet), kept LRU-bounded."""
+
+    def __init__(self, rate, burst=None, size=BUCKETS_KEEP):
+        self.rate, self.burst, self.size = rate, burst, size
+        self._buckets = OrderedDict()
+
+    def bucket(self, key):
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.size: self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return b
+
+    async def acquire(self, key):
+        await self.bucket(key).acquire()
+
+
+def subnet_key(ip):
+    """The /24 an IPv4 address belongs to (``"10.1.2"``); anything else is its own key."""
+    head, dot, tail = ip.rpartition(".")
+    return head if dot and tail.isdigit() else ip
+
+
+def host_key(url):
+    return urlsplit(url).netloc or url
+
+
+# --- ADAPTIVE CONCURRENCY ---
+class _Signal:
+    # Timeout ratio and median latency of one kind of outcome, against slowly-adapting baselines
+    def __init__(self):
+        self.count = self.timeouts = 0
+        self.latencies = []
+        self.ratio_base = self.latency_base = None
+
+    def add(self, timed_out, latency):
+        self.count += 1
+        self.timeouts += timed_out
+        if latency is not None: self.latencies.append(latency)
+
+    def close(self):
+        """Score the window and reset it; True if it looked congested."""
+        ratio = self.timeouts / self.count
+        latency = sorted(self.latencies)[len(self.latencies) // 2] if self.latencies else None
+        self.count = self.timeouts = 0
+        self.latencies = []
+        congested = self.ratio_base is not None and ratio > self.ratio_base + AIMD_TOLERANCE
+        if latency is not None and self.latency_base is not None:
+            congested |= latency > self.latency_base * LATENCY_SLACK + LATENCY_FLOOR_MS
+        self.ratio_base = _follow(self.ratio_base, ratio)
+        if latency is not None: self.latency_base = _follow(self.latency_base, latency)
+        return congested
+
+
+def _follow(base, value):
+    # Drop straight to a better level; creep towards a worse one
+    if base is None or value < base: return value
+    return base + (value - base) * BASELINE_DRIFT
+
+
+class AdaptiveLimit:
+    """A resizable semaphore whose size is tuned AIMD-style from reported outcomes.
+
+    Starts at a quarter of ``maximum`` and doubles every clean window (slow
+    start) until the first congested one, then grows by ``step`` per clean
+    window and shrinks by ``AIMD_BACKOFF`` per congested one, within
+    ``[minimum, maximum]``. A window
+    is congested when its timeout ratio or median latency climbs clearly above
+    the baseline seen so far; after a decrease one window is skipped, since
+    it was still measured at the old limit.
+    """
+
+    def __init__(self, maximum, minimum=AIMD_MIN, step=None):
+        self.maximum = max(1, int(maximum))
+        self.minimum = max(1, min(int(minimum), self.maximum))
+        self.step = step or max(1, self.maximum // 50)
+        self.limit = max(self.minimum, self.maximum // 4)
+        self.active = 0
+        self.decreases = 0
+        self._slow_start = True
+        self._skip = False
+        self._signals = {}
+        self._seen = 0
+        self._waiters = deque()
+
+    # --- SEMAPHORE ---
+    async def acquire(self):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled(): self._wake()   # pass the wake-up on
+                raise
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    async def __aenter__(self):
+        await self.acquire()
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    # --- CONTROL ---
+    def report(self, timed_out, latency=None, kind="check"):
+        """Feed one outcome: did it time out, and how long did the healthy part take (ms)."""
+        signal = self._signals.get(kind)
+        if signal is None: signal = self._signals[kind] = _Signal()
+        signal.add(timed_out, latency)
+        self._seen += 1
+        if self._seen < max(AIMD_WINDOW, self.limit // 2): return
+        self._seen = 0
+        # Every kind with enough samples gets scored; the rest keep accumulating
+        congested = False
+        for sig in self._signals.values():
+            if sig.count >= AIMD_WINDOW // 2: congested |= sig.close()
+        if self._skip:
+            self._skip = False
+        elif congested:
+            self._slow_start = False
+            self._skip = True
+            self.decreases += 1
+            self.limit = max(self.minimum, int(self.limit * AIMD_BACKOFF))
+        else:
+            self.limit = min(self.maximum, self.limit * 2 if self._slow_start else self.limit + self.step)
+            self._wake()
+
+
+class _Unlimited:
+    # Stand-in for AdaptiveLimit when concurrency is fixed: the worker count is the limit
+    limit = None
+
+    async def __aenter__(self):
+        pass
+
+    async def __aexit__(self, *exc):
+        pass
+
+    def report(self, timed_out, latency=None, kind="check"):
+        pass
+
+
+TIMEOUT_REASONS = ("CONNECT_TIMEOUT", "HANDSHAKE_TIMEOUT", "HTTP_TIMEOUT")
+
+
+class RateControl:
+    """Concurrency and request-rate policy for one scan.
+
+    ``concurrency`` is the worker count; with ``adaptive`` it is the ceiling
+    of an :class:`AdaptiveLimit` fed by Phase 1 timeouts / connect times and
+    matrix-row timeouts. ``target_rate`` caps requests per second to each
+    target host and ``subnet_rate`` caps Phase 1 checks per second into each
+    proxy /24 (``None``/0 switches either off). Rate waits happen before a
+    concurrency slot is taken and outside every timeout, so throttling can
+    slow a scan down but never turns into a false TIMEOUT.
+    """
+
+    def __init__(self, concurrency, adaptive=True, minimum=AIMD_MIN, target_rate=TARGET_RATE, subnet_rate=SUBNET_RATE):
+        self.workers = max(1, int(concurrency))
+        self.adaptive, self.minimum = adaptive, minimum
+        self.target_rate, self.subnet_rate = target_rate, subnet_rate
+        self.slots = AdaptiveLimit(self.workers, minimum) if adaptive else _Unlimited()
+        self.targets = BucketMap(target_rate) if target_rate else None
+        self.subnets = BucketMap(subnet_rate) if subnet_rate else None
+
+    @classmethod
+    def fixed(cls, concurrency):
+        """Plain fixed-size worker pool, no rate limits (the engine default)."""
+        return cls(concurrency, adaptive=False, target_rate=None, subnet_rate=None)
+
+    def split(self, shards):
+        """Constructor kwargs for one of ``shards`` processes sharing this policy (ceilings and rates divided)."""
+        return {"concurrency": max(1, self.workers // shards), "adaptive": self.adaptive,
+                "minimum": max(1, self.minimum // shards),
+                "target_rate": self.target_rate / shards if self.target_rate else None,
+                "subnet_rate": self.subnet_rate / shards if self.subnet_rate else None}
+
+    @property
+    def concurrency(self):
+        """Checks currently allowed in flight."""
+        return self.slots.limit or self.workers
+
+    async def subnet(self, ip):
+        if self.subnets: await self.subnets.acquire(subnet_key(ip))
+
+    async def target(self, url):
+        if self.targets: await self.targets.acquire(host_key(url))
+
+    async def row(self, urls):
+        """Pace a whole matrix row up front: one token per target, reserved together, one sleep for the slowest."""
+        if not self.targets: return
+        wait = max([self.targets.bucket(host_key(url)).reserve() for url in urls], default=0.0)
+        if wait: await asyncio.sleep(wait)
+
+    def report(self, res):
+        """Feed a Phase 1 result to the adaptive limit."""
+        self.slots.report(res['Reason'] in TIMEOUT_REASONS, res['Connect_ms'])
+
+    def report_row(self, row):
+        """Feed a matrix row: any target TIMEOUT counts against it."""
+        self.slots.report(any(v == "TIMEOUT" for k, v in row.items() if k not in ("Proxy", "Type", "Raw_IP")), kind="matrix")
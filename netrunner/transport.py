@@ -0,0 +1,268 @@
+import asyncio
+import ipaddress
+import socket
+import ssl
+import struct
+from urllib.parse import urlsplit
+
+MAX_BODY = 256 * 1024
+
+
+class ProxyError(Exception):
+    """Raised when a proxy refuses or garbles a tunnel/handshake."""
+
+
+class TunnelRefused(ProxyError):
+    """A well-formed refusal of one destination: the proxy works, the target didn't (unreachable, denied)."""
+
+
+def _split_url(url):
+    parts = urlsplit(url)
+    secure = parts.scheme == "https"
+    host = parts.hostname or ""
+    port = parts.port or (443 if secure else 80)
+    path = parts.path or "/"
+    if parts.query: path += "?" + parts.query
+    return secure, host, port, path
+
+
+async def _socks4_handshake(reader, writer, host, port):
+    # SOCKS4 needs a literal IPv4, so resolve locally like requests' socks4:// does
+    try:
+        packed = ipaddress.IPv4Address(host).packed
+    except ValueError:
+        info = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET)
+        packed = ipaddress.IPv4Address(info[0][4][0]).packed
+    writer.write(b"\x04\x01" + struct.pack("!H", port) + packed + b"\x00")
+    await writer.drain()
+    reply = await reader.readexactly(8)
+    if reply[1] != 0x5A:
+        raise (TunnelRefused if reply[0] == 0 and 0x5B <= reply[1] <= 0x5D else ProxyError)(f"SOCKS4 rejected (0x{reply[1]:02x})")
+
+
+async def _socks5_handshake(reader, writer, host, port):
+    writer.write(b"\x05\x01\x00")
+    await writer.drain()
+    greeting = await reader.readexactly(2)
+    if greeting[0] != 0x05 or greeting[1] != 0x00:
+        raise ProxyError("SOCKS5 auth refused")
+    name = host.encode("idna")
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(name)]) + name + struct.pack("!H", port))
+    await writer.drain()
+    reply = await reader.readexactly(4)
+    if reply[1] != 0x00:
+        raise (TunnelRefused if reply[0] == 0x05 and reply[1] <= 0x08 else ProxyError)(f"SOCKS5 rejected (0x{reply[1]:02x})")
+    atyp = reply[3]
+    if atyp == 0x01: await reader.readexactly(4 + 2)
+    elif atyp == 0x04: await reader.readexactly(16 + 2)
+    elif atyp == 0x03: await reader.readexactly((await reader.readexactly(1))[0] + 2)
+    else: raise ProxyError("SOCKS5 bad address type")
+
+
+async def _http_connect(reader, writer, host, port):
+    writer.write(f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode())
+    await writer.drain()
+    status, _ = await read_head(reader)
+    if status != 200:
+        # 407: the proxy wants credentials for every destination, so that one is the proxy's failure
+        raise (ProxyError if status == 407 else TunnelRefused)(f"CONNECT refused ({status})")
+
+
+async def tunnel(reader, writer, protocol, host, port):
+    """Ask an already-connected proxy for a raw TCP tunnel to ``host:port`` (SOCKS4, SOCKS5 or HTTP CONNECT)."""
+    if protocol == "socks4":
+        await _socks4_handshake(reader, writer, host, port)
+    elif protocol == "socks5":
+        await _socks5_handshake(reader, writer, host, port)
+    else:
+        await _http_connect(reader, writer, host, port)
+
+
+async def open_tunnel(reader, writer, protocol, url):
+    """Run the proxy-side handshake for ``url`` over an already-connected proxy stream.
+
+    Returns ``absolute``: True when the caller should send absolute-form request
+    targets instead (plain HTTP through an HTTP proxy, which needs no handshake).
+    """
+    secure, host, port, _ = _split_url(url)
+    if protocol not in ("socks4", "socks5") and not secure: return True
+    await tunnel(reader, writer, protocol, host, port)
+    if secure:
+        await writer.start_tls(ssl.create_default_context(), server_hostname=host)
+    return False
+
+
+async def open_connection(url, proxy=None):
+    """Open a stream able to carry a plain HTTP request for ``url``.
+
+    ``proxy`` is ``(protocol, ip, port)`` or None for a direct connection.
+    Returns ``(reader, writer, absolute)`` where ``absolute`` tells the caller to
+    use absolute-form request targets (plain HTTP through an HTTP proxy).
+    """
+    secure, host, port, _ = _split_url(url)
+    if proxy is None:
+        reader, writer = await asyncio.open_connection(host, port)
+        if secure:
+            await writer.start_tls(ssl.create_default_context(), server_hostname=host)
+        return reader, writer, False
+    protocol, p_ip, p_port = proxy
+    reader, writer = await asyncio.open_connection(p_ip, int(p_port))
+    try:
+        absolute = await open_tunnel(reader, writer, protocol, url)
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer, absolute
+
+
+async def read_head(reader):
+    """Read a response's status line and headers: ``(status, {lowercased name: value})``."""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        status = int(lines[0].split(" ", 2)[1])
+    except (IndexError, ValueError):
+        raise ProxyError("Malformed HTTP status line")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return status, headers
+
+
+def _reusable(status, headers):
+    # The stream can carry another request only if this response was fully framed
+    if headers.get("connection", "").lower() == "close": return False
+    if status in (204, 304): return True
+    if headers.get("transfer-encoding", "").lower() == "chunked": return True
+    length = headers.get("content-length")
+    return length is not None and length.isdigit() and int(length) <= MAX_BODY
+
+
+async def _read_body(reader, status, headers, limit=MAX_BODY):
+    if status in (204, 304) or 100 <= status < 200:
+        return b""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = bytearray()
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                return bytes(body)
+            chunk = await reader.readexactly(size)
+            if len(body) < limit: body += chunk[:limit - len(body)]
+            await reader.readexactly(2)
+    if "content-length" in headers:
+        return await reader.readexactly(min(int(headers["content-length"]), limit))
+    body = bytearray()
+    while len(body) < limit:
+        chunk = await reader.read(limit - len(body))
+        if not chunk: break
+        body += chunk
+    return bytes(body)
+
+
+async def http_request(reader, writer, url, absolute=False, headers=None, keep_alive=False, method="GET", body=None):
+    """Send a request for ``url`` over an open stream and return ``(status, headers, body)``."""
+    await send_request(writer, url, absolute, headers, keep_alive, method, body)
+    return await read_response(reader)
+
+
+async def send_request(writer, url, absolute=False, headers=None, keep_alive=False, method="GET", body=None):
+    """The sending half of :func:`http_request`."""
+    _, host, port, path = _split_url(url)
+    target = url if absolute else path
+    lines = [f"{method} {target} HTTP/1.1", f"Host: {host}" if port in (80, 443) else f"Host: {host}:{port}"]
+    for k, v in (headers or {}).items():
+        lines.append(f"{k}: {v}")
+    if body is not None:
+        lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + (body or b""))
+    await writer.drain()
+
+
+async def read_response(reader, head=None):
+    """The reading half of :func:`http_request`; ``head`` is a ``(status, headers)`` already read with :func:`read_head`."""
+    status, headers = head or await read_head(reader)
+    return status, headers, await _read_body(reader, status, headers)
+
+
+async def fetch(url, proxy=None, headers=None, method="GET", body=None):
+    """One-shot request (optionally through ``proxy``); closes the connection afterwards."""
+    reader, writer, absolute = await open_connection(url, proxy)
+    try:
+        return await http_request(reader, writer, url, absolute, headers, method=method, body=body)
+    finally:
+        writer.close()
+
+
+NET_ERRORS = (OSError, EOFError, asyncio.TimeoutError, asyncio.LimitOverrunError, ProxyError, ValueError)
+
+
+class ProxySession:
+    """Keep-alive connection pool bound to one proxy.
+
+    Plain-HTTP requests through an HTTP proxy share connections to the proxy
+    (absolute-form targets); SOCKS and CONNECT tunnels are pooled per
+    destination host, so repeat requests skip the TCP + handshake round trips.
+    Concurrent ``get`` calls each take their own connection; :meth:`park` hands
+    in one opened elsewhere (the Phase 1 judge connection).
+    """
+
+    def __init__(self, proxy=None, headers=None, max_idle=4):
+        self.proxy = proxy
+        self.headers = headers or {}
+        self.max_idle = max_idle
+        self.opened = 0
+        self._idle = {}
+
+    def _key(self, url):
+        secure, host, port, _ = _split_url(url)
+        if self.proxy is not None and self.proxy[0] not in ("socks4", "socks5") and not secure:
+            return ("proxy",)
+        return (secure, host, port)
+
+    async def get(self, url):
+        key = self._key(url)
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer, absolute = idle.pop()
+            if reader.at_eof() or writer.is_closing():
+                writer.close()
+                continue
+            try:
+                return await self._send(key, reader, writer, absolute, url)
+            except (OSError, EOFError, ProxyError):
+                # Server dropped the idle connection; fall through to a fresh one
+                writer.close()
+        reader, writer, absolute = await open_connection(url, self.proxy)
+        self.opened += 1
+        return await self._send(key, reader, writer, absolute, url)
+
+    async def _send(self, key, reader, writer, absolute, url):
+        try:
+            status, headers, body = await http_request(reader, writer, url, absolute, self.headers, keep_alive=True)
+        except BaseException:
+            writer.close()
+            raise
+        idle = self._idle.setdefault(key, [])
+        if _reusable(status, headers) and len(idle) < self.max_idle:
+            idle.append((reader, writer, absolute))
+        else:
+            writer.close()
+        return status, headers, body
+
+    def park(self, url, reader, writer, absolute, status, headers):
+        """Keep a connection that just finished a ``(status, headers)`` response for ``url``; False if it can't be reused."""
+        idle = self._idle.setdefault(self._key(url), [])
+        if not _reusable(status, headers) or len(idle) >= self.max_idle: return False
+        idle.append((reader, writer, absolute))
+        return True
+
+    def close(self):
+        """Close the idle connections (ones in use are closed when their request ends)."""
+        for conns in self._idle.values():
+            for _, writer, _ in conns: writer.close()
+        self._idle.clear()
@@ -0,0 +1,139 @@
+"""Memoized pandas views over a finished scan, for the Streamlit front-end.
+
+Needs numpy/pandas, so unlike the rest of the package it is not re-exported
+from ``netrunner``; import it as ``netrunner.views``.
+"""
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from .columns import ResultTable, with_addresses
+from .export import CHUNK_ROWS
+from .rank import ProxyRanking
+
+ALL_ISPS = "ALL_NETWORKS"
+MEMO_SIZE = 64   # filter/figure/export entries kept per scan (slider drags mint a new key per step)
+
+
+class ResultViews:
+    """Derived frames for one scan ``version``, built on first use and then reused.
+
+    Live nodes are kept sorted by latency (the warm median ``P50_ms`` where
+    the scan sampled it, the single cold ``Latency`` otherwise) with a per-ISP
+    index of row positions, so a latency/ISP filter is two binary searches and
+    a slice instead of a boolean mask over the whole frame. Anything else a rerun would rebuild
+    (styled matrix, figures, exports) goes through :meth:`memo`.
+    """
+
+    def __init__(self, table, matrix, version):
+        self.table = table
+        self.matrix_table = matrix
+        self.version = version
+        self._memo = OrderedDict()
+
+    # --- BASE FRAMES ---
+    @cached_property
+    def frame(self):
+        return self.table.frame()
+
+    @cached_property
+    def ok(self):
+        df = self.frame
+        if df.empty: return pd.DataFrame()
+        live = df[df['Status'] == "Working"]
+        live = live.iloc[np.argsort(self._latency_of(live), kind="stable")]
+        return with_addresses(live).reset_index(drop=True)
+
+    @staticmethod
+    def _latency_of(df):
+        return (df['P50_ms'].fillna(df['Latency']) if 'P50_ms' in df else df['Latency']).to_numpy()
+
+    @cached_property
+    def dead(self):
+        df = self.frame
+        if df.empty: return pd.DataFrame()
+        return with_addresses(df[df['Status'] != "Working"]).reset_index(drop=True)
+
+    @cached_property
+    def matrix(self):
+        return self.matrix_table.frame()
+
+    @cached_property
+    def ranking(self):
+        """A :class:`ProxyRanking` of the live nodes, for best-N queries per target."""
+        return ProxyRanking(iter_records(self.ok), self.matrix_table.records())
+
+    # --- INDEXES ---
+    @cached_property
+    def latency(self):
+        """The latency each live node is filtered and sorted by, in ``ok`` order."""
+        return self._latency_of(self.ok) if not self.ok.empty else np.empty(0, dtype=np.float32)
+
+    @cached_property
+    def _isp_rows(self):
+        if self.ok.empty: return {}
+        return {isp: np.asarray(rows) for isp, rows in self.ok.groupby("ISP", observed=True).indices.items()}
+
+    @cached_property
+    def isps(self):
+        return sorted(self._isp_rows)
+
+    def isps_within(self, max_latency):
+        """ISPs with at least one live node at or under ``max_latency``."""
+        n = int(np.searchsorted(self.latency, max_latency, side="right"))
+        return [isp for isp in self.isps if self._isp_rows[isp][0] < n]
+
+    # --- FILTERS ---
+    def filter(self, max_latency, isp=ALL_ISPS):
+        """Live nodes at or under ``max_latency`` (see :attr:`latency`) and on ``isp``, fastest first."""
+        return self.memo(("filter", max_latency, isp), lambda: self._filter(max_latency, isp))
+
+    def _filter(self, max_latency, isp):
+        n = int(np.searchsorted(self.latency, max_latency, side="right"))
+        if isp == ALL_ISPS: return self.ok.iloc[:n]
+        rows = self._isp_rows.get(isp, np.empty(0, dtype=np.intp))
+        return self.ok.iloc[rows[:np.searchsorted(rows, n)]]
+
+    def matrix_for(self, max_latency):
+        """Matrix rows for the live nodes passing the latency filter."""
+        def build():
+            addrs = self.filter(max_latency)['Full_Address']
+            return self.matrix[self.matrix['Raw_IP'].isin(addrs)]
+        return self.memo(("matrix", max_latency), build)
+
+    def memo(self, key, build):
+        """Return the cached value for ``key``, calling ``build()`` the first time."""
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        value = self._memo[key] = build()
+        if len(self._memo) > MEMO_SIZE: self._memo.popitem(last=False)
+        return value
+
+
+def views_for(state, version):
+    """The :class:`ResultViews` for ``version`` kept in ``state`` (e.g. ``st.session_state``)."""
+    views = state.get("views")
+    if views is None or views.version != version:
+        views = state["views"] = ResultViews(state["results"], state["ftp_results"], version)
+    return views
+
+
+def iter_records(df, size=CHUNK_ROWS):
+    """Yield ``df``'s rows as dicts a chunk at a time (NaN -> None), for the streamed exporters.
+
+    The float32 timing/score columns come back rounded as :meth:`ResultTable.row` does
+    (``11`` rather than ``11.0``, ``Score`` 12.3 rather than 12.300000190734863).
+    """
+    numeric = [name for name in ResultTable.FLOATS + ResultTable.OPTIONAL if name in df.columns]
+    for start in range(0, len(df), size):
+        chunk = df.iloc[start:start + size]
+        chunk = chunk.assign(**{name: _rounded(chunk[name], ResultTable.DECIMALS.get(name)) for name in numeric}).astype(object)
+        yield from chunk.where(chunk.notna(), None).to_dict("records")
+
+
+def _rounded(col, decimals):
+    col = col.astype("float64")
+    return col.round().astype("Int64") if decimals is None else col.round(decimals)